@@ -378,10 +378,13 @@ async function getEvents(category = null) {
         }
         
         const data = await response.json();
-        console.log(`Successfully fetched ${data.length || 0} events`);
-        
+
+        // The listing is paginated: {events: [...], next_cursor: "..."}
+        const events = Array.isArray(data) ? data : (data.events || []);
+        console.log(`Successfully fetched ${events.length} events`);
+
         // Format and normalize the data
-        const formattedEvents = Array.isArray(data) ? data.map(formatEventData) : [];
+        const formattedEvents = events.map(formatEventData);
         
         return formattedEvents;
     } catch (error) {
@@ -769,6 +772,94 @@ async function uploadFile(file) {
     }
 }
 
+// Resized copy of an uploaded image, for thumbnails; other URLs are returned unchanged
+function imageVariantUrl(url, width) {
+    const match = typeof url === 'string' && url.match(/^(?:\/api)?\/uploads\/([^\/?#]+)$/);
+    if (!match) {
+        return url;
+    }
+    return `${API_BASE_URL}/uploads/${match[1]}?w=${width}`;
+}
+
+// While an event stream is unavailable, poll at this interval and retry the stream after a while
+const STREAM_POLL_INTERVAL = 10000;
+const STREAM_REOPEN_DELAY = 60000;
+
+// Live updates for one event (or every event when eventId is null) over a single
+// Server-Sent Events connection; the browser reconnects by itself. When the server
+// refuses the stream (503 once a process holds its maximum) or the browser has no
+// EventSource, the tallies are polled instead, and onPoll is called so the caller
+// can refresh anything else it shows. Returns a watcher; call close() to stop.
+function watchEvent(eventId, { onTallies, onPrediction, onPoll } = {}) {
+    const watcher = { source: null, pollTimer: null, reopenTimer: null, closed: false };
+    const path = eventId ? `events/${eventId}/stream` : 'events/stream';
+
+    const poll = async () => {
+        if (eventId && onTallies) {
+            try {
+                const response = await fetch(`${API_BASE_URL}/events/${eventId}/tallies`);
+                if (response.ok) {
+                    onTallies(await response.json());
+                }
+            } catch (error) {
+                console.error('Error polling event tallies:', error);
+            }
+        }
+        if (onPoll) {
+            onPoll();
+        }
+    };
+
+    const startPolling = () => {
+        if (watcher.closed || watcher.pollTimer) {
+            return;
+        }
+        watcher.pollTimer = setInterval(poll, STREAM_POLL_INTERVAL);
+        poll();
+        if (window.EventSource) {
+            watcher.reopenTimer = setTimeout(open, STREAM_REOPEN_DELAY);
+        }
+    };
+
+    const open = () => {
+        clearInterval(watcher.pollTimer);
+        watcher.pollTimer = null;
+        if (watcher.closed) {
+            return;
+        }
+        const source = new EventSource(`${API_BASE_URL}/${path}`);
+        if (onTallies) {
+            source.addEventListener('tallies', (e) => onTallies(JSON.parse(e.data)));
+        }
+        if (onPrediction) {
+            source.addEventListener('prediction', (e) => onPrediction(JSON.parse(e.data)));
+        }
+        // An error response closes the EventSource for good instead of reconnecting
+        source.addEventListener('error', () => {
+            if (source.readyState === EventSource.CLOSED) {
+                startPolling();
+            }
+        });
+        watcher.source = source;
+    };
+
+    watcher.close = () => {
+        watcher.closed = true;
+        clearInterval(watcher.pollTimer);
+        clearTimeout(watcher.reopenTimer);
+        if (watcher.source) {
+            watcher.source.close();
+        }
+    };
+
+    if (window.EventSource) {
+        open();
+    } else {
+        startPolling();
+    }
+    return watcher;
+}
+
 // Settings functions
 async function getUserSettings() {
     try {
@@ -883,6 +974,7 @@ window.PredictMeAPI = {
     logout,
     getEvents,
     getEventById,
+    watchEvent,
     createEvent,
     createEventDirect,
     createPrediction,
@@ -890,6 +982,7 @@ window.PredictMeAPI = {
     getUserProfile,
     updateUserProfile,
     uploadFile,
+    imageVariantUrl,
     getUserSettings,
     updateUserSettings,
     createSupportTicket,
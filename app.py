@@ -5,13 +5,16 @@ import os
 from dotenv import load_dotenv
 
 from routes_supabase import api
-from supabase_client import get_supabase_client
+from compression import init_compression
+from request_metrics import init_request_metrics
+from upload_storage import init_upload_storage
+from static_assets import load_static_build
+from notifications import init_notifications
 
 # Load environment variables
 load_dotenv()
 
-# Initialize Supabase client
-supabase = get_supabase_client()
+# Supabase clients are created lazily in each worker process (see supabase_client.py)
 
 app = Flask(__name__, static_folder='HTML')
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'dev_secret_key')
@@ -22,17 +25,33 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 # Initialize extensions
 CORS(app)
+init_compression(app)
+init_request_metrics(app)
+init_upload_storage(app)
+init_notifications(app)
 
 # Register blueprints
 app.register_blueprint(api)
 
+# Optionally serve selected routes with their asyncio-based implementations
+if os.getenv('ASYNC_ROUTES') == '1':
+    from routes_supabase_async import install_async_routes
+    install_async_routes(app)
+
+# Serve the fingerprinted, precompressed build when one exists and is current (python build_static.py)
+static_build = load_static_build(app.root_path, app.static_folder)
+
 # Routes for serving HTML files
 @app.route('/')
 def index():
+    if static_build:
+        return static_build.serve('events.html')
     return send_from_directory(app.static_folder, 'events.html')
 
 @app.route('/<path:path>')
 def static_files(path):
+    if static_build:
+        return static_build.serve(path)
     return send_from_directory(app.static_folder, path)
 
 # Run the application
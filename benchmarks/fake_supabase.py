@@ -0,0 +1,576 @@
+"""A local stand-in for the Supabase REST (PostgREST) and Auth APIs
+
+Implements just enough of PostgREST for the queries this backend makes:
+select with eq/neq/gt/gte/lt/lte/in/is filters, the "or" parameter used
+for keyset pagination, order, limit/offset and Prefer: count=exact;
+inserts and upserts (including resolution=ignore-duplicates) with
+unique-constraint violations reported as 409/23505; updates, deletes and
+the get_user_prediction_stats function. Auth covers admin user creation.
+
+Every request sleeps for the configured latency (plus random jitter)
+before it is answered, and is counted so a benchmark can report round
+trips per API request. Requests under /__bench/ control the fake itself
+and are neither delayed nor counted.
+"""
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qsl
+from urllib.request import Request, urlopen
+import json
+import multiprocessing
+import random
+import socket
+import threading
+import time
+import uuid
+
+# Unique constraints enforced per table (mirrors supabase_schema_fixed.sql)
+UNIQUE_KEYS = {
+    "user_profiles": [("id",), ("wallet_address",)],
+    "events": [("id",)],
+    "predictions": [("id",), ("event_id", "user_id")],
+    "settings": [("id",), ("user_id",)],
+    "auth_nonces": [("id",)],
+    "revoked_tokens": [("token_hash",)],
+}
+
+OPERATORS = {"eq", "neq", "gt", "gte", "lt", "lte", "in", "is"}
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _split_top_level(text):
+    """Split on commas that are not inside parentheses or double quotes"""
+    parts, depth, quoted, current = [], 0, False, []
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and depth == 0 and char == ",":
+            parts.append("".join(current))
+            current = []
+            continue
+        current.append(char)
+    if current:
+        parts.append("".join(current))
+    return parts
+
+
+def _unquote(value):
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1]
+    return value
+
+
+def _coerce(raw, actual):
+    """Convert a filter value to the type of the column value it is compared with"""
+    if isinstance(actual, bool):
+        return raw.lower() == "true"
+    if isinstance(actual, (int, float)):
+        try:
+            return type(actual)(raw)
+        except ValueError:
+            return raw
+    return raw
+
+
+def _compare(actual, op, raw):
+    if op == "is":
+        raw = raw.lower()
+        if raw == "null":
+            return actual is None
+        return actual is (raw == "true")
+    if op == "in":
+        values = [_unquote(v) for v in _split_top_level(raw.strip("()"))]
+        return actual is not None and str(actual) in values
+    if actual is None:
+        return False
+    value = _coerce(_unquote(raw), actual)
+    if not isinstance(actual, (bool, int, float)):
+        actual = str(actual)
+    if op == "eq":
+        return actual == value
+    if op == "neq":
+        return actual != value
+    if op == "gt":
+        return actual > value
+    if op == "gte":
+        return actual >= value
+    if op == "lt":
+        return actual < value
+    if op == "lte":
+        return actual <= value
+    raise ValueError(f"Unsupported operator: {op}")
+
+
+def _parse_condition(text):
+    """Parse "col.op.value" or "and(...)"/"or(...)" into a predicate"""
+    for group in ("and", "or"):
+        if text.startswith(group + "("):
+            conditions = [_parse_condition(part) for part in _split_top_level(text[len(group) + 1:-1])]
+            combine = all if group == "and" else any
+            return lambda row, conditions=conditions, combine=combine: combine(c(row) for c in conditions)
+    column, rest = text.split(".", 1)
+    return _parse_filter(column, rest)
+
+
+def _parse_filter(column, expression):
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    op, raw = expression.split(".", 1)
+    if op not in OPERATORS:
+        raise ValueError(f"Unsupported operator: {op}")
+
+    def predicate(row):
+        result = _compare(row.get(column), op, raw)
+        return not result if negate else result
+    return predicate
+
+
+def _sort_key(value):
+    # None sorts last in ascending order, like PostgreSQL's default
+    return (value is None, value if value is not None else "")
+
+
+class QueryParams(dict):
+    """Query string as a dict, keeping every pair so repeated filters on one column all apply"""
+
+    def __init__(self, pairs):
+        super().__init__(pairs)
+        self.pairs = list(pairs)
+
+
+class FakeSupabase:
+    """In-memory tables behind an HTTP server that speaks the Supabase wire format
+
+    Args:
+        latency (float): Seconds added to every response
+        jitter (float): Up to this many extra seconds, chosen uniformly at random
+        seed (int, optional): Seed for the jitter, for repeatable runs
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.tables = {}
+        self.auth_users = {}
+        self.round_trips = 0
+        self.round_trips_by_route = {}
+        self._address = None
+        self._server = None
+        self._thread = None
+        self._process = None
+
+    # Data
+
+    def seed(self, table, rows):
+        """Insert rows directly, bypassing latency and round-trip counting"""
+        with self._lock:
+            self.tables.setdefault(table, []).extend(dict(row) for row in rows)
+
+    def rows(self, table):
+        with self._lock:
+            return [dict(row) for row in self.tables.get(table, [])]
+
+    # Counters
+
+    def reset_counters(self):
+        with self._lock:
+            self.round_trips = 0
+            self.round_trips_by_route = {}
+
+    def _count(self, method, route):
+        key = f"{method} {route}"
+        with self._lock:
+            self.round_trips += 1
+            self.round_trips_by_route[key] = self.round_trips_by_route.get(key, 0) + 1
+
+    def _delay(self):
+        with self._lock:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    # Server lifecycle
+
+    @property
+    def url(self):
+        host, port = self._address
+        return f"http://{host}:{port}"
+
+    def _make_server(self, host, port):
+        fake = self
+
+        class Handler(SupabaseRequestHandler):
+            backend = fake
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        server.daemon_threads = True
+        self._address = server.server_address[:2]
+        return server
+
+    def start(self, host="127.0.0.1", port=0):
+        """Serve from a daemon thread in this process; returns the base URL"""
+        self._server = self._make_server(host, port)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-supabase", daemon=True)
+        self._thread.start()
+        return self.url
+
+    def start_process(self, host="127.0.0.1", port=0):
+        """Serve from a forked child process; returns the base URL
+
+        Keeps the fake from competing with the app under test for the
+        GIL. The child gets a copy of the tables as they are now, so seed
+        first; afterwards use the /__bench/ control routes (or
+        FakeSupabaseControl) to read counters and change the latency.
+        """
+        context = multiprocessing.get_context("fork")
+        receiver, sender = context.Pipe(duplex=False)
+        self._process = context.Process(target=self._serve_child, args=(host, port, sender), name="fake-supabase", daemon=True)
+        self._process.start()
+        self._address = receiver.recv()
+        return self.url
+
+    def _serve_child(self, host, port, sender):
+        server = self._make_server(host, port)
+        sender.send(self._address)
+        server.serve_forever()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._process = None
+
+    # Control routes
+
+    def control(self, route, body):
+        """Handle /__bench/<route>; returns (status, payload)"""
+        if route == "counters":
+            with self._lock:
+                return 200, {"round_trips": self.round_trips, "by_route": dict(self.round_trips_by_route)}
+        if route == "reset":
+            self.reset_counters()
+            return 200, {}
+        if route == "latency":
+            with self._lock:
+                self.latency = float(body.get("latency", self.latency))
+                self.jitter = float(body.get("jitter", self.jitter))
+            return 200, {"latency": self.latency, "jitter": self.jitter}
+        return 404, {"message": f"Unknown control route: {route}"}
+
+    # PostgREST
+
+    def select(self, table, params, prefer):
+        rows = self._filtered(table, params)
+        total = len(rows)
+        for column, descending in reversed(self._order(params)):
+            rows.sort(key=lambda row: _sort_key(row.get(column)), reverse=descending)
+        offset = int(params.get("offset", 0))
+        limit = params.get("limit")
+        rows = rows[offset:offset + int(limit)] if limit is not None else rows[offset:]
+        columns = params.get("select", "*")
+        if columns != "*":
+            names = [name.strip() for name in columns.split(",")]
+            rows = [{name: row.get(name) for name in names} for row in rows]
+        count = total if "count=exact" in prefer else None
+        return rows, offset, count
+
+    def insert(self, table, body, params, prefer):
+        """Insert rows; returns (status, rows or error)"""
+        records = body if isinstance(body, list) else [body]
+        ignore_duplicates = "resolution=ignore-duplicates" in prefer
+        merge_duplicates = "resolution=merge-duplicates" in prefer
+        inserted = []
+        with self._lock:
+            existing = self.tables.setdefault(table, [])
+            for record in records:
+                row = dict(record)
+                row.setdefault("id", str(uuid.uuid4()))
+                row.setdefault("created_at", _now())
+                if table == "revoked_tokens":
+                    row.setdefault("revoked_at", _now())
+                clash = self._clash(existing, table, row)
+                if clash is not None:
+                    if ignore_duplicates:
+                        continue
+                    if merge_duplicates:
+                        clash.update(row)
+                        inserted.append(dict(clash))
+                        continue
+                    return 409, {
+                        "code": "23505",
+                        "message": f'duplicate key value violates unique constraint "{table}_unique"',
+                        "details": None,
+                        "hint": None
+                    }
+                existing.append(row)
+                inserted.append(dict(row))
+        return 201, inserted
+
+    def update(self, table, body, params):
+        predicates = self._predicates(params)
+        updated = []
+        with self._lock:
+            for row in self.tables.get(table, []):
+                if all(p(row) for p in predicates):
+                    row.update(body)
+                    updated.append(dict(row))
+        return updated
+
+    def delete(self, table, params):
+        predicates = self._predicates(params)
+        with self._lock:
+            rows = self.tables.get(table, [])
+            removed = [row for row in rows if all(p(row) for p in predicates)]
+            self.tables[table] = [row for row in rows if not all(p(row) for p in predicates)]
+        return removed
+
+    def rpc(self, name, args):
+        """Run a database function; returns (status, payload)"""
+        if name == "get_user_prediction_stats":
+            rows = [row for row in self.rows("predictions") if row.get("user_id") == args.get("p_user_id")]
+            resolved = [row for row in rows if row.get("resolved_at")]
+            return 200, [{
+                "total_predictions": len(rows),
+                "active_predictions": len(rows) - len(resolved),
+                "resolved_predictions": len(resolved),
+                "wins": sum(1 for row in resolved if row.get("is_winner")),
+                "total_staked": sum(row.get("amount") or 0 for row in rows)
+            }]
+        if name == "apply_prediction_settlements":
+            outcomes = {row["id"]: row for row in args.get("p_rows") or []}
+            deltas = {}
+            with self._lock:
+                for row in self.tables.get("predictions", []):
+                    outcome = outcomes.get(row.get("id"))
+                    if outcome is None or row.get("event_id") != args.get("p_event_id") or row.get("settled_at"):
+                        continue
+                    row.update(outcome, settled_at=_now())
+                    deltas[row["user_id"]] = deltas.get(row["user_id"], 0) + (outcome.get("reputation_delta") or 0)
+                changed = []
+                for profile in self.tables.get("user_profiles", []):
+                    if deltas.get(profile.get("id")):
+                        profile["reputation_score"] = (profile.get("reputation_score") or 0) + deltas[profile["id"]]
+                        changed.append({"id": profile["id"], "reputation_score": profile["reputation_score"]})
+            return 200, changed
+        if name == "record_event_engagement":
+            rows = args.get("p_rows") or []
+            with self._lock:
+                events = {event.get("id"): event for event in self.tables.get("events", [])}
+                stored = [dict(row, id=str(uuid.uuid4())) for row in rows if row.get("event_id") in events]
+                self.tables.setdefault("event_engagement", []).extend(stored)
+                for row in stored:
+                    if row.get("engagement_type") == "view":
+                        event = events[row["event_id"]]
+                        event["view_count"] = (event.get("view_count") or 0) + 1
+            return 200, [{"inserted": len(stored)}]
+        if name == "fan_out_event_notification":
+            with self._lock:
+                after, limit = args.get("p_after"), int(args.get("p_limit") or 10000)
+                batch = sorted(
+                    (row for row in self.tables.get("predictions", [])
+                     if row.get("event_id") == args.get("p_event_id") and (after is None or row["user_id"] > after)),
+                    key=lambda row: row["user_id"]
+                )[:limit]
+                disabled = {row.get("user_id") for row in self.tables.get("settings", []) if row.get("notifications_enabled") is False}
+                notifications = self.tables.setdefault("notifications", [])
+                sent = {(row.get("user_id"), row.get("type"), row.get("ref_id")) for row in notifications}
+                inserted = 0
+                for row in batch:
+                    key = (row["user_id"], args.get("p_type"), args.get("p_event_id"))
+                    if row["user_id"] in disabled or key in sent:
+                        continue
+                    content = args.get("p_content")
+                    if row.get("is_winner") and args.get("p_winner_content"):
+                        content = args["p_winner_content"].replace("{payout}", str(row.get("payout") or 0))
+                    notifications.append({
+                        "id": str(uuid.uuid4()), "user_id": row["user_id"], "title": args.get("p_title"),
+                        "content": content, "type": args.get("p_type"), "ref_id": args.get("p_event_id"),
+                        "is_read": False, "created_at": _now()
+                    })
+                    inserted += 1
+            last = batch[-1]["user_id"] if len(batch) == limit else None
+            return 200, [{"inserted": inserted, "last_user_id": last}]
+        return 404, {"code": "PGRST202", "message": f"Could not find the function public.{name}", "details": None, "hint": None}
+
+    def _clash(self, rows, table, row):
+        for key in UNIQUE_KEYS.get(table, [("id",)]):
+            if any(row.get(column) is None for column in key):
+                continue
+            for other in rows:
+                if all(other.get(column) == row.get(column) for column in key):
+                    return other
+        return None
+
+    def _predicates(self, params):
+        predicates = []
+        for column, expression in getattr(params, "pairs", params.items()):
+            if column in ("select", "order", "limit", "offset", "on_conflict", "columns"):
+                continue
+            if column in ("or", "and"):
+                predicates.append(_parse_condition(f"{column}{expression}"))
+            else:
+                predicates.append(_parse_filter(column, expression))
+        return predicates
+
+    def _filtered(self, table, params):
+        predicates = self._predicates(params)
+        return [row for row in self.rows(table) if all(p(row) for p in predicates)]
+
+    @staticmethod
+    def _order(params):
+        order = []
+        for term in filter(None, params.get("order", "").split(",")):
+            parts = term.split(".")
+            order.append((parts[0], len(parts) > 1 and parts[1] == "desc"))
+        return order
+
+    # Auth
+
+    def create_auth_user(self, attributes):
+        now = _now()
+        user = {
+            "id": str(uuid.uuid4()),
+            "aud": "authenticated",
+            "role": "authenticated",
+            "email": attributes.get("email"),
+            "app_metadata": {"provider": "email"},
+            "user_metadata": attributes.get("user_metadata") or {},
+            "email_confirmed_at": now if attributes.get("email_confirm") else None,
+            "created_at": now,
+            "updated_at": now
+        }
+        with self._lock:
+            self.auth_users[user["id"]] = user
+        return user
+
+
+class SupabaseRequestHandler(BaseHTTPRequestHandler):
+    """Routes /rest/v1 and /auth/v1 requests to a FakeSupabase"""
+
+    backend = None
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    disable_nagle_algorithm = True
+    wbufsize = -1  # headers and body leave in one write, flushed after each request
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self._quickack()
+
+    def _quickack(self):
+        # postgrest-py writes the request headers and its "{}" body separately;
+        # with Nagle on the client and delayed ACKs here, every call would
+        # stall ~40 ms on loopback and swamp the injected latency
+        if hasattr(socket, "TCP_QUICKACK"):
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+
+    def _send(self, status, payload=None, headers=None):
+        body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body and self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _body(self):
+        self._quickack()
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def _dispatch(self):
+        url = urlparse(self.path)
+        params = QueryParams(parse_qsl(url.query, keep_blank_values=True))
+        prefer = self.headers.get("Prefer", "")
+        # postgrest-py sends a "{}" body even with GET, so always drain it
+        body = self._body()
+        parts = url.path.strip("/").split("/")
+
+        if parts[0] == "__bench":
+            return self._send(*self.backend.control("/".join(parts[1:]), body or {}))
+
+        self.backend._delay()
+        try:
+            if parts[:2] == ["rest", "v1"] and len(parts) == 4 and parts[2] == "rpc":
+                self.backend._count(self.command, f"rpc/{parts[3]}")
+                return self._send(*self.backend.rpc(parts[3], body or {}))
+            if parts[:2] == ["rest", "v1"] and len(parts) == 3:
+                self.backend._count(self.command, parts[2])
+                return self._table(parts[2], params, prefer, body)
+            if parts[:2] == ["auth", "v1"]:
+                self.backend._count(self.command, "auth/" + "/".join(parts[2:]))
+                return self._auth(parts[2:], body)
+        except ValueError as e:
+            return self._send(400, {"code": "PGRST100", "message": str(e), "details": None, "hint": None})
+        self._send(404, {"message": f"No route for {url.path}"})
+
+    def _table(self, table, params, prefer, body):
+        if self.command in ("GET", "HEAD"):
+            rows, offset, count = self.backend.select(table, params, prefer)
+            end = offset + len(rows) - 1
+            content_range = f"{offset}-{end}" if rows else "*"
+            content_range += f"/{count if count is not None else '*'}"
+            return self._send(200, rows, {"Content-Range": content_range})
+        if self.command == "POST":
+            status, result = self.backend.insert(table, body, params, prefer)
+            if status != 201 or "return=minimal" in prefer:
+                return self._send(status, result if status != 201 else None)
+            return self._send(201, result)
+        if self.command == "PATCH":
+            return self._send(200, self.backend.update(table, body or {}, params))
+        if self.command == "DELETE":
+            return self._send(200, self.backend.delete(table, params))
+        self._send(405, {"message": f"Method {self.command} not allowed"})
+
+    def _auth(self, route, body):
+        if route == ["admin", "users"] and self.command == "POST":
+            return self._send(200, self.backend.create_auth_user(body or {}))
+        self._send(404, {"message": "Not found"})
+
+    do_GET = do_HEAD = do_POST = do_PATCH = do_DELETE = _dispatch
+
+
+class FakeSupabaseControl:
+    """Talks to the /__bench/ control routes of a running fake (any process)
+
+    Args:
+        url (str): Base URL of the fake
+    """
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+
+    def _call(self, route, body=None):
+        data = None if body is None else json.dumps(body).encode("utf-8")
+        request = Request(f"{self.url}/__bench/{route}", data=data, method="POST" if data is not None else "GET",
+                          headers={"Content-Type": "application/json"})
+        with urlopen(request) as response:
+            return json.loads(response.read())
+
+    def counters(self):
+        """Return {"round_trips": int, "by_route": {"METHOD route": int}}"""
+        return self._call("counters")
+
+    def reset(self):
+        self._call("reset", {})
+
+    def set_latency(self, latency, jitter=0.0):
+        return self._call("latency", {"latency": latency, "jitter": jitter})
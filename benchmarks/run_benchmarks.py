@@ -0,0 +1,329 @@
+"""Benchmark the main API flows against a local Supabase stand-in
+
+Starts benchmarks/fake_supabase.py with the requested latency, points the
+app at it (in production mode, so the real code paths run instead of the
+development mocks), seeds users, events and predictions, and drives each
+scenario through the Flask test client from a pool of threads.
+
+For every scenario it reports p50/p95/p99/mean/max latency, throughput
+and Supabase round trips per operation, and writes them as sorted JSON so
+two runs can be diffed:
+
+    python benchmarks/run_benchmarks.py --latency 0.02 --output before.json
+    (make changes)
+    python benchmarks/run_benchmarks.py --latency 0.02 --output after.json
+    diff before.json after.json
+"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_supabase import FakeSupabase, FakeSupabaseControl
+
+SCENARIOS = ("list_events", "event_detail", "nonce_verify", "create_prediction", "profile")
+CATEGORIES = ("sports", "politics", "crypto", "entertainment")
+HISTORY_EVENTS = 5  # oldest events every seeded user has already predicted on
+
+# Settings that change what is measured; recorded with the results
+RECORDED_ENV = (
+    "EVENT_CACHE_TTL", "USER_STATS_CACHE_TTL", "TOKEN_CACHE_MAX_TTL", "NONCE_STORE",
+    "SUPABASE_HTTP_MAX_CONNECTIONS", "SUPABASE_HTTP_MAX_KEEPALIVE_CONNECTIONS",
+    "SUPABASE_CLIENT_PER_THREAD", "SUPABASE_MAX_ATTEMPTS", "ASYNC_ROUTES",
+)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds added to every Supabase round trip (default 0.02)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Up to this many extra seconds per round trip (default 0)")
+    parser.add_argument("--requests", type=int, default=200, help="Measured operations per scenario (default 200)")
+    parser.add_argument("--warmup", type=int, default=20, help="Unmeasured operations run first (default 20)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Client threads (default 8)")
+    parser.add_argument("--events", type=int, default=200, help="Events to seed (default 200)")
+    parser.add_argument("--users", type=int, default=100, help="Users to seed (default 100)")
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="Run only this scenario (repeatable)")
+    parser.add_argument("--cold", action="store_true", help="Disable the event, user-stats and token caches")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the latency jitter (default 0)")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the results (default benchmark_results.json)")
+    return parser.parse_args(argv)
+
+
+def configure_environment(url, cold):
+    """Point the app at the fake; must run before the app is imported"""
+    os.environ["REACT_APP_SUPABASE_URL"] = url
+    # supabase-py only checks that the key looks like a JWT
+    os.environ["REACT_APP_SUPABASE_ANON_KEY"] = "bench.anon.key"
+    os.environ["SUPABASE_SERVICE_ROLE_KEY"] = "bench.service.key"
+    os.environ["FLASK_ENV"] = "production"
+    os.environ.pop("FLASK_DEBUG", None)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # The ending-event scanner's periodic queries would be counted against whichever scenario is running
+    os.environ.setdefault("NOTIFICATIONS_ENABLED", "0")
+    if cold:
+        os.environ["EVENT_CACHE_TTL"] = "0"
+        os.environ["USER_STATS_CACHE_TTL"] = "0"
+        os.environ["TOKEN_CACHE_MAX_TTL"] = "0"
+
+
+def seed_data(fake, n_users, n_events):
+    """Seed user profiles, settings, events and some predictions
+
+    Returns:
+        tuple: (user rows, event rows)
+    """
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    users = [{
+        "id": str(uuid.UUID(int=i + 1)),
+        "username": f"bench_user_{i}",
+        "email": f"bench_user_{i}@example.com",
+        "wallet_address": f"0x{i:040x}",
+        "avatar_url": None,
+        "bio": None,
+        "reputation_score": 0,
+        "is_verified": False,
+        "created_at": start.isoformat(),
+        "updated_at": start.isoformat()
+    } for i in range(n_users)]
+    events = []
+    for i in range(n_events):
+        created_at = (start + timedelta(minutes=i)).isoformat()
+        events.append({
+            "id": str(uuid.UUID(int=(1 << 64) + i)),
+            "title": f"Benchmark event {i}",
+            "description": "Will it happen? " * 8,
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "options": [{"id": "yes", "value": "Yes"}, {"id": "no", "value": "No"}],
+            "start_time": created_at,
+            # Far enough ahead that create_prediction never meets an ended event
+            "end_time": (start + timedelta(days=36500, minutes=i)).isoformat(),
+            "status": "active",
+            "created_by": users[i % n_users]["id"],
+            "created_at": created_at,
+            "updated_at": created_at
+        })
+    fake.seed("user_profiles", users)
+    fake.seed("events", events)
+    fake.seed("settings", [{
+        "id": str(uuid.uuid4()),
+        "user_id": user["id"],
+        "notifications_enabled": True,
+        "email_notifications": False,
+        "dark_mode": False
+    } for user in users])
+    # Give every user a short history on the oldest events
+    fake.seed("predictions", [{
+        "id": str(uuid.uuid4()),
+        "event_id": events[j]["id"],
+        "user_id": user["id"],
+        "option_id": "yes" if j % 2 else "no",
+        "amount": 10,
+        "created_at": start.isoformat()
+    } for user in users for j in range(min(HISTORY_EVENTS, n_events))])
+    return users, events
+
+
+class Scenario:
+    """One flow to measure; run(client, i) performs operation i and returns its responses
+
+    Args:
+        name (str): Scenario name used in the results
+        run (callable): Takes (client, index) and returns a list of responses
+        expected (tuple): Status codes that count as success
+    """
+
+    def __init__(self, name, run, expected=(200,)):
+        self.name = name
+        self.run = run
+        self.expected = expected
+
+
+def build_scenarios(app, users, events, offset):
+    """Build the scenarios, each using its own slice of users/wallets
+
+    Args:
+        offset (int): First operation index that has not been used yet, so
+            warm-up and measured operations never share a prediction or wallet
+    """
+    from routes_supabase import generate_token
+
+    with app.app_context():
+        tokens = [generate_token(user["id"]) for user in users]
+
+    def list_events(client, i):
+        category = ([None] + list(CATEGORIES))[i % (len(CATEGORIES) + 1)]
+        query = "limit=50" + (f"&category={category}" if category else "")
+        return [client.get(f"/api/events?{query}")]
+
+    def event_detail(client, i):
+        return [client.get(f"/api/events/{events[i % len(events)]['id']}")]
+
+    def nonce_verify(client, i):
+        # Returning users: a nonce, then verification of the signed nonce
+        wallet = users[i % len(users)]["wallet_address"]
+        nonce = client.post("/api/auth/nonce", json={"wallet_address": wallet})
+        signed = nonce.get_json()["data"]["nonce"] if nonce.status_code == 201 else ""
+        verify = client.post("/api/auth/verify", json={"wallet_address": wallet, "signature": f"signed:{signed}"})
+        return [nonce, verify]
+
+    def create_prediction(client, i):
+        # Walk fresh (user, event) pairs so no operation hits the unique constraint
+        fresh_events = events[HISTORY_EVENTS:]
+        user_index, event_index = divmod(i + offset, len(fresh_events))
+        event = fresh_events[-1 - event_index]
+        headers = {"Authorization": f"Bearer {tokens[user_index % len(tokens)]}"}
+        return [client.post("/api/predictions", headers=headers, json={
+            "event_id": event["id"],
+            "option_value": "yes",
+            "amount": 5,
+            "confidence_score": 0.7
+        })]
+
+    def profile(client, i):
+        headers = {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+        return [client.get("/api/user/profile", headers=headers)]
+
+    return {
+        "list_events": Scenario("list_events", list_events),
+        "event_detail": Scenario("event_detail", event_detail),
+        "nonce_verify": Scenario("nonce_verify", nonce_verify, expected=(200, 201)),
+        "create_prediction": Scenario("create_prediction", create_prediction, expected=(201,)),
+        "profile": Scenario("profile", profile),
+    }
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-pct * len(sorted_values) // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def run_scenario(app, control, scenario, n_requests, warmup, concurrency):
+    """Run warm-up then measured operations and summarise them"""
+    local = threading.local()
+
+    def client():
+        if not hasattr(local, "client"):
+            local.client = app.test_client()
+        return local.client
+
+    def timed(i):
+        started = time.perf_counter()
+        responses = scenario.run(client(), i)
+        elapsed = time.perf_counter() - started
+        return elapsed, [response.status_code for response in responses]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda i: timed(-1 - i), range(warmup)))
+        control.reset()
+        started = time.perf_counter()
+        results = list(pool.map(timed, range(n_requests)))
+        wall_time = time.perf_counter() - started
+    counters = control.counters()
+
+    latencies = sorted(elapsed * 1000 for elapsed, _ in results)
+    status_codes = {}
+    errors = 0
+    http_requests = 0
+    for _, codes in results:
+        http_requests += len(codes)
+        for code in codes:
+            status_codes[str(code)] = status_codes.get(str(code), 0) + 1
+            if code not in scenario.expected:
+                errors += 1
+
+    return {
+        "operations": n_requests,
+        "http_requests_per_operation": round(http_requests / n_requests, 3),
+        "errors": errors,
+        "status_codes": status_codes,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "mean": round(sum(latencies) / len(latencies), 3),
+            "max": round(latencies[-1], 3)
+        },
+        "throughput_per_second": round(n_requests / wall_time, 3),
+        "round_trips_per_operation": round(counters["round_trips"] / n_requests, 3),
+        "round_trips_by_route": {route: round(count / n_requests, 3) for route, count in counters["by_route"].items()}
+    }
+
+
+def git_revision():
+    """Return (commit, dirty) for the working tree, or (None, None) outside git"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        return commit, bool(status.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    names = args.scenario or list(SCENARIOS)
+    # Each create_prediction operation needs its own fresh (user, event) pair
+    if "create_prediction" in names and args.warmup + args.requests > args.users * (args.events - HISTORY_EVENTS):
+        sys.exit(f"--users x (--events - {HISTORY_EVENTS}) must be at least --warmup + --requests for create_prediction")
+
+    # Seed, then fork the fake so it doesn't share the GIL with the app
+    fake = FakeSupabase(latency=args.latency, jitter=args.jitter, seed=args.seed)
+    users, events = seed_data(fake, args.users, args.events)
+    url = fake.start_process()
+    control = FakeSupabaseControl(url)
+    configure_environment(url, args.cold)
+
+    from app import app
+
+    scenarios = build_scenarios(app, users, events, offset=args.warmup)
+
+    results = {}
+    try:
+        for name in names:
+            results[name] = run_scenario(app, control, scenarios[name], args.requests, args.warmup, args.concurrency)
+            summary = results[name]
+            print(
+                f"{name:<18} p50 {summary['latency_ms']['p50']:>8.2f} ms  p95 {summary['latency_ms']['p95']:>8.2f} ms  "
+                f"p99 {summary['latency_ms']['p99']:>8.2f} ms  {summary['throughput_per_second']:>8.1f} ops/s  "
+                f"{summary['round_trips_per_operation']:>5.2f} round trips/op  {summary['errors']} errors"
+            )
+    finally:
+        fake.stop()
+
+    commit, dirty = git_revision()
+    report = {
+        "git": {"commit": commit, "dirty": dirty},
+        "config": {
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "requests": args.requests,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "events": args.events,
+            "users": args.users,
+            "cold": args.cold,
+            "env": {key: os.environ[key] for key in RECORDED_ENV if key in os.environ}
+        },
+        "scenarios": results
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+"""Build the frontend in HTML/ for production
+
+Copies HTML/ into STATIC_BUILD_DIR with every asset (CSS, JS, images,
+fonts) renamed to include a hash of its content, rewrites the references
+in the HTML pages and stylesheets to the new names, writes manifest.json
+(original name -> fingerprinted name) and stores .gz and .br (when the
+Brotli package is installed) siblings of every text file. Assets of the
+previous build are kept for one more build, so pages that are already
+open can still load them. The app serves this build automatically once
+it exists and matches the current HTML/:
+
+    python build_static.py
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+
+from static_assets import STATIC_BUILD_DIR, MANIFEST_NAME
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip siblings are always written
+    brotli = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SOURCE_DIR = os.path.join(ROOT, "HTML")
+OUTPUT_DIR = os.path.join(ROOT, STATIC_BUILD_DIR)
+
+# Files renamed by content hash; anything else (HTML shells) keeps its name
+FINGERPRINT_EXTENSIONS = {".css", ".js", ".svg", ".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico", ".woff", ".woff2"}
+# Files that get precompressed siblings
+COMPRESS_EXTENSIONS = {".html", ".css", ".js", ".svg", ".json"}
+PUBLISHED_EXTENSIONS = FINGERPRINT_EXTENSIONS | COMPRESS_EXTENSIONS
+# Smaller files are not worth a compressed copy
+MIN_COMPRESS_SIZE = 256
+
+HTML_REFERENCE = re.compile(r'''(\b(?:src|href)=)(["'])([^"']+)\2''')
+CSS_REFERENCE = re.compile(r'''url\((["']?)([^"')]+)\1\)''')
+
+
+def fingerprint_name(path, content):
+    """styles.css -> styles.<first 10 hex chars of sha256>.css"""
+    stem, extension = posixpath.splitext(path)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:10]}{extension}"
+
+
+def resolve_reference(referrer, reference, manifest):
+    """Map a relative reference from referrer to its fingerprinted name, if it is a built asset"""
+    if re.match(r"^[a-z][a-z0-9+.-]*:|^//|^#|^\$\{", reference, re.IGNORECASE):
+        return reference
+    path, suffix = re.match(r"([^?#]*)(.*)", reference, re.DOTALL).groups()
+    base = posixpath.dirname(referrer)
+    target = posixpath.normpath(path.lstrip("/") if path.startswith("/") else posixpath.join(base, path))
+    if target not in manifest:
+        return reference
+    built = manifest[target]
+    if path.startswith("/"):
+        new_path = "/" + built
+    else:
+        new_path = posixpath.relpath(built, base or ".")
+    return new_path + suffix
+
+
+def rewrite(referrer, text, manifest):
+    """Point every asset reference in an HTML page or stylesheet at its fingerprinted name"""
+    if referrer.endswith(".css"):
+        return CSS_REFERENCE.sub(
+            lambda m: f"url({m.group(1)}{resolve_reference(referrer, m.group(2), manifest)}{m.group(1)})", text)
+    return HTML_REFERENCE.sub(
+        lambda m: f"{m.group(1)}{m.group(2)}{resolve_reference(referrer, m.group(3), manifest)}{m.group(2)}", text)
+
+
+def collect_sources(source_dir):
+    """Return the publishable files under source_dir as POSIX paths, skipping dotfiles"""
+    sources = []
+    for root, dirs, files in os.walk(source_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if name.startswith(".") or posixpath.splitext(name)[1].lower() not in PUBLISHED_EXTENSIONS:
+                continue
+            relative = os.path.relpath(os.path.join(root, name), source_dir)
+            sources.append(relative.replace(os.sep, "/"))
+    return sources
+
+
+def source_digest(source_dir):
+    """Hash the names and contents of every publishable file under source_dir
+
+    Stored in the manifest, so the app can tell when HTML/ changed after
+    the build was made.
+    """
+    digest = hashlib.sha256()
+    for path in collect_sources(source_dir):
+        with open(os.path.join(source_dir, path), "rb") as f:
+            content = f.read()
+        digest.update(f"{path}\0{len(content)}\0".encode("utf-8"))
+        digest.update(content)
+    return digest.hexdigest()
+
+
+def build_order(path):
+    # Stylesheets reference images and fonts, HTML references everything:
+    # each file is rewritten only after what it points at has its final name
+    extension = posixpath.splitext(path)[1].lower()
+    if extension == ".html":
+        return 2
+    if extension == ".css":
+        return 1
+    return 0
+
+
+def precompress(path):
+    """Write .gz and .br siblings of path when they are smaller than it"""
+    with open(path, "rb") as f:
+        content = f.read()
+    if len(content) < MIN_COMPRESS_SIZE:
+        return
+    # mtime=0 keeps the output identical across builds
+    variants = [(".gz", gzip.compress(content, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append((".br", brotli.compress(content, quality=11)))
+    for suffix, data in variants:
+        if len(data) < len(content):
+            with open(path + suffix, "wb") as f:
+                f.write(data)
+
+
+def carry_over_assets(output_dir, staging, manifest):
+    """Copy the previous build's fingerprinted assets that this build no longer has
+
+    Pages cached (or already open) from the last deploy still reference
+    them, so they stay available for one more build.
+
+    Returns:
+        list: The carried-over paths
+    """
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+            old_assets = json.load(f).get("assets", {}).values()
+    except (OSError, ValueError):
+        return []
+    current = set(manifest.values())
+    carried = []
+    for path in sorted(set(old_assets) - current):
+        source = os.path.join(output_dir, *path.split("/"))
+        if not os.path.isfile(source):
+            continue
+        destination = os.path.join(staging, *path.split("/"))
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        for suffix in ("", ".gz", ".br"):
+            if os.path.isfile(source + suffix):
+                shutil.copy2(source + suffix, destination + suffix)
+        carried.append(path)
+    return carried
+
+
+def build(source_dir=SOURCE_DIR, output_dir=OUTPUT_DIR):
+    """Build source_dir into output_dir, replacing any previous build
+
+    Returns:
+        dict: The manifest, original path -> fingerprinted path
+    """
+    staging = output_dir.rstrip("/\\") + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    manifest = {}
+
+    for path in sorted(collect_sources(source_dir), key=lambda p: (build_order(p), p)):
+        with open(os.path.join(source_dir, path), "rb") as f:
+            content = f.read()
+        extension = posixpath.splitext(path)[1].lower()
+        if extension in (".html", ".css"):
+            content = rewrite(path, content.decode("utf-8"), manifest).encode("utf-8")
+
+        built = path
+        if extension in FINGERPRINT_EXTENSIONS:
+            built = fingerprint_name(path, content)
+            manifest[path] = built
+
+        destination = os.path.join(staging, *built.split("/"))
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        with open(destination, "wb") as f:
+            f.write(content)
+        if extension in COMPRESS_EXTENSIONS:
+            precompress(destination)
+
+    previous_assets = carry_over_assets(output_dir, staging, manifest)
+    with open(os.path.join(staging, MANIFEST_NAME), "w") as f:
+        json.dump({
+            "assets": manifest,
+            "previous": previous_assets,
+            "source_digest": source_digest(source_dir)
+        }, f, indent=2, sort_keys=True)
+
+    # Swap the finished build in with renames rather than rewriting files in place
+    previous = output_dir.rstrip("/\\") + ".old"
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(output_dir):
+        os.rename(output_dir, previous)
+    os.rename(staging, output_dir)
+    shutil.rmtree(previous, ignore_errors=True)
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fingerprint and precompress the frontend for production")
+    parser.add_argument("--source", default=SOURCE_DIR, help="Directory to build (default HTML)")
+    parser.add_argument("--output", default=OUTPUT_DIR, help=f"Build directory (default {STATIC_BUILD_DIR})")
+    args = parser.parse_args(argv)
+    manifest = build(args.source, args.output)
+    print(f"Built {len(manifest)} fingerprinted assets into {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+from flask import request, current_app, stream_with_context, json as flask_json
+import gzip
+import os
+import zlib
+
+import retry_policy
+from structured_logging import get_logger
+
+logger = get_logger("compression")
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+# Configure response compression
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))  # bytes
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+    "image/svg+xml",
+}
+
+# Opt-in streaming formats for list endpoints (?stream=...)
+STREAM_FORMATS = ("ndjson", "json")
+
+
+def choose_encoding():
+    """Pick the best encoding the client accepts: br, then gzip, else None"""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def _compressor(encoding):
+    if encoding == "br":
+        return brotli.Compressor(quality=BROTLI_QUALITY)
+    # wbits=31 writes a gzip header and trailer
+    return zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+
+def _compress_stream(chunks, encoding):
+    """Compress an iterable of chunks incrementally, flushing after each one"""
+    compressor = _compressor(encoding)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        if encoding == "br":
+            data = compressor.process(chunk) + compressor.flush()
+        else:
+            data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.finish() if encoding == "br" else compressor.flush()
+
+
+def compress_response(response):
+    """after_request hook: compress JSON/text bodies the client can decode
+
+    Skips small bodies, 304s and other bodiless responses, file
+    responses (direct_passthrough) and anything already encoded. Streamed
+    responses are compressed chunk by chunk. The ETag is made weak
+    because the compressed bytes differ from the identity representation.
+    """
+    if request.method == "HEAD" or response.status_code < 200 or response.status_code in (204, 206, 304):
+        return response
+    if response.direct_passthrough or "Content-Encoding" in response.headers:
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers.pop("Content-Length", None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESSION_MIN_SIZE:
+            return response
+        if encoding == "br":
+            data = brotli.compress(data, quality=BROTLI_QUALITY)
+        else:
+            data = gzip.compress(data, compresslevel=GZIP_LEVEL)
+        response.set_data(data)
+
+    response.headers["Content-Encoding"] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app):
+    """Compress every eligible response the app sends"""
+    app.after_request(compress_response)
+
+
+def requested_stream_format():
+    """Return the ?stream= format asked for, None if absent
+
+    Raises:
+        ValueError: If the format is not one of STREAM_FORMATS
+    """
+    stream_format = request.args.get("stream")
+    if not stream_format:
+        return None
+    if stream_format not in STREAM_FORMATS:
+        raise ValueError(f"stream must be one of: {', '.join(STREAM_FORMATS)}")
+    return stream_format
+
+
+def _pages_with_deadlines(pages):
+    # Each page gets a fresh Supabase time budget; one request-wide budget
+    # would cut long listings off part-way
+    pages = iter(pages)
+    while True:
+        token = retry_policy.start_deadline()
+        try:
+            page = next(pages)
+        except StopIteration:
+            return
+        finally:
+            retry_policy.clear_deadline(token)
+        yield page
+
+
+def stream_rows(pages, stream_format, prefix="[", suffix="]"):
+    """Build a streamed response that serialises rows page by page
+
+    Args:
+        pages (iterable): Yields lists of rows, fetched lazily
+        stream_format (str): "ndjson" (one JSON object per line) or
+            "json" (a single array, written incrementally)
+        prefix (str): Text written before the first row in json mode
+        suffix (str): Text written after the last row in json mode
+
+    Returns:
+        Response: A chunked response; at most one page is held in memory
+    """
+    def generate():
+        first = True
+        if stream_format == "json":
+            yield prefix
+        try:
+            for page in _pages_with_deadlines(pages):
+                if stream_format == "ndjson":
+                    yield "".join(flask_json.dumps(row) + "\n" for row in page)
+                else:
+                    chunk = ",".join(flask_json.dumps(row) for row in page)
+                    yield chunk if first else "," + chunk
+                first = False
+        except Exception as e:
+            # Headers are already sent; end the body so the client sees it is incomplete
+            logger.error("Error while streaming rows: %s", e)
+            if stream_format == "ndjson":
+                yield flask_json.dumps({"error": "Stream interrupted", "details": str(e)}) + "\n"
+            return
+        if stream_format == "json":
+            yield suffix
+
+    mimetype = "application/x-ndjson" if stream_format == "ndjson" else "application/json"
+    return current_app.response_class(stream_with_context(generate()), mimetype=mimetype)
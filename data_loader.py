@@ -0,0 +1,58 @@
+from flask import g
+
+import models_supabase as models
+
+
+class BatchLoader:
+    """Collects key lookups and resolves them with one batch call
+
+    Keys requested through want() are queued; the next load() or
+    load_many() resolves every queued key with a single call to batch_fn
+    and memoizes the results for the rest of the request.
+
+    Args:
+        batch_fn (callable): Takes a list of keys and returns a dict of key -> value
+    """
+
+    def __init__(self, batch_fn):
+        self._batch_fn = batch_fn
+        self._results = {}
+        self._pending = {}
+
+    def want(self, keys):
+        """Queue keys to be fetched with the next batch"""
+        for key in keys:
+            if key and key not in self._results:
+                self._pending[key] = None
+
+    def dispatch(self):
+        """Resolve every queued key with one batch call"""
+        if not self._pending:
+            return
+        keys = list(self._pending)
+        self._pending.clear()
+        found = self._batch_fn(keys) or {}
+        for key in keys:
+            self._results[key] = found.get(key)
+
+    def load(self, key):
+        """Return the value for key (None if it doesn't exist)"""
+        self.want([key])
+        self.dispatch()
+        return self._results.get(key)
+
+    def load_many(self, keys):
+        """Return a dict of key -> value for keys, fetched in one batch"""
+        keys = list(keys)
+        self.want(keys)
+        self.dispatch()
+        return {key: self._results.get(key) for key in keys}
+
+
+def get_user_loader():
+    """Return the user loader for the current request, creating it on first use"""
+    loader = g.get('user_loader')
+    if loader is None:
+        loader = BatchLoader(models.get_users_by_ids)
+        g.user_loader = loader
+    return loader
@@ -0,0 +1,205 @@
+from datetime import datetime, timezone
+import atexit
+import os
+import queue
+import threading
+import time
+
+from retry_policy import call_with_retry
+from structured_logging import get_logger
+from supabase_client import supabase_admin
+
+logger = get_logger("engagement")
+
+# Configure engagement ingestion
+ENGAGEMENT_ENABLED = os.getenv("ENGAGEMENT_ENABLED", "1") == "1"
+ENGAGEMENT_BUFFER_SIZE = int(os.getenv("ENGAGEMENT_BUFFER_SIZE", "10000"))  # records held before new ones are dropped
+ENGAGEMENT_FLUSH_INTERVAL = float(os.getenv("ENGAGEMENT_FLUSH_INTERVAL", "5"))  # seconds
+ENGAGEMENT_FLUSH_SIZE = int(os.getenv("ENGAGEMENT_FLUSH_SIZE", "500"))  # records per database call
+
+ENGAGEMENT_TYPES = ("view", "share", "bookmark")
+
+
+class EngagementCollector:
+    """Buffers engagement records in memory and writes them in batches
+
+    record() only appends to a bounded queue, so it never waits on the
+    database; when the queue is full the record is dropped and counted
+    instead of slowing the request down. A background thread flushes the
+    queue every flush_interval seconds, or as soon as flush_size records
+    are waiting. Each flush is one record_event_engagement call (with the
+    service-role client), which inserts the rows and adds the batch's
+    views to events.view_count in a single transaction.
+
+    Records carry the caller's bearer token rather than a user ID: the
+    flusher turns tokens into user IDs through identify_user, so a view
+    never waits on token verification. Tokens that don't verify are
+    recorded anonymously.
+
+    Flushes are not retried: a retry after a timeout could count the same
+    views twice, and losing a batch of analytics is the cheaper failure.
+
+    Args:
+        buffer_size (int): Maximum records waiting to be flushed
+        flush_interval (float): Seconds between flushes
+        flush_size (int): Records per flush call, and the backlog that triggers an early flush
+    """
+
+    def __init__(self, buffer_size=ENGAGEMENT_BUFFER_SIZE, flush_interval=ENGAGEMENT_FLUSH_INTERVAL,
+                 flush_size=ENGAGEMENT_FLUSH_SIZE):
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._queue = queue.Queue(maxsize=buffer_size)
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self._flusher_pid = None
+        self.identify_user = None  # token -> user ID or None, set by the routes
+        self.accepted = 0
+        self.dropped = 0
+        self.flushed = 0
+        self.failed = 0
+        self.flushes = 0
+        self.high_watermark = 0
+        self.last_flush_seconds = None
+
+    def record(self, event_id, engagement_type, user_id=None, token=None, ip_address=None, user_agent=None):
+        """Queue one engagement record without blocking
+
+        Args:
+            user_id (str, optional): The user, if the caller already knows it
+            token (str, optional): A bearer token to identify the user from when flushing
+
+        Returns:
+            bool: False if the buffer was full and the record was dropped
+        """
+        if not ENGAGEMENT_ENABLED:
+            return False
+        self._ensure_flusher()
+        row = {
+            "event_id": event_id,
+            "engagement_type": engagement_type,
+            "user_id": user_id,
+            "token": token,
+            "ip_address": ip_address,
+            "user_agent": user_agent,
+            "created_at": datetime.now(timezone.utc).isoformat()
+        }
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        backlog = self._queue.qsize()
+        with self._lock:
+            self.accepted += 1
+            self.high_watermark = max(self.high_watermark, backlog)
+        if backlog >= self.flush_size:
+            self._wake.set()
+        return True
+
+    def _drain(self, limit):
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _identify(self, rows):
+        """Replace each row's token with the ID of the user it belongs to"""
+        users = {}
+        for row in rows:
+            token = row.pop("token", None)
+            if not token or row["user_id"] is not None or self.identify_user is None:
+                continue
+            if token not in users:
+                try:
+                    users[token] = self.identify_user(token)
+                except Exception as e:
+                    logger.debug("Could not identify an engagement token: %s", e)
+                    users[token] = None
+            row["user_id"] = users[token]
+        return rows
+
+    def flush(self):
+        """Write everything currently buffered, flush_size records per call
+
+        Returns:
+            int: Number of records written
+        """
+        written = 0
+        with self._flush_lock:
+            started = time.monotonic()
+            while True:
+                rows = self._drain(self.flush_size)
+                if not rows:
+                    break
+                self._identify(rows)
+                try:
+                    call_with_retry(
+                        supabase_admin.rpc("record_event_engagement", {"p_rows": rows}).execute,
+                        f"record_event_engagement({len(rows)} rows)",
+                        breaker_name="event_engagement",
+                        max_attempts=1
+                    )
+                    written += len(rows)
+                    with self._lock:
+                        self.flushed += len(rows)
+                except Exception as e:
+                    with self._lock:
+                        self.failed += len(rows)
+                    logger.error("Could not write %s engagement records: %s", len(rows), e)
+                if len(rows) < self.flush_size:
+                    break
+            with self._lock:
+                self.flushes += 1
+                self.last_flush_seconds = round(time.monotonic() - started, 3)
+        return written
+
+    def _ensure_flusher(self):
+        # Threads don't survive a fork, so each worker process starts its own
+        if self._flusher_pid == os.getpid() and self._flusher is not None and self._flusher.is_alive():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid() and self._flusher is not None and self._flusher.is_alive():
+                return
+            if self._flusher_pid is None:
+                atexit.register(self.flush)
+            elif self._flusher_pid != os.getpid():
+                # Records buffered by the parent are the parent's to write
+                self._queue = queue.Queue(maxsize=self.buffer_size)
+            self._flusher = threading.Thread(target=self._flush_forever, name="engagement-flusher", daemon=True)
+            self._flusher_pid = os.getpid()
+            self._flusher.start()
+
+    def _flush_forever(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("Error flushing engagement records: %s", e)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": ENGAGEMENT_ENABLED,
+                "buffered": self._queue.qsize(),
+                "buffer_size": self.buffer_size,
+                "high_watermark": self.high_watermark,
+                "accepted": self.accepted,
+                "dropped": self.dropped,
+                "flushed": self.flushed,
+                "failed": self.failed,
+                "flushes": self.flushes,
+                "last_flush_seconds": self.last_flush_seconds
+            }
+
+
+engagement_collector = EngagementCollector()
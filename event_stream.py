@@ -0,0 +1,236 @@
+import json
+import os
+import queue
+import threading
+import time
+
+import models_supabase as models
+from structured_logging import get_logger
+
+logger = get_logger("event_stream")
+
+# Configure live event streams (Server-Sent Events)
+EVENT_STREAM_ENABLED = os.getenv("EVENT_STREAM_ENABLED", "1") == "1"
+EVENT_STREAM_QUEUE_SIZE = int(os.getenv("EVENT_STREAM_QUEUE_SIZE", "100"))  # messages buffered per subscriber
+EVENT_STREAM_HEARTBEAT = float(os.getenv("EVENT_STREAM_HEARTBEAT", "15"))  # seconds between keep-alive comments
+EVENT_STREAM_MAX_SUBSCRIBERS = int(os.getenv("EVENT_STREAM_MAX_SUBSCRIBERS", "16"))  # open streams per process; each holds a worker thread
+EVENT_STREAM_MAX_AGE = float(os.getenv("EVENT_STREAM_MAX_AGE", "300"))  # seconds before a stream closes
+EVENT_STREAM_RETRY = int(os.getenv("EVENT_STREAM_RETRY", "3000"))  # milliseconds browsers wait to reconnect
+
+# Channel that receives new-prediction messages for every event
+ALL_EVENTS = "*"
+
+# Fields of a prediction that are published; who made it is left out
+PREDICTION_FIELDS = ("id", "event_id", "option_id", "amount", "confidence_score", "created_at")
+
+
+def format_message(name, data):
+    """Encode one Server-Sent Events message
+
+    Args:
+        name (str): The event name browsers listen for
+        data: JSON-serializable payload
+
+    Returns:
+        str: The message, ending with the blank line that terminates it
+    """
+    return f"event: {name}\ndata: {json.dumps(data, default=str, separators=(',', ':'))}\n\n"
+
+
+class Subscription:
+    """One open stream: the channel it watches and its bounded message queue"""
+
+    def __init__(self, channel, queue_size):
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.opened = time.monotonic()
+
+
+class EventBroker:
+    """Fans live updates out to every open stream in this process
+
+    Each subscriber gets its own bounded queue, and publish_prediction() only ever
+    uses put_nowait, so a slow client can't hold up a prediction request.
+    A subscriber whose queue fills up has its backlog discarded and its
+    stream closed; the browser reconnects and starts again from a fresh
+    tallies snapshot instead of applying a gap in the deltas.
+
+    While an event has subscribers the broker keeps its running tallies,
+    seeded from the snapshot the newest subscriber loaded, and applies
+    each new prediction to them, so pushing updated tallies costs no
+    database query.
+
+    Args:
+        queue_size (int): Messages buffered per subscriber
+        max_subscribers (int): Open streams allowed in this process
+    """
+
+    def __init__(self, queue_size=EVENT_STREAM_QUEUE_SIZE, max_subscribers=EVENT_STREAM_MAX_SUBSCRIBERS):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._channels = {}  # channel -> set of Subscription
+        self._tallies = {}  # event_id -> {option_id: [prediction_count, total_amount, confidence_sum]}
+        self._pid = os.getpid()
+        self.subscribed = 0
+        self.rejected = 0
+        self.published = 0
+        self.delivered = 0
+        self.overflowed = 0
+
+    def _reset_after_fork(self):
+        # Streams belong to the process that accepted them
+        if self._pid != os.getpid():
+            self._channels = {}
+            self._tallies = {}
+            self._pid = os.getpid()
+
+    def subscribe(self, channel, snapshot=None):
+        """Open a subscription to one event's channel, or ALL_EVENTS
+
+        Args:
+            channel (str): An event id or ALL_EVENTS
+            snapshot (dict, optional): The event's current tallies (see
+                models.summarize_tallies), used as the running tallies
+
+        Returns:
+            Subscription: None if the process already has max_subscribers streams
+        """
+        subscription = Subscription(channel, self.queue_size)
+        with self._lock:
+            self._reset_after_fork()
+            if sum(len(subscribers) for subscribers in self._channels.values()) >= self.max_subscribers:
+                self.rejected += 1
+                return None
+            self._channels.setdefault(channel, set()).add(subscription)
+            if snapshot is not None:
+                self._tallies[channel] = {
+                    option["option_id"]: [
+                        option["prediction_count"],
+                        option["total_amount"],
+                        (option["avg_confidence"] or models.DEFAULT_CONFIDENCE_SCORE) * option["prediction_count"]
+                    ]
+                    for option in snapshot.get("options", [])
+                }
+            self.subscribed += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._channels[subscription.channel]
+                self._tallies.pop(subscription.channel, None)
+
+    def _summarize(self, event_id):
+        tallies = [{
+            "option_id": option_id,
+            "prediction_count": count,
+            "total_amount": amount,
+            "avg_confidence": confidence_sum / count if count else None
+        } for option_id, (count, amount, confidence_sum) in self._tallies[event_id].items()]
+        return models.summarize_tallies(event_id, tallies)
+
+    def publish_prediction(self, prediction):
+        """Push a newly created prediction, and the event's updated tallies, to its watchers
+
+        Returns:
+            int: Number of subscribers the prediction was queued for
+        """
+        if not EVENT_STREAM_ENABLED:
+            return 0
+        event_id = prediction.get("event_id")
+        delta = {field: prediction.get(field) for field in PREDICTION_FIELDS}
+        with self._lock:
+            self._reset_after_fork()
+            event_subscribers = list(self._channels.get(event_id, ()))
+            all_subscribers = list(self._channels.get(ALL_EVENTS, ()))
+            tallies = None
+            if event_id in self._tallies:
+                confidence = prediction.get("confidence_score")
+                tally = self._tallies[event_id].setdefault(prediction.get("option_id"), [0, 0, 0.0])
+                tally[0] += 1
+                tally[1] += prediction.get("amount") or 0
+                tally[2] += models.DEFAULT_CONFIDENCE_SCORE if confidence is None else confidence
+                tallies = self._summarize(event_id)
+            self.published += 1
+        if not event_subscribers and not all_subscribers:
+            return 0
+        message = format_message("prediction", delta)
+        delivered = self._deliver(event_subscribers + all_subscribers, message)
+        if tallies is not None:
+            self._deliver(event_subscribers, format_message("tallies", tallies))
+        return delivered
+
+    def _deliver(self, subscribers, message):
+        delivered = 0
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+                delivered += 1
+            except queue.Full:
+                # Too far behind to catch up; drop its backlog and close the stream
+                while True:
+                    try:
+                        subscription.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                try:
+                    subscription.queue.put_nowait(None)
+                except queue.Full:
+                    pass
+                with self._lock:
+                    self.overflowed += 1
+        with self._lock:
+            self.delivered += delivered
+        return delivered
+
+    def stream(self, subscription, initial=(), heartbeat=EVENT_STREAM_HEARTBEAT, max_age=EVENT_STREAM_MAX_AGE):
+        """Yield a subscription's messages as Server-Sent Events text
+
+        Sends the reconnect delay and any initial messages first, then
+        queued messages as they arrive, with a comment line every
+        heartbeat seconds so proxies keep the idle connection open. Ends
+        after max_age seconds, or when the subscription overflows, and
+        unsubscribes when the client goes away.
+        """
+        try:
+            yield f"retry: {EVENT_STREAM_RETRY}\n\n"
+            for message in initial:
+                yield message
+            deadline = subscription.opened + max_age
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    message = subscription.queue.get(timeout=min(heartbeat, remaining))
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if message is None:
+                    break
+                yield message
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": EVENT_STREAM_ENABLED,
+                "subscribers": sum(len(subscribers) for subscribers in self._channels.values()),
+                "max_subscribers": self.max_subscribers,
+                "channels": len(self._channels),
+                "tracked_events": len(self._tallies),
+                "subscribed": self.subscribed,
+                "rejected": self.rejected,
+                "published": self.published,
+                "delivered": self.delivered,
+                "overflowed": self.overflowed
+            }
+
+
+event_broker = EventBroker()
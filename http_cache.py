@@ -0,0 +1,64 @@
+from flask import request, jsonify, make_response, current_app, json as flask_json
+import hashlib
+import json
+import os
+
+# Cache-Control policy per endpoint; clients revalidate with If-None-Match once max-age passes
+EVENTS_CACHE_CONTROL = os.getenv("EVENTS_CACHE_CONTROL", "public, max-age=15, stale-while-revalidate=30")
+EVENT_CACHE_CONTROL = os.getenv("EVENT_CACHE_CONTROL", "public, max-age=30, stale-while-revalidate=60")
+PREDICTIONS_CACHE_CONTROL = os.getenv("PREDICTIONS_CACHE_CONTROL", "private, no-cache")
+
+
+def make_etag(*parts):
+    """Hash JSON-serialisable parts into a strong ETag value (unquoted)"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def version_etag(rows, *extra):
+    """ETag from each row's (id, updated_at) version instead of its full content
+
+    Changes whenever a row is added, removed, reordered or updated, as long
+    as writes bump updated_at (a trigger does this for events).
+    """
+    return make_etag([(row.get("id"), row.get("updated_at") or row.get("created_at")) for row in rows], *extra)
+
+
+def is_fresh(etag):
+    """True if the request's If-None-Match already names this ETag"""
+    # RFC 7232: If-None-Match uses the weak comparison
+    return etag is not None and request.if_none_match.contains_weak(etag)
+
+
+def not_modified(etag, cache_control):
+    """Build an empty 304 response carrying the validator and caching policy"""
+    response = make_response("", 304)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+def cached_json_by_content(payload, cache_control, status=200):
+    """Like cached_json, for rows without an updated_at column: the ETag hashes the body
+
+    The payload is serialised once and the same bytes are hashed and sent.
+    """
+    body = flask_json.dumps(payload) + "\n"
+    etag = hashlib.blake2b(body.encode("utf-8"), digest_size=16).hexdigest()
+    if is_fresh(etag):
+        return not_modified(etag, cache_control)
+    response = current_app.response_class(body, status=status, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+def cached_json(payload, etag, cache_control, status=200):
+    """jsonify payload with an ETag and Cache-Control, or return 304 if the client has it"""
+    if is_fresh(etag):
+        return not_modified(etag, cache_control)
+    response = make_response(jsonify(payload), status)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    return response
@@ -0,0 +1,187 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import os
+import threading
+
+from structured_logging import get_logger
+
+logger = get_logger("image_variants")
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it originals are served as-is
+    Image = None
+
+# Configure resized image variants
+IMAGE_VARIANT_WIDTHS = tuple(sorted(int(w) for w in os.getenv("IMAGE_VARIANT_WIDTHS", "160,320,640,1280").split(",") if w.strip()))
+IMAGE_VARIANT_FORMAT = os.getenv("IMAGE_VARIANT_FORMAT", "webp").lower()  # "webp" or "jpeg"
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+IMAGE_VARIANT_WORKERS = int(os.getenv("IMAGE_VARIANT_WORKERS", "2"))
+IMAGE_VARIANT_WAIT = float(os.getenv("IMAGE_VARIANT_WAIT", "5"))  # seconds a request waits for a missing variant
+IMAGE_VARIANT_DIR = os.getenv("IMAGE_VARIANT_DIR", "variants")  # inside the upload directory
+
+VARIANT_SOURCE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+VARIANT_MIMETYPES = {"webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+def snap_width(width):
+    """Round a requested width up to the nearest configured variant width
+
+    Only IMAGE_VARIANT_WIDTHS are ever generated, so arbitrary ?w= values
+    cannot fill the disk with one file per width.
+    """
+    for candidate in IMAGE_VARIANT_WIDTHS:
+        if candidate >= width:
+            return candidate
+    return IMAGE_VARIANT_WIDTHS[-1]
+
+
+def render_variant(source_path, dest_path, width):
+    """Resize source_path to at most width pixels wide and re-encode it to dest_path
+
+    Images are never upscaled. The file is written under a temporary name
+    and renamed into place, so readers never see a partial variant.
+    """
+    with Image.open(source_path) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+        if IMAGE_VARIANT_FORMAT == "jpeg":
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        staging = f"{dest_path}.{threading.get_ident()}.tmp"
+        try:
+            image.save(staging, format=IMAGE_VARIANT_FORMAT.upper(), quality=IMAGE_VARIANT_QUALITY)
+            os.replace(staging, dest_path)
+        finally:
+            if os.path.exists(staging):
+                os.remove(staging)
+    return dest_path
+
+
+class VariantGenerator:
+    """Generates resized copies of uploads on a small worker pool
+
+    Variants are stored as <variant dir>/<stem>_w<width>.<format> and,
+    like the content-addressed originals, never change once written.
+    Concurrent requests for the same missing variant share one job
+    (single-flight), and uploads queue their variants without waiting.
+
+    Args:
+        workers (int): Worker threads for resizing
+        widths (tuple): Widths generated for every upload
+    """
+
+    def __init__(self, workers=IMAGE_VARIANT_WORKERS, widths=IMAGE_VARIANT_WIDTHS):
+        self.widths = widths
+        self.enabled = Image is not None and bool(widths)
+        self._workers = workers
+        self._executor = None
+        self._executor_pid = None
+        self._lock = threading.Lock()
+        self._inflight = {}  # dest_path -> Future
+        self.generated = 0
+        self.failed = 0
+        self.joined = 0
+
+    def variant_path(self, upload_dir, filename, width):
+        stem = os.path.splitext(filename)[0]
+        extension = "jpg" if IMAGE_VARIANT_FORMAT == "jpeg" else IMAGE_VARIANT_FORMAT
+        return os.path.join(upload_dir, IMAGE_VARIANT_DIR, f"{stem}_w{width}.{extension}")
+
+    def _get_executor(self):
+        # Worker threads don't survive a fork, so each process makes its own pool
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=self._workers, thread_name_prefix="image-variants")
+            self._executor_pid = os.getpid()
+            self._inflight = {}
+        return self._executor
+
+    def _run(self, source_path, dest_path, width):
+        try:
+            render_variant(source_path, dest_path, width)
+            with self._lock:
+                self.generated += 1
+            return dest_path
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logger.warning("Could not generate %s: %s", dest_path, e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(dest_path, None)
+
+    def submit(self, upload_dir, filename, width):
+        """Queue one variant unless it exists or is already being generated
+
+        Returns:
+            Future: Resolves to the variant's path, or None if it already exists
+        """
+        source_path = os.path.join(upload_dir, filename)
+        dest_path = self.variant_path(upload_dir, filename, width)
+        if os.path.exists(dest_path):
+            return None
+        with self._lock:
+            executor = self._get_executor()
+            future = self._inflight.get(dest_path)
+            if future is not None:
+                self.joined += 1
+                return future
+            os.makedirs(os.path.dirname(dest_path), exist_ok=True)
+            future = executor.submit(self._run, source_path, dest_path, width)
+            self._inflight[dest_path] = future
+            return future
+
+    def schedule_all(self, upload_dir, filename):
+        """Queue every configured width for a new upload, off the request thread"""
+        if not self.enabled or not filename.lower().endswith(VARIANT_SOURCE_EXTENSIONS):
+            return
+        for width in self.widths:
+            self.submit(upload_dir, filename, width)
+
+    def get(self, upload_dir, filename, width, wait=IMAGE_VARIANT_WAIT):
+        """Return the path of a variant, generating it on a miss
+
+        Args:
+            upload_dir (str): Directory holding the original
+            filename (str): The original's file name
+            width (int): Requested width; snapped to a configured width
+            wait (float): Seconds to wait for generation
+
+        Returns:
+            str: Path of the variant, or None to serve the original instead
+        """
+        if not self.enabled or not filename.lower().endswith(VARIANT_SOURCE_EXTENSIONS):
+            return None
+        if not os.path.isfile(os.path.join(upload_dir, filename)):
+            return None
+        width = snap_width(width)
+        dest_path = self.variant_path(upload_dir, filename, width)
+        if os.path.exists(dest_path):
+            return dest_path
+        future = self.submit(upload_dir, filename, width)
+        if future is None:
+            return dest_path
+        try:
+            return future.result(timeout=wait)
+        except FutureTimeoutError:
+            logger.debug("Variant %s not ready after %ss; serving original", dest_path, wait)
+            return None
+        except Exception:
+            return None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "widths": list(self.widths),
+                "in_flight": len(self._inflight),
+                "generated": self.generated,
+                "failed": self.failed,
+                "joined": self.joined
+            }
+
+
+variant_generator = VariantGenerator()
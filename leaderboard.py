@@ -0,0 +1,389 @@
+import math
+import os
+import random
+import threading
+import time
+
+from retry_policy import call_with_retry
+from structured_logging import get_logger
+from supabase_client import supabase
+
+logger = get_logger("leaderboard")
+
+# Configure the reputation leaderboard
+LEADERBOARD_ENABLED = os.getenv("LEADERBOARD_ENABLED", "1") == "1"
+LEADERBOARD_RECONCILE_INTERVAL = float(os.getenv("LEADERBOARD_RECONCILE_INTERVAL", "300"))  # seconds
+LEADERBOARD_PAGE_SIZE = int(os.getenv("LEADERBOARD_PAGE_SIZE", "1000"))  # profiles read per query
+LEADERBOARD_MAX_LIMIT = int(os.getenv("LEADERBOARD_MAX_LIMIT", "100"))
+LEADERBOARD_MAX_RADIUS = int(os.getenv("LEADERBOARD_MAX_RADIUS", "25"))
+LEADERBOARD_READY_WAIT = float(os.getenv("LEADERBOARD_READY_WAIT", "2"))  # seconds a request waits for the initial load
+
+# Enough levels for tens of millions of entries at p=0.5
+SKIPLIST_MAX_LEVELS = 24
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, levels):
+        self.key = key
+        self.next = [None] * levels
+        self.width = [0] * levels
+
+
+# Sorts after every real key
+_END = _Node((math.inf, ""), 0)
+
+
+def _random_level():
+    level = 1
+    while level < SKIPLIST_MAX_LEVELS and random.random() < 0.5:
+        level += 1
+    return level
+
+
+class RankingIndex:
+    """Order-statistic index of users by score, highest first
+
+    An indexable skip list: every forward link also stores how many
+    entries it skips, so inserting, removing, finding a user's rank and
+    finding the entry at a rank are all O(log n). Entries are ordered by
+    score descending and then by user ID, so tied users get consecutive
+    ranks in a stable order. Not thread-safe; Leaderboard holds a lock.
+    """
+
+    def __init__(self):
+        self._scores = {}  # user_id -> score
+        self._reset()
+
+    def _reset(self):
+        self._head = _Node(None, SKIPLIST_MAX_LEVELS)
+        self._head.next = [_END] * SKIPLIST_MAX_LEVELS
+        self._head.width = [1] * SKIPLIST_MAX_LEVELS
+
+    def __len__(self):
+        return len(self._scores)
+
+    def __contains__(self, user_id):
+        return user_id in self._scores
+
+    @staticmethod
+    def _key(user_id, score):
+        return (-score, user_id)
+
+    def score(self, user_id):
+        return self._scores.get(user_id)
+
+    def user_ids(self):
+        return list(self._scores)
+
+    def set(self, user_id, score):
+        """Insert a user or move them to their new score"""
+        old = self._scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            self._remove_key(self._key(user_id, old))
+        self._insert_key(self._key(user_id, score))
+        self._scores[user_id] = score
+
+    def remove(self, user_id):
+        old = self._scores.pop(user_id, None)
+        if old is not None:
+            self._remove_key(self._key(user_id, old))
+
+    def _insert_key(self, key):
+        chain = [None] * SKIPLIST_MAX_LEVELS
+        steps_at_level = [0] * SKIPLIST_MAX_LEVELS
+        node = self._head
+        for level in reversed(range(SKIPLIST_MAX_LEVELS)):
+            while node.next[level].key < key:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        levels = _random_level()
+        new = _Node(key, levels)
+        steps = 0
+        for level in range(levels):
+            previous = chain[level]
+            new.next[level] = previous.next[level]
+            previous.next[level] = new
+            new.width[level] = previous.width[level] - steps
+            previous.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(levels, SKIPLIST_MAX_LEVELS):
+            chain[level].width[level] += 1
+
+    def _remove_key(self, key):
+        chain = [None] * SKIPLIST_MAX_LEVELS
+        node = self._head
+        for level in reversed(range(SKIPLIST_MAX_LEVELS)):
+            while node.next[level].key < key:
+                node = node.next[level]
+            chain[level] = node
+        target = chain[0].next[0]
+        if target.key != key:
+            raise KeyError(key)
+        for level in range(len(target.next)):
+            previous = chain[level]
+            previous.width[level] += target.width[level] - 1
+            previous.next[level] = target.next[level]
+        for level in range(len(target.next), SKIPLIST_MAX_LEVELS):
+            chain[level].width[level] -= 1
+
+    def load(self, scores):
+        """Replace the contents with a {user_id: score} mapping in O(n log n)
+
+        Much faster than n inserts: the keys are sorted once and the levels
+        are linked in a single pass.
+        """
+        self._scores = dict(scores)
+        self._reset()
+        last = [self._head] * SKIPLIST_MAX_LEVELS
+        last_position = [0] * SKIPLIST_MAX_LEVELS
+        keys = sorted(self._key(user_id, score) for user_id, score in self._scores.items())
+        for position, key in enumerate(keys, 1):
+            node = _Node(key, _random_level())
+            for level in range(len(node.next)):
+                last[level].next[level] = node
+                last[level].width[level] = position - last_position[level]
+                last[level] = node
+                last_position[level] = position
+        for level in range(SKIPLIST_MAX_LEVELS):
+            last[level].next[level] = _END
+            last[level].width[level] = len(keys) + 1 - last_position[level]
+
+    def rank(self, user_id):
+        """Return the user's 1-based rank, or None if they are not indexed"""
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        key = self._key(user_id, score)
+        position = 0
+        node = self._head
+        for level in reversed(range(SKIPLIST_MAX_LEVELS)):
+            while node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        return position + 1
+
+    def range(self, start, count):
+        """Return up to count (rank, user_id, score) tuples starting at 0-based position start"""
+        if start < 0 or count <= 0 or start >= len(self._scores):
+            return []
+        # Walk down to the node at position start + 1, then along the bottom level
+        remaining = start + 1
+        node = self._head
+        for level in reversed(range(SKIPLIST_MAX_LEVELS)):
+            while node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        entries = []
+        rank = start + 1
+        while node is not _END and len(entries) < count:
+            negative_score, user_id = node.key
+            entries.append((rank, user_id, -negative_score))
+            rank += 1
+            node = node.next[0]
+        return entries
+
+
+class Leaderboard:
+    """Reputation ranking kept in memory and reconciled with user_profiles
+
+    Score changes made through this process are applied to the index as
+    they happen (record_score). A background thread re-reads every
+    profile's reputation_score every reconcile_interval seconds, which
+    loads the index at startup and picks up changes made by other worker
+    processes or directly in the database. Reads never query the table.
+
+    Args:
+        reconcile_interval (float): Seconds between reconciliations
+        page_size (int): Profiles read per query while reconciling
+    """
+
+    def __init__(self, reconcile_interval=LEADERBOARD_RECONCILE_INTERVAL, page_size=LEADERBOARD_PAGE_SIZE):
+        self.reconcile_interval = reconcile_interval
+        self.page_size = page_size
+        self._index = RankingIndex()
+        self._lock = threading.Lock()
+        self._loaded = threading.Event()
+        # user_id -> (monotonic time, score) of changes recorded since the last reconciliation
+        self._recent = {}
+        self._reconciler = None
+        self._reconciler_pid = None
+        self.last_reconciled_at = None
+        self.last_reconcile_seconds = None
+        self.reconciliations = 0
+        self.corrections = 0
+        self.failures = 0
+
+    @property
+    def ready(self):
+        return self._loaded.is_set()
+
+    def record_score(self, user_id, score):
+        """Apply a score change made by this process"""
+        if not LEADERBOARD_ENABLED or not user_id:
+            return
+        score = score or 0
+        with self._lock:
+            self._recent[user_id] = (time.monotonic(), score)
+            if self._loaded.is_set():
+                self._index.set(user_id, score)
+
+    def record_user(self, user):
+        """Apply the reputation_score of a freshly written user_profiles row"""
+        if user and "reputation_score" in user:
+            self.record_score(user.get("id"), user.get("reputation_score"))
+
+    def _fetch_pages(self):
+        """Yield every (id, reputation_score) row of user_profiles in id order"""
+        after = None
+        while True:
+            query = supabase.table("user_profiles").select("id,reputation_score").order("id").limit(self.page_size)
+            if after is not None:
+                query = query.gt("id", after)
+            rows = call_with_retry(query.execute, "leaderboard_scan(user_profiles)", breaker_name="user_profiles").data or []
+            if rows:
+                yield rows
+            if len(rows) < self.page_size:
+                return
+            after = rows[-1]["id"]
+
+    def reconcile(self):
+        """Bring the index in line with user_profiles
+
+        The first run loads the whole table; later runs apply only the
+        differences, page by page, so readers are never blocked for long.
+        Users whose score changed in this process while the scan was
+        running keep their newer score.
+
+        Returns:
+            int: Number of entries added, moved or removed
+        """
+        started = time.monotonic()
+        corrections = 0
+        if not self._loaded.is_set():
+            scores = {}
+            for rows in self._fetch_pages():
+                for row in rows:
+                    scores[row["id"]] = row.get("reputation_score") or 0
+            index = RankingIndex()
+            index.load(scores)
+            with self._lock:
+                self._index = index
+                corrections = len(scores)
+                self._replay_recent(started)
+                self._loaded.set()
+        else:
+            seen = set()
+            for rows in self._fetch_pages():
+                with self._lock:
+                    for row in rows:
+                        user_id = row["id"]
+                        seen.add(user_id)
+                        if self._changed_since(user_id, started):
+                            continue
+                        score = row.get("reputation_score") or 0
+                        if self._index.score(user_id) != score:
+                            self._index.set(user_id, score)
+                            corrections += 1
+            with self._lock:
+                for user_id in [u for u in self._index.user_ids() if u not in seen]:
+                    if not self._changed_since(user_id, started):
+                        self._index.remove(user_id)
+                        corrections += 1
+                self._replay_recent(started)
+
+        self.reconciliations += 1
+        self.corrections += corrections
+        self.last_reconciled_at = time.time()
+        self.last_reconcile_seconds = round(time.monotonic() - started, 3)
+        logger.info("Leaderboard reconciled: %s users, %s corrections in %ss",
+                    len(self._index), corrections, self.last_reconcile_seconds)
+        return corrections
+
+    def _changed_since(self, user_id, started):
+        change = self._recent.get(user_id)
+        return change is not None and change[0] >= started
+
+    def _replay_recent(self, started):
+        # Changes recorded during the scan win over what the scan read; older ones are now in the table
+        for user_id, (changed_at, score) in self._recent.items():
+            if changed_at >= started:
+                self._index.set(user_id, score)
+        self._recent = {}
+
+    def ensure_started(self):
+        """Start the reconciliation thread for this process if it is not running"""
+        if not LEADERBOARD_ENABLED:
+            return
+        # Threads don't survive a fork, so each worker process starts its own
+        if self._reconciler_pid == os.getpid() and self._reconciler is not None and self._reconciler.is_alive():
+            return
+        with self._lock:
+            if self._reconciler_pid == os.getpid() and self._reconciler is not None and self._reconciler.is_alive():
+                return
+            if self._reconciler_pid != os.getpid():
+                self._index = RankingIndex()
+                self._recent = {}
+                self._loaded = threading.Event()
+            self._reconciler = threading.Thread(target=self._reconcile_forever, name="leaderboard-reconciler", daemon=True)
+            self._reconciler_pid = os.getpid()
+            self._reconciler.start()
+
+    def _reconcile_forever(self):
+        while True:
+            try:
+                self.reconcile()
+            except Exception as e:
+                self.failures += 1
+                logger.error("Error reconciling leaderboard: %s", e)
+            # Retry a failed initial load soon rather than after a full interval
+            time.sleep(self.reconcile_interval if self._loaded.is_set() else min(self.reconcile_interval, 5))
+
+    def wait_ready(self, timeout):
+        """Wait up to timeout seconds for the initial load; False if it is not ready (or disabled)"""
+        if not LEADERBOARD_ENABLED:
+            return False
+        self.ensure_started()
+        return self._loaded.wait(timeout)
+
+    def top(self, limit, offset=0):
+        """Return (entries, total) for ranks offset + 1 .. offset + limit"""
+        with self._lock:
+            return self._index.range(offset, limit), len(self._index)
+
+    def around(self, user_id, radius):
+        """Return (rank, entries, total): the user's rank and the radius users above and below them
+
+        rank is None (and entries empty) if the user is not ranked.
+        """
+        with self._lock:
+            rank = self._index.rank(user_id)
+            if rank is None:
+                return None, [], len(self._index)
+            start = max(0, rank - 1 - radius)
+            return rank, self._index.range(start, rank - 1 - start + radius + 1), len(self._index)
+
+    def score(self, user_id):
+        with self._lock:
+            return self._index.score(user_id)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": LEADERBOARD_ENABLED,
+                "ready": self._loaded.is_set(),
+                "users": len(self._index),
+                "reconciliations": self.reconciliations,
+                "corrections": self.corrections,
+                "failures": self.failures,
+                "last_reconciled_at": self.last_reconciled_at,
+                "last_reconcile_seconds": self.last_reconcile_seconds
+            }
+
+
+leaderboard = Leaderboard()
@@ -1,38 +1,79 @@
 from datetime import datetime, timedelta
-from supabase_client import get_supabase_client
+from supabase_client import supabase, supabase_admin
+from cache import TTLCache
+from retry_policy import call_with_retry
+from structured_logging import get_logger, log_context
+from nonce_store import nonce_store
+from leaderboard import leaderboard
 import os
 import uuid
 import json
 import time
+import base64
 
-# Configure retries
-MAX_RETRIES = 3
-RETRY_DELAY = 0.5  # seconds
+logger = get_logger("models")
 
 # Helper function for Supabase retries
-def execute_with_retry(query, operation_name="Supabase operation"):
-    """Execute a Supabase query with retry logic"""
-    last_error = None
-    for attempt in range(MAX_RETRIES):
+def execute_with_retry(query, operation_name="Supabase operation", table=None):
+    """Execute a Supabase query with retry logic
+    
+    Only retryable errors (network failures, timeouts, 5xx/429, transient
+    database errors) are retried, with jittered backoff bounded by the
+    current request's deadline. Each table has its own circuit breaker, so
+    calls fail fast with CircuitOpenError while it is open.
+    
+    Args:
+        query: A PostgREST request builder
+        operation_name (str): Label used in log messages
+        table (str, optional): Circuit breaker name; inferred from the query path if omitted
+        
+    Returns:
+        The query's APIResponse
+    """
+    if table is None:
+        table = (getattr(query, "path", "") or "").strip("/") or "supabase"
+    with log_context(operation_name=operation_name):
         try:
-            print(f"Attempt {attempt + 1} for {operation_name}")
-            result = query.execute()
-            print(f"Success on attempt {attempt + 1} for {operation_name}")
-            return result
+            return call_with_retry(query.execute, operation_name, breaker_name=table)
         except Exception as e:
-            last_error = e
-            print(f"Attempt {attempt + 1} failed for {operation_name}: {str(e)}")
-            if attempt < MAX_RETRIES - 1:
-                delay = RETRY_DELAY * (2 ** attempt)  # Exponential backoff
-                print(f"Retrying in {delay} seconds...")
-                time.sleep(delay)
-    
-    # If we get here, all retries failed
-    print(f"All {MAX_RETRIES} attempts failed for {operation_name}: {str(last_error)}")
-    raise last_error
+            logger.error("%s failed: %s", operation_name, e)
+            raise
+
+# Configure event listing pagination
+EVENTS_PAGE_SIZE = 50
+EVENTS_MAX_PAGE_SIZE = 100
+
+# Maximum number of IDs sent in a single in_() filter
+USER_BATCH_SIZE = 200
+
+# Maximum number of predictions accepted by one batch submission
+PREDICTION_BATCH_MAX_SIZE = int(os.getenv("PREDICTION_BATCH_MAX_SIZE", "50"))
+
+# Matches the predictions.confidence_score column default
+DEFAULT_CONFIDENCE_SCORE = 0.5
+
+# Configure the in-process event cache
+EVENT_CACHE_TTL = float(os.getenv("EVENT_CACHE_TTL", "30"))  # seconds
+EVENT_CACHE_MAX_SIZE = int(os.getenv("EVENT_CACHE_MAX_SIZE", "256"))
+
+# Read-through cache in front of get_events / get_event_by_id
+event_cache = TTLCache(max_size=EVENT_CACHE_MAX_SIZE, ttl=EVENT_CACHE_TTL)
 
-# Get Supabase client
-supabase = get_supabase_client()
+def invalidate_event_cache():
+    """Drop all cached event reads after an event write"""
+    # Any write can change every listing (ordering, category), so clear everything
+    event_cache.clear()
+
+# Configure the per-user stats cache
+USER_STATS_CACHE_TTL = float(os.getenv("USER_STATS_CACHE_TTL", "15"))  # seconds
+USER_STATS_CACHE_MAX_SIZE = int(os.getenv("USER_STATS_CACHE_MAX_SIZE", "1024"))
+
+# Cache in front of get_user_stats, keyed by ("stats", user_id)
+user_stats_cache = TTLCache(max_size=USER_STATS_CACHE_MAX_SIZE, ttl=USER_STATS_CACHE_TTL)
+
+def invalidate_user_stats(user_id):
+    """Drop a user's cached stats after they make a prediction"""
+    user_stats_cache.invalidate(("stats", user_id))
 
 # User related functions
 def get_user_by_id(user_id):
@@ -48,27 +89,58 @@ def get_user_by_id(user_id):
         return None
         
     try:
-        print(f"Looking up user with ID: {user_id}")
+        logger.debug("Looking up user with ID: %s", user_id)
         
         # Query the user_profiles table
         query = supabase.table("user_profiles").select("*").eq("id", user_id)
         result = execute_with_retry(query, f"get_user_by_id({user_id})")
         
         if not result.data or len(result.data) == 0:
-            print(f"No user found with ID: {user_id}")
+            logger.debug("No user found with ID: %s", user_id)
             return None
             
         user_data = result.data[0]  # Get the first matching user
-        print(f"Found user: {user_data.get('username')} with ID: {user_id}")
+        logger.debug("Found user: %s with ID: %s", user_data.get('username'), user_id)
         return user_data
         
     except Exception as e:
         error_msg = f"Error in get_user_by_id for {user_id}: {str(e)}"
-        print(error_msg)
-        import traceback
-        traceback.print_exc()
+        logger.exception("%s", error_msg)
         return None
 
+def get_users_by_ids(user_ids):
+    """Retrieve many users with a single query
+    
+    Args:
+        user_ids (iterable): IDs of the users to retrieve; duplicates and empty values are ignored
+        
+    Returns:
+        dict: Mapping of user ID to user data for every user that was found
+    """
+    ids = list(dict.fromkeys(user_id for user_id in user_ids if user_id))
+    if not ids:
+        return {}
+        
+    users = {}
+    try:
+        logger.debug("Looking up %s users by ID", len(ids))
+        
+        # One in_() query per chunk keeps the request URL within server limits
+        for start in range(0, len(ids), USER_BATCH_SIZE):
+            chunk = ids[start:start + USER_BATCH_SIZE]
+            query = supabase.table("user_profiles").select("*").in_("id", chunk)
+            result = execute_with_retry(query, f"get_users_by_ids({len(chunk)} ids)")
+            for user in result.data or []:
+                users[user["id"]] = user
+                
+        logger.debug("Found %s of %s users", len(users), len(ids))
+        return users
+        
+    except Exception as e:
+        error_msg = f"Error in get_users_by_ids: {str(e)}"
+        logger.exception("%s", error_msg)
+        return users
+
 def get_user_by_wallet(wallet_address):
     """Get user by wallet address
     
@@ -83,24 +155,22 @@ def get_user_by_wallet(wallet_address):
         
     try:
         wallet_address = wallet_address.lower().strip()
-        print(f"Looking up user with wallet: {wallet_address}")
+        logger.debug("Looking up user with wallet: %s", wallet_address)
         
         query = supabase.table("user_profiles").select("*").eq("wallet_address", wallet_address)
         result = execute_with_retry(query, f"get_user_by_wallet({wallet_address})")
         
         if not result.data or len(result.data) == 0:
-            print(f"No user found with wallet: {wallet_address}")
+            logger.debug("No user found with wallet: %s", wallet_address)
             return None
             
         user = result.data[0]  # Get the first matching user
-        print(f"Found user: {user.get('id')} for wallet: {wallet_address}")
+        logger.debug("Found user: %s for wallet: %s", user.get('id'), wallet_address)
         return user
         
     except Exception as e:
         error_msg = f"Error in get_user_by_wallet for {wallet_address}: {str(e)}"
-        print(error_msg)
-        import traceback
-        traceback.print_exc()
+        logger.exception("%s", error_msg)
         return None
 
 def create_user(username, wallet_address=None, profile_image_url=None, bio=None, email=None):
@@ -117,7 +187,7 @@ def create_user(username, wallet_address=None, profile_image_url=None, bio=None,
         dict: The created user data if successful, None otherwise
     """
     try:
-        print(f"Creating new user with username: {username}, wallet: {wallet_address}")
+        logger.debug("Creating new user with username: %s, wallet: %s", username, wallet_address)
         
         # Validate required fields
         if not username:
@@ -132,7 +202,7 @@ def create_user(username, wallet_address=None, profile_image_url=None, bio=None,
         if wallet_address:
             existing_user = get_user_by_wallet(wallet_address)
             if existing_user:
-                print(f"User already exists with wallet: {wallet_address}")
+                logger.debug("User already exists with wallet: %s", wallet_address)
                 return existing_user
         
         # Generate a unique email if not provided
@@ -148,12 +218,12 @@ def create_user(username, wallet_address=None, profile_image_url=None, bio=None,
             
             if is_dev_mode:
                 # In development mode, create a mock user without using Supabase Auth
-                print(f"DEVELOPMENT MODE: Creating mock user with wallet: {wallet_address}")
+                logger.info("DEVELOPMENT MODE: Creating mock user with wallet: %s", wallet_address)
                 user_id = str(uuid.uuid4())
-                print(f"Created mock user with ID: {user_id}")
+                logger.info("Created mock user with ID: %s", user_id)
             else:
                 # In production, use the Supabase Auth API (requires admin privileges)
-                print(f"Creating auth user with email: {email}")
+                logger.debug("Creating auth user with email: %s", email)
                 auth_response = supabase.auth.admin.create_user({
                     "email": email,
                     "email_confirm": True,  # Auto-confirm the email
@@ -169,23 +239,23 @@ def create_user(username, wallet_address=None, profile_image_url=None, bio=None,
                     raise Exception(f"Failed to create auth user: {error_msg}")
                     
                 user_id = auth_response.user.id
-                print(f"Created auth user with ID: {user_id}")
+                logger.debug("Created auth user with ID: %s", user_id)
             
         except Exception as auth_error:
-            print(f"Error creating auth user: {str(auth_error)}")
+            logger.error("Error creating auth user: %s", auth_error)
             
             # In development mode, fall back to creating a mock user
             if os.environ.get('FLASK_ENV') == 'development' or os.environ.get('FLASK_DEBUG') == '1':
-                print("DEVELOPMENT FALLBACK: Creating mock user due to auth error")
+                logger.warning("DEVELOPMENT FALLBACK: Creating mock user due to auth error")
                 user_id = str(uuid.uuid4())
-                print(f"Created mock user with ID: {user_id}")
+                logger.info("Created mock user with ID: %s", user_id)
             else:
                 raise Exception(f"Authentication service error: {str(auth_error)}")
                 
             if 'user_id' not in locals():
                 raise Exception(f"Failed to create user: {str(auth_error)}")
                 
-            print(f"Created auth user with ID: {user_id}")
+            logger.debug("Created auth user with ID: %s", user_id)
             
         
         # Prepare user profile data
@@ -204,7 +274,7 @@ def create_user(username, wallet_address=None, profile_image_url=None, bio=None,
         
         # Insert user profile into the database
         try:
-            print(f"Creating user profile for ID: {user_id}")
+            logger.debug("Creating user profile for ID: %s", user_id)
             
             # Check if we're in development mode
             is_dev_mode = os.environ.get('FLASK_ENV') == 'development' or os.environ.get('FLASK_DEBUG') == '1'
@@ -215,10 +285,10 @@ def create_user(username, wallet_address=None, profile_image_url=None, bio=None,
                     try:
                         existing_profiles = supabase.table("user_profiles").select("*").eq("wallet_address", wallet_address).execute()
                         if existing_profiles.data and len(existing_profiles.data) > 0:
-                            print(f"Found existing profile for wallet: {wallet_address}")
+                            logger.debug("Found existing profile for wallet: %s", wallet_address)
                             return existing_profiles.data[0]
                     except Exception as e:
-                        print(f"Error checking for existing profile: {str(e)}")
+                        logger.error("Error checking for existing profile: %s", e)
             
             # Proceed with creating the profile
             query = supabase.table("user_profiles").insert(user_data)
@@ -227,15 +297,16 @@ def create_user(username, wallet_address=None, profile_image_url=None, bio=None,
             if not result.data or len(result.data) == 0:
                 raise Exception(f"No data returned when creating user profile")
                 
-            print(f"Created user profile successfully: {result.data[0].get('id')}")
+            logger.debug("Created user profile successfully: %s", result.data[0].get('id'))
+            leaderboard.record_user(result.data[0])
             return result.data[0]
             
         except Exception as profile_error:
-            print(f"Error creating user profile: {str(profile_error)}")
+            logger.error("Error creating user profile: %s", profile_error)
             
             # In development mode, return mock profile data
             if os.environ.get('FLASK_ENV') == 'development' or os.environ.get('FLASK_DEBUG') == '1':
-                print("DEVELOPMENT FALLBACK: Returning mock user profile")
+                logger.warning("DEVELOPMENT FALLBACK: Returning mock user profile")
                 mock_profile = {
                     "id": user_id,
                     "username": username,
@@ -256,17 +327,15 @@ def create_user(username, wallet_address=None, profile_image_url=None, bio=None,
             # Attempt to clean up the auth user if profile creation fails
             if 'user_id' in locals() and user_id:
                 try:
-                    print(f"Cleaning up auth user {user_id} after profile creation failed")
+                    logger.warning("Cleaning up auth user %s after profile creation failed", user_id)
                     supabase.auth.admin.delete_user(user_id)
                 except Exception as cleanup_error:
-                    print(f"Error during cleanup of auth user: {str(cleanup_error)}")
+                    logger.error("Error during cleanup of auth user: %s", cleanup_error)
             
             raise Exception(f"Failed to create user profile: {str(profile_error)}")
         
     except Exception as e:
-        print(f"Error in create_user: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in create_user: %s", e)
         raise  # Re-raise the exception with the full traceback
 
 def update_user(user_id, data):
@@ -286,7 +355,7 @@ def update_user(user_id, data):
         raise ValueError("user_id and data are required")
         
     try:
-        print(f"Updating user {user_id} with data: {data}")
+        logger.debug("Updating user %s with data: %s", user_id, data)
         
         # Create a copy of the data to avoid modifying the input
         update_data = data.copy()
@@ -299,7 +368,7 @@ def update_user(user_id, data):
         
         # If there's nothing to update, return early
         if not update_data:
-            print("No valid fields to update")
+            logger.debug("No valid fields to update")
             return get_user_by_id(user_id)
             
         # Update the user profile in the database
@@ -319,64 +388,171 @@ def update_user(user_id, data):
                     auth_update['email'] = update_data['email']
                     
                 if auth_update:
-                    print(f"Updating auth user {user_id} with: {auth_update}")
+                    logger.debug("Updating auth user %s with: %s", user_id, auth_update)
                     supabase.auth.admin.update_user_by_id(user_id, auth_update)
                     
             except Exception as auth_error:
-                print(f"Warning: Failed to update auth user: {str(auth_error)}")
+                logger.warning("Failed to update auth user: %s", auth_error)
                 # Don't fail the whole operation if auth update fails
                 
         # Return the updated user data
         updated_user = result.data[0]
-        print(f"Successfully updated user {user_id}")
+        leaderboard.record_user(updated_user)
+        logger.debug("Successfully updated user %s", user_id)
         return updated_user
         
     except Exception as e:
         error_msg = f"Error updating user {user_id}: {str(e)}"
-        print(error_msg)
-        import traceback
-        traceback.print_exc()
+        logger.exception("%s", error_msg)
         raise Exception(error_msg)
 
 # Event related functions
-def get_events(category=None):
-    """Get all events, optionally filtered by category"""
+def encode_events_cursor(event):
+    """Build an opaque keyset cursor pointing just past the given event
+    
+    Args:
+        event (dict): The last event of the current page
+        
+    Returns:
+        str: URL-safe cursor encoding the event's (created_at, id)
+    """
+    raw = json.dumps([event["created_at"], event["id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_events_cursor(cursor):
+    """Decode a cursor produced by encode_events_cursor
+    
+    Args:
+        cursor (str): The opaque cursor sent by the client
+        
+    Returns:
+        tuple: (created_at, id) of the last event of the previous page
+        
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, event_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(created_at, str) or not isinstance(event_id, str):
+        raise ValueError("Invalid cursor")
+    # Both values are interpolated into the PostgREST filter, so only accept
+    # a real timestamp and UUID
     try:
-        # Build query
-        query = supabase.table("events").select("*")
+        created_at = datetime.fromisoformat(created_at).isoformat()
+        event_id = str(uuid.UUID(event_id))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    return created_at, event_id
+
+def keyset_page(query, limit, after, operation_name):
+    """Fetch one page of a query in (created_at, id) descending order
+    
+    Args:
+        query: A PostgREST select builder with its filters applied
+        limit (int): Maximum number of rows to return
+        after (tuple, optional): (created_at, id) of the last row of the previous page
+        operation_name (str): Label used in log messages
         
-        # First check if the category column exists in the table schema
-        # For now we'll assume it doesn't and avoid filtering by it
+    Returns:
+        tuple: (rows, next_cursor), next_cursor being None on the last page
+    """
+    # Keyset pagination on (created_at, id): only rows strictly after the cursor
+    if after:
+        created_at, row_id = after
+        # postgrest-py 0.10 has no or_(), so add PostgREST's "or" parameter directly
+        query.params = query.params.add(
+            "or",
+            f'(created_at.lt."{created_at}",'
+            f'and(created_at.eq."{created_at}",id.lt."{row_id}"))'
+        )
         
-        # Add category filter if provided - commented out for now
-        # Only filter by category if it's a valid value and the column exists
-        # We'll need to update the table schema to include a category column
-        # if category and category != "all":
-        #     query = query.eq("category", category)
-            
-        # Order by created_at descending
-        query = query.order("created_at", desc=True)
+    # Order by created_at descending with id as tie-breaker. PostgREST takes
+    # both in one order parameter, and order() would add a second one
+    query.params = query.params.set("order", "created_at.desc,id.desc")
+    
+    # Fetch one extra row to know whether another page exists
+    query = query.limit(limit + 1)
+    
+    rows = execute_with_retry(query, operation_name).data or []
+    page = rows[:limit]
+    next_cursor = encode_events_cursor(page[-1]) if len(rows) > limit else None
+    return page, next_cursor
+
+def fetch_events_page(category=None, limit=EVENTS_PAGE_SIZE, after=None):
+    """Query one page of events without caching or fallbacks
+    
+    Returns:
+        dict: {"events": [...], "next_cursor": str or None}
+    """
+    query = supabase.table("events").select("*")
+    
+    # Filter in the database so events_category_idx can be used
+    if category:
+        query = query.eq("category", category)
         
-        # Log the query for debugging
-        print(f"Executing Supabase query: events table, category={category if category else 'None'}")
+    events, next_cursor = keyset_page(query, limit, after, f"get_events(category={category})")
+    return {"events": events, "next_cursor": next_cursor}
+
+def iter_event_pages(category=None, cursor=None, page_size=EVENTS_MAX_PAGE_SIZE):
+    """Yield every event after cursor, newest first, one keyset page at a time
+    
+    Only one page is held in memory. Pages bypass the event cache so a long
+    listing does not evict the hot entries.
+    
+    Yields:
+        list: One page of event rows
+        
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    if category == "all":
+        category = None
+    after = decode_events_cursor(cursor) if cursor else None
+    while True:
+        page = fetch_events_page(category, page_size, after)
+        if page["events"]:
+            yield page["events"]
+        if not page["next_cursor"]:
+            return
+        after = decode_events_cursor(page["next_cursor"])
+
+def get_events(category=None, limit=EVENTS_PAGE_SIZE, cursor=None):
+    """Get a page of events, newest first, optionally filtered by category
+    
+    Args:
+        category (str, optional): Only return events in this category ("all" disables the filter)
+        limit (int, optional): Maximum number of events to return
+        cursor (str, optional): next_cursor value from the previous page
         
-        # Execute query
-        result = execute_with_retry(query, f"get_events(category={category})")
+    Returns:
+        dict: {"events": [...], "next_cursor": str or None}
         
-        # If we have results but still want to filter by category in memory, do it here
-        if category and category != "all" and result.data:
-            # Check if any events actually have a category field before filtering
-            if any('category' in event for event in result.data):
-                filtered_data = [event for event in result.data if event.get('category') == category]
-                print(f"Filtered {len(result.data)} events to {len(filtered_data)} events with category '{category}'")
-                return filtered_data
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    if category == "all":
+        category = None
+    limit = max(1, min(int(limit), EVENTS_MAX_PAGE_SIZE))
+    after = decode_events_cursor(cursor) if cursor else None
+    
+    cache_key = ("events", category, limit, cursor)
+    cached = event_cache.get(cache_key)
+    if cached is not None:
+        return cached
         
-        return result.data
+    try:
+        logger.debug("Executing Supabase query: events table, category=%s, limit=%s, cursor=%s", category if category else 'None', limit, cursor)
+        page = fetch_events_page(category, limit, after)
+        event_cache.set(cache_key, page)
+        return page
     except Exception as e:
-        print(f"Error in get_events: {str(e)}")
+        logger.error("Error in get_events: %s", e)
         # Return mock events for testing if there's a database error
-        if category == "crypto":
-            return [{
+        if category == "crypto" and not cursor:
+            return {"events": [{
                 "id": "mock-event-1",
                 "title": "Bitcoin Price Prediction",
                 "description": "Predict the price of Bitcoin by end of month",
@@ -384,17 +560,23 @@ def get_events(category=None):
                 "created_at": datetime.now().isoformat(),
                 "end_time": (datetime.now() + timedelta(days=10)).isoformat(),
                 "options": [{"value": "OVER_50K", "label": "Over $50K"}, {"value": "UNDER_50K", "label": "Under $50K"}]
-            }]
-        return []
+            }], "next_cursor": None}
+        return {"events": [], "next_cursor": None}
 
 def get_event_by_id(event_id):
     """Get a specific event by ID"""
+    cache_key = ("event", event_id)
+    cached = event_cache.get(cache_key)
+    if cached is not None:
+        return cached
+        
     try:
         query = supabase.table("events").select("*").eq("id", event_id)
         result = execute_with_retry(query, f"get_event_by_id({event_id})")
+        event_cache.set(cache_key, result.data)
         return result.data
     except Exception as e:
-        print(f"Error in get_event_by_id: {str(e)}")
+        logger.error("Error in get_event_by_id: %s", e)
         return []
 
 def create_event(title, description, start_time, end_time, options, created_by, category=None):
@@ -420,39 +602,41 @@ def create_event(title, description, start_time, end_time, options, created_by,
         if category:
             event_data["category"] = category
         
-        print(f"Creating event in Supabase: {title}, ID: {event_id}")
-        print(f"Event data: {event_data}")
+        logger.debug("Creating event in Supabase: %s, ID: %s", title, event_id)
+        logger.debug("Event data: %s", event_data)
         
         # Try to insert the event
         try:
             query = supabase.table("events").insert(event_data)
             result = execute_with_retry(query, f"create_event({title})")
-            print(f"Successfully created event in Supabase: {title}, ID: {event_id}")
+            logger.debug("Successfully created event in Supabase: %s, ID: %s", title, event_id)
+            invalidate_event_cache()
             return result.data
         except Exception as supabase_error:
-            print(f"Supabase insert error: {str(supabase_error)}")
+            logger.error("Supabase insert error: %s", supabase_error)
             
             # Check if we have a conflict error
             if '409' in str(supabase_error) or 'conflict' in str(supabase_error).lower():
                 # Try updating instead
-                print(f"Attempting to update existing event: {event_id}")
+                logger.debug("Attempting to update existing event: %s", event_id)
                 try:
                     update_query = supabase.table("events").update(event_data).eq("id", event_id)
                     update_result = execute_with_retry(update_query, f"update_event({title})")
-                    print(f"Successfully updated event: {title}, ID: {event_id}")
+                    logger.debug("Successfully updated event: %s, ID: %s", title, event_id)
+                    invalidate_event_cache()
                     return update_result.data
                 except Exception as update_error:
-                    print(f"Update attempt failed: {str(update_error)}")
+                    logger.warning("Update attempt failed: %s", update_error)
                     # Continue to mock response
             
             # If all else fails, return a mock response
             raise Exception(f"Failed to insert/update event: {str(supabase_error)}")
             
     except Exception as e:
-        print(f"Error in create_event: {str(e)}")
+        logger.error("Error in create_event: %s", e)
         # Return a mock event for now to avoid breaking the flow
         mock_event_id = str(uuid.uuid4())
-        print(f"Returning mock event: {title}, ID: {mock_event_id}")
+        logger.info("Returning mock event: %s, ID: %s", title, mock_event_id)
         return [{
             "id": mock_event_id,
             "title": title,
@@ -478,16 +662,17 @@ def update_event(event_id, data):
         # Execute update
         query = supabase.table("events").update(update_data).eq("id", event_id)
         result = execute_with_retry(query, f"update_event({event_id})")
+        invalidate_event_cache()
         return result.data
     except Exception as e:
-        print(f"Error in update_event: {str(e)}")
+        logger.error("Error in update_event: %s", e)
         return []
         
 # Create a mock event for testing purposes
 def create_mock_event(title, description, start_time, end_time, options, created_by):
     """Create a mock event without touching Supabase - for testing only"""
     try:
-        print(f"Creating MOCK event (no Supabase): {title}")
+        logger.info("Creating MOCK event (no Supabase): %s", title)
         
         # Generate a UUID for the event
         event_id = str(uuid.uuid4())
@@ -505,16 +690,14 @@ def create_mock_event(title, description, start_time, end_time, options, created
             "options": options or []
         }]
     except Exception as e:
-        print(f"Error in create_mock_event: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in create_mock_event: %s", e)
         return []
 
 def create_event(title, description, start_time, end_time, options, created_by):
     """Create a new event"""
     try:
         # Print what we're trying to insert for debugging
-        print(f"Creating event with title: {title}, end_time: {end_time}")
+        logger.debug("Creating event with title: %s, end_time: %s", title, end_time)
         
         # IMPORTANT: Use the mock event creation instead of trying Supabase
         # This is a temporary measure until Supabase issues are resolved
@@ -576,17 +759,25 @@ def create_event(title, description, start_time, end_time, options, created_by):
             }]
         '''
     except Exception as e:
-        print(f"Error in create_event model function: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception("Error in create_event model function: %s", e)
         return []
 
 def update_event(event_id, data):
     """Update an event"""
     data["updated_at"] = datetime.now().isoformat()
-    return supabase.table("events").update(data).eq("id", event_id).execute().data
+    result = supabase.table("events").update(data).eq("id", event_id).execute().data
+    invalidate_event_cache()
+    return result
 
 # Prediction related functions
+class DuplicatePredictionError(Exception):
+    """Raised when a user already has a prediction for the event"""
+
+    def __init__(self, event_id, user_id):
+        super().__init__(f"User {user_id} already has a prediction for event {event_id}")
+        self.event_id = event_id
+        self.user_id = user_id
+
 def get_predictions(user_id=None, event_id=None):
     """Get predictions, optionally filtered by user_id or event_id"""
     query = supabase.table("predictions").select("*")
@@ -596,25 +787,404 @@ def get_predictions(user_id=None, event_id=None):
         query = query.eq("event_id", event_id)
     return query.order("created_at", desc=True).execute().data
 
+def get_user_prediction_for_event(user_id, event_id):
+    """Get a user's prediction for a specific event
+    
+    Returns:
+        list: The prediction row, or an empty list if the user has not predicted
+    """
+    query = supabase.table("predictions").select("*").eq("user_id", user_id).eq("event_id", event_id).limit(1)
+    return execute_with_retry(query, f"get_user_prediction_for_event({user_id}, {event_id})").data
+
+def get_user_predictions_for_events(user_id, event_ids):
+    """Get a user's predictions for many events with one query per USER_BATCH_SIZE events
+    
+    Returns:
+        dict: Mapping of event ID to the user's prediction on that event
+    """
+    ids = list(dict.fromkeys(event_id for event_id in event_ids if event_id))
+    predictions = {}
+    for start in range(0, len(ids), USER_BATCH_SIZE):
+        chunk = ids[start:start + USER_BATCH_SIZE]
+        query = supabase.table("predictions").select("*").eq("user_id", user_id).in_("event_id", chunk)
+        result = execute_with_retry(query, f"get_user_predictions_for_events({user_id}, {len(chunk)} events)")
+        for prediction in result.data or []:
+            predictions[prediction["event_id"]] = prediction
+    return predictions
+
+def get_events_by_ids(event_ids, columns="*"):
+    """Retrieve many events with one query per USER_BATCH_SIZE IDs
+    
+    Returns:
+        dict: Mapping of event ID to event data for every event that was found
+    """
+    ids = list(dict.fromkeys(event_id for event_id in event_ids if event_id))
+    events = {}
+    for start in range(0, len(ids), USER_BATCH_SIZE):
+        chunk = ids[start:start + USER_BATCH_SIZE]
+        query = supabase.table("events").select(columns).in_("id", chunk)
+        result = execute_with_retry(query, f"get_events_by_ids({len(chunk)} ids)")
+        for event in result.data or []:
+            events[event["id"]] = event
+    return events
+
+def iter_prediction_pages(user_id=None, event_id=None, page_size=EVENTS_MAX_PAGE_SIZE):
+    """Yield predictions newest first, optionally filtered, one keyset page at a time
+    
+    Yields:
+        list: One page of prediction rows
+    """
+    after = None
+    while True:
+        query = supabase.table("predictions").select("*")
+        if user_id:
+            query = query.eq("user_id", user_id)
+        if event_id:
+            query = query.eq("event_id", event_id)
+        rows, next_cursor = keyset_page(query, page_size, after, f"iter_prediction_pages({user_id}, {event_id})")
+        if rows:
+            yield rows
+        if not next_cursor:
+            return
+        after = decode_events_cursor(next_cursor)
+
 def get_prediction_by_id(prediction_id):
     """Get a specific prediction by ID"""
     return supabase.table("predictions").select("*").eq("id", prediction_id).execute().data
 
-def create_prediction(event_id, user_id, option, amount=0):
-    """Create a new prediction"""
+def create_prediction(event_id, user_id, option_value, amount=0, confidence_score=None):
+    """Create a new prediction
+    
+    Inserts without checking for an existing prediction first; the
+    UNIQUE(event_id, user_id) constraint decides, so concurrent submissions
+    cannot both succeed. The event's option tallies are updated by a
+    trigger on the predictions table, in the same transaction as the insert.
+    
+    Returns:
+        list: The created prediction row, or None if the insert failed
+        
+    Raises:
+        DuplicatePredictionError: If the user already predicted on this event
+    """
     prediction_data = {
         "event_id": event_id,
         "user_id": user_id,
-        "option_id": option,  # Changed to option_id to match DB schema
+        "option_id": option_value,  # Changed to option_id to match DB schema
         "amount": amount,
-        "created_at": datetime.now().isoformat(),
-        "updated_at": datetime.now().isoformat()
+        "created_at": datetime.now().isoformat()
     }
+    if confidence_score is not None:
+        prediction_data["confidence_score"] = confidence_score
     try:
-        return execute_with_retry(supabase.table("predictions").insert(prediction_data), f"create_prediction({event_id}, {user_id})").data
+        inserted = create_predictions([prediction_data])
     except Exception as e:
-        print(f"Error in create_prediction: {str(e)}")
+        logger.error("Error in create_prediction: %s", e)
         return None
+    if not inserted:
+        raise DuplicatePredictionError(event_id, user_id)
+    return inserted
+
+def create_predictions(rows):
+    """Insert many predictions in a single statement
+    
+    Rows that would violate UNIQUE(event_id, user_id) are skipped by the
+    database (ON CONFLICT DO NOTHING) instead of failing the whole insert.
+    Every row must have the same keys.
+    
+    Args:
+        rows (list): Prediction rows to insert
+        
+    Returns:
+        list: The rows that were inserted
+    """
+    if not rows:
+        return []
+    query = supabase.table("predictions").upsert(rows, ignore_duplicates=True, on_conflict="event_id,user_id")
+    inserted = execute_with_retry(query, f"create_predictions({len(rows)} rows)").data or []
+    for user_id in {row["user_id"] for row in rows}:
+        invalidate_user_stats(user_id)
+    return inserted
+
+def event_option_values(event):
+    """Return the option ids and values a prediction on this event may use (empty means any)"""
+    values = set()
+    for option in event.get("options") or []:
+        if isinstance(option, dict):
+            values.update(str(option[key]) for key in ("id", "value") if option.get(key) is not None)
+        else:
+            values.add(str(option))
+    return values
+
+def parse_prediction_item(item):
+    """Validate one batch item and normalize it into a predictions row (without user_id)
+    
+    Raises:
+        ValueError: If the item is malformed
+    """
+    if not isinstance(item, dict):
+        raise ValueError("Prediction must be an object")
+    event_id = item.get("event_id")
+    option_value = item.get("option_value") or item.get("option_id")  # Support both formats
+    if not event_id or not option_value:
+        raise ValueError("Event ID and option value are required")
+    try:
+        event_id = str(uuid.UUID(str(event_id)))
+    except ValueError:
+        raise ValueError("Event ID must be a UUID")
+    try:
+        amount = int(item.get("amount") or 0)
+    except (TypeError, ValueError):
+        raise ValueError("Amount must be an integer")
+    if amount < 0:
+        raise ValueError("Amount must not be negative")
+    confidence_score = item.get("confidence_score")
+    try:
+        confidence_score = DEFAULT_CONFIDENCE_SCORE if confidence_score is None else float(confidence_score)
+    except (TypeError, ValueError):
+        raise ValueError("Confidence score must be a number")
+    if not 0 <= confidence_score <= 1:
+        raise ValueError("Confidence score must be between 0 and 1")
+    return {
+        "event_id": event_id,
+        "option_id": str(option_value),
+        "amount": amount,
+        "confidence_score": confidence_score
+    }
+
+def check_event_open(event, now):
+    """Return why an event takes no more predictions, or None if it is open"""
+    if not event:
+        return "Event not found"
+    if event.get("is_resolved"):
+        return "Event is already resolved"
+    end_time = event.get("end_time")
+    if end_time:
+        try:
+            if datetime.fromisoformat(end_time.replace('Z', '+00:00')) <= now:
+                return "Event has ended"
+        except ValueError:
+            pass
+    return None
+
+def check_event_accepts_prediction(event, option_id, now):
+    """Return why a prediction on this event is invalid, or None if it is acceptable"""
+    error = check_event_open(event, now)
+    if error:
+        return error
+    options = event_option_values(event)
+    if options and option_id not in options:
+        return "Option is not valid for this event"
+    return None
+
+def create_predictions_batch(user_id, items):
+    """Validate and create many predictions for one user
+    
+    Costs one events lookup and one insert regardless of the batch size,
+    plus one lookup of existing predictions when some items are duplicates.
+    
+    Args:
+        user_id (str): The predicting user
+        items (list): Prediction payloads as accepted by POST /api/predictions
+        
+    Returns:
+        list: One result per item, in order, each with index, event_id and a
+            status of "created", "duplicate" or "invalid" (plus the
+            prediction or the error)
+    """
+    results = [None] * len(items)
+    pending = {}  # event_id -> (index, row)
+    for index, item in enumerate(items):
+        try:
+            row = parse_prediction_item(item)
+        except ValueError as e:
+            event_id = item.get("event_id") if isinstance(item, dict) else None
+            results[index] = {"index": index, "event_id": event_id, "status": "invalid", "error": str(e)}
+            continue
+        if row["event_id"] in pending:
+            results[index] = {"index": index, "event_id": row["event_id"], "status": "duplicate",
+                              "error": "Event appears more than once in this batch"}
+            continue
+        pending[row["event_id"]] = (index, row)
+    
+    now = datetime.now().astimezone()
+    events = get_events_by_ids(pending, columns="id,options,is_resolved,end_time")
+    rows = []
+    for event_id, (index, row) in list(pending.items()):
+        error = check_event_accepts_prediction(events.get(event_id), row["option_id"], now)
+        if error:
+            results[index] = {"index": index, "event_id": event_id, "status": "invalid", "error": error}
+            del pending[event_id]
+            continue
+        row["user_id"] = user_id
+        row["created_at"] = datetime.now().isoformat()
+        rows.append(row)
+    
+    inserted = {prediction["event_id"]: prediction for prediction in create_predictions(rows)}
+    missing = [event_id for event_id in pending if event_id not in inserted]
+    existing = get_user_predictions_for_events(user_id, missing) if missing else {}
+    
+    for event_id, (index, _) in pending.items():
+        if event_id in inserted:
+            results[index] = {"index": index, "event_id": event_id, "status": "created", "prediction": inserted[event_id]}
+        else:
+            results[index] = {"index": index, "event_id": event_id, "status": "duplicate",
+                              "error": "User already has a prediction for this event",
+                              "prediction": existing.get(event_id)}
+    return results
+
+def count_predictions(user_id, resolved=None):
+    """Count a user's predictions without downloading them
+    
+    Sends count=exact with limit=0, so PostgREST returns only the total in
+    its Content-Range header.
+    
+    Args:
+        user_id (str): The user whose predictions are counted
+        resolved (bool, optional): Only count predictions on resolved (True)
+            or unresolved (False) events
+            
+    Returns:
+        int: Number of matching predictions
+    """
+    query = count_predictions_query(supabase, user_id, resolved)
+    result = execute_with_retry(query, f"count_predictions({user_id}, resolved={resolved})")
+    return result.count or 0
+
+def count_predictions_query(client, user_id, resolved=None):
+    """Build the count query used by count_predictions, on a sync or async client"""
+    columns = "id" if resolved is None else "id,events!inner(is_resolved)"
+    query = client.table("predictions").select(columns, count="exact").eq("user_id", user_id)
+    if resolved is not None:
+        query = query.eq("events.is_resolved", "true" if resolved else "false")
+    return query.limit(0)
+
+def build_user_stats(row):
+    """Normalize a get_user_prediction_stats row into the profile's stats dict"""
+    resolved = row.get("resolved_predictions")
+    wins = row.get("wins")
+    return {
+        "total_predictions": row.get("total_predictions") or 0,
+        "active_predictions": row.get("active_predictions"),
+        "resolved_predictions": resolved,
+        "wins": wins,
+        "win_rate": round(wins / resolved, 4) if wins is not None and resolved else None,
+        "total_staked": row.get("total_staked")
+    }
+
+def build_fallback_stats(total, resolved):
+    """Stats from prediction counts alone, for when get_user_prediction_stats is missing"""
+    return build_user_stats({
+        "total_predictions": total,
+        "active_predictions": total - resolved,
+        "resolved_predictions": resolved
+    })
+
+def get_user_stats(user_id):
+    """Get prediction statistics for a user without fetching their predictions
+    
+    Uses the get_user_prediction_stats function (one aggregate query). If
+    it is not installed, falls back to count queries, which cannot provide
+    wins or total_staked. Results are cached for USER_STATS_CACHE_TTL
+    seconds and invalidated when the user makes a prediction.
+    
+    Args:
+        user_id (str): The user to summarize
+        
+    Returns:
+        dict: total_predictions, active_predictions, resolved_predictions,
+            wins, win_rate and total_staked
+    """
+    cache_key = ("stats", user_id)
+    cached = user_stats_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
+    try:
+        query = supabase.rpc("get_user_prediction_stats", {"p_user_id": user_id})
+        rows = execute_with_retry(query, f"get_user_stats({user_id})", table="predictions").data
+        stats = build_user_stats(rows[0] if rows else {})
+    except Exception as e:
+        logger.warning("Stats function unavailable, using count queries for %s: %s", user_id, e)
+        stats = build_fallback_stats(count_predictions(user_id), count_predictions(user_id, resolved=True))
+    
+    user_stats_cache.set(cache_key, stats)
+    return stats
+
+def summarize_tallies(event_id, tallies):
+    """Turn per-option tally rows into totals and each option's share of predictions
+    
+    Args:
+        event_id (str): The event the tallies belong to
+        tallies (list): Rows with option_id, prediction_count, total_amount and avg_confidence
+        
+    Returns:
+        dict: Totals plus one entry per option, most popular first
+    """
+    total_predictions = sum(t.get("prediction_count") or 0 for t in tallies)
+    total_amount = sum(t.get("total_amount") or 0 for t in tallies)
+    options = []
+    for tally in tallies:
+        count = tally.get("prediction_count") or 0
+        options.append({
+            "option_id": tally.get("option_id"),
+            "prediction_count": count,
+            "total_amount": tally.get("total_amount") or 0,
+            "avg_confidence": tally.get("avg_confidence"),
+            "percentage": round(100.0 * count / total_predictions, 2) if total_predictions else 0.0
+        })
+    options.sort(key=lambda o: o["prediction_count"], reverse=True)
+    return {
+        "event_id": event_id,
+        "total_predictions": total_predictions,
+        "total_amount": total_amount,
+        "options": options
+    }
+
+def tally_predictions(predictions):
+    """Aggregate raw prediction rows into per-option tally rows (client-side fallback)"""
+    tallies = {}
+    for prediction in predictions:
+        option_id = prediction.get("option_id")
+        tally = tallies.setdefault(option_id, {"option_id": option_id, "prediction_count": 0, "total_amount": 0, "confidence_sum": 0.0})
+        tally["prediction_count"] += 1
+        tally["total_amount"] += prediction.get("amount") or 0
+        tally["confidence_sum"] += prediction.get("confidence_score") or 0
+    for tally in tallies.values():
+        tally["avg_confidence"] = tally.pop("confidence_sum") / tally["prediction_count"]
+    return list(tallies.values())
+
+def get_event_tallies(event_id):
+    """Get prediction counts, summed amounts and mean confidence per option for an event
+    
+    Reads the event_option_tallies table (one row per option). Falls back
+    to counting the event's predictions if the table is not available.
+    
+    Args:
+        event_id (str): The event to summarize
+        
+    Returns:
+        dict: See summarize_tallies()
+    """
+    try:
+        query = supabase.table("event_option_tallies").select(
+            "option_id,prediction_count,total_amount,avg_confidence"
+        ).eq("event_id", event_id)
+        tallies = execute_with_retry(query, f"get_event_tallies({event_id})").data
+    except Exception as e:
+        logger.warning("Tallies table unavailable, counting predictions for %s: %s", event_id, e)
+        tallies = tally_predictions(get_predictions(event_id=event_id))
+    return summarize_tallies(event_id, tallies)
+
+def rebuild_event_tallies(event_id=None):
+    """Recompute tallies from the predictions table for one event, or all events if None
+    
+    Runs with the service-role client; the function is not executable with the anon key.
+    
+    Returns:
+        int: Number of tally rows written
+    """
+    query = supabase_admin.rpc("rebuild_event_option_tallies", {"p_event_id": event_id})
+    return execute_with_retry(query, f"rebuild_event_tallies({event_id})", table="event_option_tallies").data
 
 def update_prediction(prediction_id, data):
     """Update a prediction"""
@@ -652,7 +1222,7 @@ def get_user_settings(user_id):
         # Try to get settings if table exists
         return supabase.table("settings").select("*").eq("user_id", user_id).execute().data
     except Exception as e:
-        print(f"Error fetching user settings: {str(e)}")
+        logger.error("Error fetching user settings: %s", e)
         # Return a mock settings object if the table doesn't exist
         return [{"user_id": user_id, "notifications_enabled": True, "email_notifications": False, "dark_mode": False}]
 
@@ -709,66 +1279,29 @@ def update_ticket_status(ticket_id, status):
 
 # Authentication nonce related functions
 def create_auth_nonce(wallet_address):
-    """Create a new authentication nonce for wallet auth"""
+    """Create a new authentication nonce for wallet auth
+    
+    Nonces live in the store selected by NONCE_STORE (the auth_nonces
+    table by default, or in-process for single-process servers).
+    """
     try:
         wallet_address = wallet_address.lower().strip()
         if not wallet_address:
             raise ValueError("Wallet address is required")
             
-        # Generate a random nonce
-        import secrets
-        nonce = f"predictme_{secrets.token_hex(16)}"
-        expires_at = (datetime.now() + timedelta(minutes=5)).isoformat()
-        
-        print(f"Creating nonce for wallet: {wallet_address}")
-        
-        # Prepare the nonce data
-        auth_data = {
-            "wallet_address": wallet_address,
-            "nonce": nonce,
-            "expires_at": expires_at,
-            "used": False,
-            "created_at": datetime.now().isoformat()
-        }
-        
-        # First, try to delete any existing nonces for this wallet
-        try:
-            print(f"Deleting existing nonces for wallet: {wallet_address}")
-            response = supabase.table("auth_nonces").delete().eq("wallet_address", wallet_address).execute()
-            print(f"Deleted {len(response.data)} existing nonces")
-        except Exception as e:
-            error_msg = str(e).lower()
-            print(f"Warning when deleting existing nonces: {error_msg}")
-            
-            # If the table doesn't exist, try to create it
-            if "does not exist" in error_msg:
-                try:
-                    print("auth_nonces table not found, attempting to create it...")
-                    supabase.rpc('create_auth_nonces_table', {}).execute()
-                    print("auth_nonces table created successfully")
-                except Exception as create_error:
-                    print(f"Failed to create auth_nonces table: {str(create_error)}")
-                    raise create_error
-        
-        # Create the new nonce in Supabase
-        print(f"Inserting new nonce for wallet: {wallet_address}")
-        result = supabase.table("auth_nonces").insert(auth_data).execute()
-        
-        if not result.data or len(result.data) == 0:
-            raise Exception("No data returned when creating nonce")
-            
-        print(f"Created nonce with ID: {result.data[0].get('id')}")
-        return result.data[0]
+        logger.debug("Creating nonce for wallet: %s", wallet_address)
+        nonce_record = nonce_store.issue(wallet_address)
+        logger.debug("Created nonce with ID: %s", nonce_record.get('id'))
+        return nonce_record
         
     except Exception as e:
         error_msg = f"Error in create_auth_nonce: {str(e)}"
-        print(error_msg)
-        import traceback
-        traceback.print_exc()
+        logger.exception("%s", error_msg)
         
         # In development, return a mock nonce
         if os.environ.get('FLASK_ENV') == 'development' or os.environ.get('FLASK_DEBUG') == '1':
-            print("Using mock nonce for development")
+            import secrets
+            logger.info("Using mock nonce for development")
             return {
                 "id": str(uuid.uuid4()),
                 "wallet_address": wallet_address.lower(),
@@ -781,57 +1314,47 @@ def create_auth_nonce(wallet_address):
         raise Exception(error_msg)
 
 def verify_and_use_nonce(wallet_address, signed_message):
-    """Verify a signed nonce and mark it as used"""
+    """Verify a signed nonce and mark it as used
+    
+    The nonce is consumed atomically before the signature is checked, so
+    each nonce allows exactly one verification attempt.
+    """
     try:
         wallet_address = wallet_address.lower().strip()
         if not wallet_address or not signed_message:
             return False, "Wallet address and signed message are required"
             
-        print(f"Verifying nonce for wallet: {wallet_address}")
+        logger.debug("Verifying nonce for wallet: %s", wallet_address)
         
         # Check if we're in development mode
         is_dev_mode = os.environ.get('FLASK_ENV') == 'development' or os.environ.get('FLASK_DEBUG') == '1'
         
-        # Try to get the most recent valid nonce for this wallet
         try:
-            result = supabase.table("auth_nonces").select("*") \
-                .eq("wallet_address", wallet_address) \
-                .is_("used", False) \
-                .order("created_at", desc=True) \
-                .limit(1).execute()
-                
-            nonce_record = result.data[0] if result.data and len(result.data) > 0 else None
+            # Expired and already-used nonces are never returned
+            nonce_record = nonce_store.consume(wallet_address)
             
             if not nonce_record:
-                print(f"No valid nonce found for wallet {wallet_address}")
+                logger.debug("No valid nonce found for wallet %s", wallet_address)
                 
                 # In development mode, create a fake nonce on the fly
                 if is_dev_mode:
-                    print("DEVELOPMENT MODE: Creating a mock nonce for verification")
+                    logger.info("DEVELOPMENT MODE: Creating a mock nonce for verification")
                     nonce_record = {
                         "id": str(uuid.uuid4()),
                         "wallet_address": wallet_address.lower(),
                         "nonce": f"mock_nonce_{wallet_address[-8:]}",  # Deterministic nonce based on wallet
                         "expires_at": (datetime.now() + timedelta(hours=1)).isoformat(),
-                        "used": False,
+                        "used": True,
                         "created_at": datetime.now().isoformat()
                     }
                 else:
                     return False, "No valid nonce found. Please request a new one."
                 
-            print(f"Using nonce record: {nonce_record.get('id')}")
-            
-            # Only check expiration in production mode
-            if not is_dev_mode:
-                # Check if nonce is expired
-                expires_at = datetime.fromisoformat(nonce_record["expires_at"].replace('Z', '+00:00') if 'Z' in nonce_record["expires_at"] else nonce_record["expires_at"])
-                if datetime.now(expires_at.tzinfo) > expires_at:
-                    print(f"Nonce expired for wallet {wallet_address}")
-                    return False, "Nonce has expired. Please request a new one."
+            logger.debug("Using nonce record: %s", nonce_record.get('id'))
             
             # In development mode, skip actual signature verification
             if is_dev_mode:
-                print("DEVELOPMENT MODE: Bypassing signature verification")
+                logger.warning("DEVELOPMENT MODE: Bypassing signature verification")
                 is_valid = True
             else:
                 # Here you would verify the signed_message against the nonce
@@ -842,52 +1365,26 @@ def verify_and_use_nonce(wallet_address, signed_message):
             if not is_valid:
                 return False, "Invalid signature"
             
-            # Only mark the nonce as used if it's a real DB record (not our mock one)
-            if nonce_record.get('id') and not is_dev_mode:
-                try:
-                    update_result = supabase.table("auth_nonces") \
-                        .update({
-                            "used": True, 
-                            "used_at": datetime.now().isoformat()
-                        }) \
-                        .eq("id", nonce_record["id"]) \
-                        .execute()
-                    
-                    if not update_result.data:
-                        print(f"Failed to mark nonce as used: {update_result}")
-                    else:
-                        print(f"Marked nonce {nonce_record['id']} as used")
-                        
-                except Exception as update_error:
-                    print(f"Error marking nonce as used: {str(update_error)}")
-                    # Continue anyway since the nonce verification was successful
-            
             return True, "Verification successful"
             
         except Exception as query_error:
             error_msg = f"Error querying nonce: {str(query_error)}"
-            print(error_msg)
+            logger.error("%s", error_msg)
             
             # In development mode, just bypass the error
             if is_dev_mode:
-                print("DEVELOPMENT MODE: Bypassing nonce query error")
+                logger.warning("DEVELOPMENT MODE: Bypassing nonce query error")
                 return True, "Development mode: verification bypassed"
                 
             return False, "Failed to verify nonce. Please try again."
         
     except Exception as e:
         error_msg = f"Error in verify_and_use_nonce: {str(e)}"
-        print(error_msg)
-        import traceback
-        traceback.print_exc()
+        logger.exception("%s", error_msg)
         
         # In development, allow bypassing verification
         if os.environ.get('FLASK_ENV') == 'development' or os.environ.get('FLASK_DEBUG') == '1':
-            print("DEVELOPMENT MODE: Bypassing nonce verification")
+            logger.warning("DEVELOPMENT MODE: Bypassing nonce verification")
             return True, "Development mode: verification bypassed"
             
-        return False, "Verification failed. Please try again."
-        print("Using mock verification as fallback")
-        
-        # For development/testing, accept any signature when Supabase fails
-        return True, "Development fallback: verification bypassed"
\ No newline at end of file
+        return False, "Verification failed. Please try again."
\ No newline at end of file
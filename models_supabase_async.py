@@ -0,0 +1,135 @@
+import asyncio
+
+from retry_policy import call_with_retry_async
+from structured_logging import get_logger, log_context
+import supabase_client
+import models_supabase as models
+
+logger = get_logger("models_async")
+
+
+async def run_with_client(fn):
+    """Run fn(client) on the process's pooled async PostgREST client
+
+    Args:
+        fn (callable): Takes an AsyncPostgrestClient and returns a coroutine
+
+    Returns:
+        The coroutine's result
+    """
+    return await supabase_client.async_client_manager.run(fn)
+
+# Helper function for Supabase retries
+async def execute_with_retry(query, operation_name="Supabase operation", table=None):
+    """Execute an async Supabase query with the same retry policy as the sync models"""
+    if table is None:
+        table = (getattr(query, "path", "") or "").strip("/") or "supabase"
+    with log_context(operation_name=operation_name):
+        try:
+            return await call_with_retry_async(query.execute, operation_name, breaker_name=table)
+        except Exception as e:
+            logger.error("%s failed: %s", operation_name, e)
+            raise
+
+# User related functions
+async def get_user_by_id(client, user_id):
+    """Retrieve a user by their ID
+
+    Args:
+        client (AsyncPostgrestClient): Client passed in by run_with_client()
+        user_id (str): The ID of the user to retrieve
+
+    Returns:
+        dict: User data if found, None otherwise
+    """
+    if not user_id:
+        return None
+
+    try:
+        query = client.table("user_profiles").select("*").eq("id", user_id)
+        result = await execute_with_retry(query, f"get_user_by_id({user_id})")
+        return result.data[0] if result.data else None
+    except Exception as e:
+        logger.error("Error in async get_user_by_id for %s: %s", user_id, e)
+        return None
+
+# Settings related functions
+async def get_user_settings(client, user_id):
+    """Get settings for a user"""
+    try:
+        query = client.table("settings").select("*").eq("user_id", user_id)
+        result = await execute_with_retry(query, f"get_user_settings({user_id})")
+        return result.data
+    except Exception as e:
+        logger.error("Error fetching user settings: %s", e)
+        # Return a mock settings object if the table doesn't exist
+        return [{"user_id": user_id, "notifications_enabled": True, "email_notifications": False, "dark_mode": False}]
+
+# Prediction related functions
+async def get_predictions(client, user_id=None, event_id=None):
+    """Get predictions, optionally filtered by user_id or event_id"""
+    query = client.table("predictions").select("*")
+    if user_id:
+        query = query.eq("user_id", user_id)
+    if event_id:
+        query = query.eq("event_id", event_id)
+    result = await execute_with_retry(query.order("created_at", desc=True), f"get_predictions({user_id}, {event_id})")
+    return result.data
+
+async def get_user_stats(client, user_id):
+    """Get a user's prediction statistics, sharing the sync models' stats cache"""
+    cache_key = ("stats", user_id)
+    cached = models.user_stats_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        # AsyncPostgrestClient.rpc is a coroutine that returns the request builder
+        query = await client.rpc("get_user_prediction_stats", {"p_user_id": user_id})
+        rows = (await execute_with_retry(query, f"get_user_stats({user_id})", table="predictions")).data
+        stats = models.build_user_stats(rows[0] if rows else {})
+    except Exception as e:
+        logger.warning("Stats function unavailable, using count queries for %s: %s", user_id, e)
+        total, resolved = await asyncio.gather(*(
+            execute_with_retry(
+                models.count_predictions_query(client, user_id, resolved),
+                f"count_predictions({user_id}, resolved={resolved})"
+            )
+            for resolved in (None, True)
+        ))
+        stats = models.build_fallback_stats(total.count or 0, resolved.count or 0)
+
+    models.user_stats_cache.set(cache_key, stats)
+    return stats
+
+# Event related functions
+async def get_event_by_id(client, event_id):
+    """Get a specific event by ID, sharing the sync models' event cache"""
+    cache_key = ("event", event_id)
+    cached = models.event_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    try:
+        query = client.table("events").select("*").eq("id", event_id)
+        result = await execute_with_retry(query, f"get_event_by_id({event_id})")
+        models.event_cache.set(cache_key, result.data)
+        return result.data
+    except Exception as e:
+        logger.error("Error in async get_event_by_id: %s", e)
+        return []
+
+# Composite reads
+async def get_user_profile_bundle(user_id):
+    """Fetch a user's profile, settings and prediction stats concurrently
+
+    Returns:
+        tuple: (user, settings, stats)
+    """
+    async def fetch(client):
+        return await asyncio.gather(
+            get_user_by_id(client, user_id),
+            get_user_settings(client, user_id),
+            get_user_stats(client, user_id)
+        )
+    return await run_with_client(fetch)
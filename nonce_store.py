@@ -0,0 +1,220 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+import os
+import secrets
+import threading
+import time
+import uuid
+
+from retry_policy import call_with_retry
+from structured_logging import get_logger
+from supabase_client import supabase
+
+logger = get_logger("nonce_store")
+
+# Configure wallet-auth nonces
+NONCE_STORE = os.getenv("NONCE_STORE", "supabase")  # "supabase" or "memory" (single-process servers only)
+NONCE_TTL = float(os.getenv("NONCE_TTL", "300"))  # seconds
+NONCE_SWEEP_INTERVAL = float(os.getenv("NONCE_SWEEP_INTERVAL", "60"))  # seconds
+NONCE_MEMORY_MAX_SIZE = int(os.getenv("NONCE_MEMORY_MAX_SIZE", "100000"))
+
+
+def new_nonce_record(wallet_address, ttl=None):
+    """Build a nonce record in the same shape as an auth_nonces row"""
+    now = datetime.now(timezone.utc)
+    return {
+        "id": str(uuid.uuid4()),
+        "wallet_address": wallet_address,
+        "nonce": f"predictme_{secrets.token_hex(16)}",
+        "expires_at": (now + timedelta(seconds=NONCE_TTL if ttl is None else ttl)).isoformat(),
+        "used": False,
+        "created_at": now.isoformat()
+    }
+
+
+class MemoryNonceStore:
+    """In-process nonce store: one outstanding nonce per wallet, expired after ttl
+
+    Issuing and consuming never touch the database. A daemon thread sweeps
+    expired nonces every sweep_interval seconds, and the oldest nonce is
+    dropped if max_size wallets are waiting at once. Nonces are only visible
+    to the process that issued them, so use SupabaseNonceStore when more
+    than one process serves logins.
+
+    Args:
+        ttl (float): Seconds a nonce stays valid
+        sweep_interval (float): Seconds between sweeps of expired nonces
+        max_size (int): Maximum number of outstanding nonces
+    """
+
+    def __init__(self, ttl=NONCE_TTL, sweep_interval=NONCE_SWEEP_INTERVAL, max_size=NONCE_MEMORY_MAX_SIZE):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._nonces = OrderedDict()  # wallet_address -> (expires_at monotonic, record)
+        self._sweeper = None
+        self._sweeper_pid = None
+        self.swept = 0
+
+    def issue(self, wallet_address):
+        """Create a nonce for wallet_address, replacing any outstanding one
+
+        Returns:
+            dict: The nonce record
+        """
+        self._ensure_sweeper()
+        record = new_nonce_record(wallet_address, self.ttl)
+        with self._lock:
+            self._nonces.pop(wallet_address, None)
+            self._nonces[wallet_address] = (time.monotonic() + self.ttl, record)
+            while len(self._nonces) > self.max_size:
+                self._nonces.popitem(last=False)
+        return record
+
+    def consume(self, wallet_address):
+        """Atomically take the wallet's nonce so it can only be used once
+
+        Returns:
+            dict: The nonce record, or None if there is no unexpired nonce
+        """
+        with self._lock:
+            entry = self._nonces.pop(wallet_address, None)
+        if entry is None:
+            return None
+        expires_at, record = entry
+        if expires_at < time.monotonic():
+            return None
+        return dict(record, used=True, used_at=datetime.now(timezone.utc).isoformat())
+
+    def sweep(self):
+        """Drop expired nonces
+
+        Returns:
+            int: Number of nonces removed
+        """
+        now = time.monotonic()
+        with self._lock:
+            expired = [wallet for wallet, (expires_at, _) in self._nonces.items() if expires_at < now]
+            for wallet in expired:
+                del self._nonces[wallet]
+            self.swept += len(expired)
+        return len(expired)
+
+    def _ensure_sweeper(self):
+        # Threads don't survive a fork, so each worker process starts its own
+        if self._sweeper_pid == os.getpid() and self._sweeper is not None and self._sweeper.is_alive():
+            return
+        with self._lock:
+            if self._sweeper_pid == os.getpid() and self._sweeper is not None and self._sweeper.is_alive():
+                return
+            self._sweeper = threading.Thread(target=self._sweep_forever, name="nonce-sweeper", daemon=True)
+            self._sweeper_pid = os.getpid()
+            self._sweeper.start()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error("Error sweeping nonces: %s", e)
+
+    def stats(self):
+        with self._lock:
+            return {"backend": "memory", "outstanding": len(self._nonces), "swept": self.swept}
+
+
+class SupabaseNonceStore:
+    """Nonce store backed by the auth_nonces table, shared by every process and node
+
+    Consuming ends in a conditional update (still unused and unexpired),
+    so when two requests race for the same nonce only one gets a row back.
+    """
+
+    table = "auth_nonces"
+
+    def _execute(self, query, operation_name):
+        return call_with_retry(query.execute, operation_name, breaker_name=self.table)
+
+    def issue(self, wallet_address):
+        """Replace the wallet's nonces with a new one
+
+        Returns:
+            dict: The inserted auth_nonces row
+        """
+        try:
+            self._execute(
+                supabase.table(self.table).delete().eq("wallet_address", wallet_address),
+                f"delete_auth_nonces({wallet_address})"
+            )
+        except Exception as e:
+            error_msg = str(e).lower()
+            logger.warning("Could not delete existing nonces: %s", error_msg)
+
+            # If the table doesn't exist, try to create it
+            if "does not exist" in error_msg:
+                logger.debug("auth_nonces table not found, attempting to create it...")
+                supabase.rpc('create_auth_nonces_table', {}).execute()
+
+        record = new_nonce_record(wallet_address)
+        del record["id"]
+        result = self._execute(supabase.table(self.table).insert(record), f"insert_auth_nonce({wallet_address})")
+        if not result.data:
+            raise Exception("No data returned when creating nonce")
+        return result.data[0]
+
+    def consume(self, wallet_address):
+        """Atomically mark the wallet's newest unused, unexpired nonce as used
+
+        Returns:
+            dict: The consumed row, or None if there is no valid nonce (or another request won)
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        result = self._execute(
+            supabase.table(self.table).select("id")
+                .eq("wallet_address", wallet_address)
+                .eq("used", False)
+                .gt("expires_at", now)
+                .order("created_at", desc=True)
+                .limit(1),
+            f"select_auth_nonce({wallet_address})"
+        )
+        if not result.data:
+            return None
+
+        # The used/expiry conditions make the update a compare-and-set
+        result = self._execute(
+            supabase.table(self.table)
+                .update({"used": True, "used_at": now})
+                .eq("id", result.data[0]["id"])
+                .eq("used", False)
+                .gt("expires_at", now),
+            f"consume_auth_nonce({wallet_address})"
+        )
+        return result.data[0] if result.data else None
+
+    def stats(self):
+        return {"backend": "supabase"}
+
+
+def create_nonce_store(backend=None):
+    """Build the nonce store selected by NONCE_STORE
+
+    Raises:
+        RuntimeError: If the memory store is selected while WEB_CONCURRENCY
+            says more than one worker process serves requests
+        ValueError: If the backend is unknown
+    """
+    backend = backend or NONCE_STORE
+    if backend == "supabase":
+        return SupabaseNonceStore()
+    if backend == "memory":
+        # A nonce issued by one worker can't be verified by another
+        if int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+            raise RuntimeError("NONCE_STORE=memory only works with a single worker process; use NONCE_STORE=supabase")
+        return MemoryNonceStore()
+    raise ValueError(f"Unknown NONCE_STORE backend: {backend}")
+
+
+nonce_store = create_nonce_store()
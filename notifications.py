@@ -0,0 +1,295 @@
+from datetime import datetime, timedelta, timezone
+import os
+import queue
+import threading
+import time
+
+from cache import TTLCache
+from retry_policy import call_with_retry
+from structured_logging import get_logger
+from supabase_client import supabase_admin
+
+logger = get_logger("notifications")
+
+# Configure notification fan-out
+NOTIFICATIONS_ENABLED = os.getenv("NOTIFICATIONS_ENABLED", "1") == "1"
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "10000"))  # recipients per database call
+NOTIFICATION_SCAN_INTERVAL = float(os.getenv("NOTIFICATION_SCAN_INTERVAL", "60"))  # seconds
+NOTIFICATION_ENDING_WINDOW = float(os.getenv("NOTIFICATION_ENDING_WINDOW", "3600"))  # seconds before end_time
+NOTIFICATION_QUEUE_SIZE = int(os.getenv("NOTIFICATION_QUEUE_SIZE", "1000"))  # pending fan-out jobs
+NOTIFICATION_CLAIM_TIMEOUT = float(os.getenv("NOTIFICATION_CLAIM_TIMEOUT", "900"))  # seconds before a stalled alert is retried
+
+# Configure the unread-count cache
+NOTIFICATION_COUNT_CACHE_TTL = float(os.getenv("NOTIFICATION_COUNT_CACHE_TTL", "10"))  # seconds
+NOTIFICATION_COUNT_CACHE_MAX_SIZE = int(os.getenv("NOTIFICATION_COUNT_CACHE_MAX_SIZE", "10000"))
+
+# Cache in front of unread_count, keyed by ("unread", user_id)
+unread_count_cache = TTLCache(max_size=NOTIFICATION_COUNT_CACHE_MAX_SIZE, ttl=NOTIFICATION_COUNT_CACHE_TTL)
+
+
+# RLS only lets a Supabase Auth user see their own notifications, and the
+# API's callers don't carry one, so reads and updates go through the
+# service-role client and are always filtered by user_id
+def unread_count(user_id):
+    """Count a user's unread notifications without downloading them"""
+    def load():
+        query = (supabase_admin.table("notifications").select("id", count="exact")
+                 .eq("user_id", user_id).eq("is_read", False).limit(0))
+        result = call_with_retry(query.execute, f"count_unread_notifications({user_id})", breaker_name="notifications")
+        return result.count or 0
+    return unread_count_cache.get_or_load(("unread", user_id), load)
+
+
+def get_notifications(user_id, limit=50, unread_only=False):
+    """Return a user's newest notifications"""
+    query = supabase_admin.table("notifications").select("*").eq("user_id", user_id)
+    if unread_only:
+        query = query.eq("is_read", False)
+    query = query.order("created_at", desc=True).limit(limit)
+    return call_with_retry(query.execute, f"get_notifications({user_id})", breaker_name="notifications").data or []
+
+
+def mark_read(user_id, notification_ids=None):
+    """Mark some (or, without ids, all) of a user's notifications as read
+
+    Returns:
+        int: Number of notifications marked
+    """
+    query = supabase_admin.table("notifications").update({"is_read": True}).eq("user_id", user_id).eq("is_read", False)
+    if notification_ids:
+        query = query.in_("id", list(notification_ids))
+    result = call_with_retry(query.execute, f"mark_notifications_read({user_id})", breaker_name="notifications")
+    unread_count_cache.invalidate(("unread", user_id))
+    return len(result.data or [])
+
+
+def fan_out(event_id, notification_type, title, content, winner_content=None, batch_size=NOTIFICATION_BATCH_SIZE):
+    """Notify every predictor of an event, batch_size recipients per database call
+
+    fan_out_event_notification does the work in the database: it takes
+    the next batch of the event's predictors, drops those whose settings
+    disable notifications and inserts the rest in one statement. A user
+    gets each type of notification about an event at most once, so a
+    retried or repeated fan-out adds nothing. The function is only
+    executable with the service-role key.
+
+    Args:
+        event_id (str): The event, stored as the notifications' ref_id
+        notification_type (str): "event_ending" or "result_announced"
+        title (str): Notification title
+        content (str): Notification text
+        winner_content (str, optional): Text for settled winners instead;
+            "{payout}" is replaced with their payout
+
+    Returns:
+        int: Number of notifications inserted
+    """
+    inserted = 0
+    after = None
+    while True:
+        query = supabase_admin.rpc("fan_out_event_notification", {
+            "p_event_id": event_id,
+            "p_type": notification_type,
+            "p_title": title,
+            "p_content": content,
+            "p_winner_content": winner_content,
+            "p_after": after,
+            "p_limit": batch_size
+        })
+        rows = call_with_retry(query.execute, f"fan_out_event_notification({event_id}, {notification_type})",
+                               breaker_name="notifications").data or []
+        batch = rows[0] if rows else {}
+        inserted += batch.get("inserted") or 0
+        after = batch.get("last_user_id")
+        if after is None:
+            break
+    # Thousands of counts just changed; cheaper to drop them all than to track which
+    unread_count_cache.clear()
+    logger.info("Sent %s %s notifications for event %s", inserted, notification_type, event_id)
+    return inserted
+
+
+class NotificationFanout:
+    """Background worker that fans notifications out to an event's predictors
+
+    Triggers only enqueue a job, so resolving an event doesn't wait for
+    its notifications. A scanner on the same thread looks for events
+    ending within ending_window seconds every scan_interval seconds and
+    claims each one (events.ending_claimed_at) before queueing its
+    "ending soon" alert, so only one process sends it. The alert is only
+    marked as sent (events.ending_notified_at) once the fan-out succeeds;
+    a failed job releases its claim, and a claim left behind by a dead
+    worker expires after claim_timeout seconds, so either way the alert
+    is retried by a later scan.
+
+    Args:
+        scan_interval (float): Seconds between scans for ending events
+        ending_window (float): How long before end_time to alert
+        claim_timeout (float): Seconds before an unfinished claim may be taken over
+    """
+
+    def __init__(self, scan_interval=NOTIFICATION_SCAN_INTERVAL, ending_window=NOTIFICATION_ENDING_WINDOW,
+                 claim_timeout=NOTIFICATION_CLAIM_TIMEOUT):
+        self.scan_interval = scan_interval
+        self.ending_window = ending_window
+        self.claim_timeout = claim_timeout
+        self._jobs = queue.Queue(maxsize=NOTIFICATION_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+        self._next_scan = 0.0
+        self.jobs_run = 0
+        self.jobs_failed = 0
+        self.jobs_dropped = 0
+        self.notifications_sent = 0
+        self.scans = 0
+
+    def enqueue(self, event_id, notification_type, title, content, winner_content=None):
+        """Queue a fan-out job without waiting for it
+
+        Returns:
+            bool: False if notifications are disabled or the job queue is full
+        """
+        if not NOTIFICATIONS_ENABLED:
+            return False
+        self.ensure_started()
+        try:
+            self._jobs.put_nowait((event_id, notification_type, title, content, winner_content))
+            return True
+        except queue.Full:
+            with self._lock:
+                self.jobs_dropped += 1
+            logger.error("Notification queue full; dropped %s for event %s", notification_type, event_id)
+            return False
+
+    def notify_resolved(self, event_id, title=None, wait=False):
+        """Tell every predictor of a settled event how it ended
+
+        Args:
+            event_id (str): The settled event
+            title (str, optional): The event's title, quoted in the text
+            wait (bool): Fan out on this thread instead of queueing a job
+        """
+        subject = f'"{title}"' if title else "An event you predicted on"
+        job = (
+            event_id,
+            "result_announced",
+            "Results are in",
+            f"{subject} has been resolved. Your prediction did not win this time.",
+            f"{subject} has been resolved. Your prediction won {{payout}}!"
+        )
+        if wait:
+            return fan_out(*job) if NOTIFICATIONS_ENABLED else 0
+        return self.enqueue(*job)
+
+    def scan_ending_events(self):
+        """Claim and queue "event ending" alerts for events ending within the window
+
+        Returns:
+            int: Number of events queued
+        """
+        now = datetime.now(timezone.utc)
+        unclaimed = f'or(ending_claimed_at.is.null,ending_claimed_at.lt."{(now - timedelta(seconds=self.claim_timeout)).isoformat()}")'
+        query = (supabase_admin.table("events").select("id,title")
+                 .gt("end_time", now.isoformat())
+                 .lte("end_time", (now + timedelta(seconds=self.ending_window)).isoformat())
+                 .is_("ending_notified_at", "null"))
+        query.params = query.params.add("and", f"(or(is_resolved.is.null,is_resolved.eq.false),{unclaimed})")
+        events = call_with_retry(query.execute, "scan_ending_events", breaker_name="events").data or []
+        queued = 0
+        for event in events:
+            # Conditional update: only the process that takes the claim sends the alert
+            claim = (supabase_admin.table("events").update({"ending_claimed_at": now.isoformat()})
+                     .eq("id", event["id"]).is_("ending_notified_at", "null"))
+            claim.params = claim.params.add("and", f"({unclaimed})")
+            if not call_with_retry(claim.execute, f"claim_event_ending({event['id']})", breaker_name="events").data:
+                continue
+            if self.enqueue(
+                event["id"],
+                "event_ending",
+                "Event ending soon",
+                f'"{event.get("title") or "An event you predicted on"}" closes soon.'
+            ):
+                queued += 1
+            else:
+                self._finish_ending_alert(event["id"], sent=False)
+        with self._lock:
+            self.scans += 1
+        return queued
+
+    def ensure_started(self):
+        """Start the worker thread for this process if it is not running"""
+        if not NOTIFICATIONS_ENABLED:
+            return
+        # Threads don't survive a fork, so each worker process starts its own
+        if self._worker_pid == os.getpid() and self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker_pid == os.getpid() and self._worker is not None and self._worker.is_alive():
+                return
+            self._worker = threading.Thread(target=self._run_forever, name="notification-fanout", daemon=True)
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def _finish_ending_alert(self, event_id, sent):
+        """Mark an event's "ending soon" alert as sent, or release its claim so a later scan retries it"""
+        if sent:
+            query = supabase_admin.table("events").update({
+                "ending_notified_at": datetime.now(timezone.utc).isoformat()
+            }).eq("id", event_id)
+        else:
+            query = (supabase_admin.table("events").update({"ending_claimed_at": None})
+                     .eq("id", event_id).is_("ending_notified_at", "null"))
+        try:
+            call_with_retry(query.execute, f"finish_event_ending({event_id})", breaker_name="events")
+        except Exception as e:
+            # The claim expires after claim_timeout, and repeating a fan-out sends nothing twice
+            logger.error("Could not record the ending alert for event %s: %s", event_id, e)
+
+    def _run_forever(self):
+        while True:
+            if time.monotonic() >= self._next_scan:
+                self._next_scan = time.monotonic() + self.scan_interval
+                try:
+                    self.scan_ending_events()
+                except Exception as e:
+                    logger.error("Error scanning for ending events: %s", e)
+            try:
+                job = self._jobs.get(timeout=max(0.0, self._next_scan - time.monotonic()))
+            except queue.Empty:
+                continue
+            try:
+                sent = fan_out(*job)
+                with self._lock:
+                    self.jobs_run += 1
+                    self.notifications_sent += sent
+            except Exception as e:
+                with self._lock:
+                    self.jobs_failed += 1
+                logger.error("Error sending %s notifications for event %s: %s", job[1], job[0], e)
+                if job[1] == "event_ending":
+                    self._finish_ending_alert(job[0], sent=False)
+                continue
+            if job[1] == "event_ending":
+                self._finish_ending_alert(job[0], sent=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": NOTIFICATIONS_ENABLED,
+                "queued": self._jobs.qsize(),
+                "jobs_run": self.jobs_run,
+                "jobs_failed": self.jobs_failed,
+                "jobs_dropped": self.jobs_dropped,
+                "notifications_sent": self.notifications_sent,
+                "scans": self.scans
+            }
+
+
+notification_fanout = NotificationFanout()
+
+
+def init_notifications(app):
+    """Run the fan-out worker (and its ending-event scanner) in every worker process"""
+    if NOTIFICATIONS_ENABLED:
+        app.before_request(notification_fanout.ensure_started)
@@ -0,0 +1,166 @@
+from contextvars import ContextVar
+import os
+import time
+
+from flask import g
+
+from structured_logging import get_logger
+
+logger = get_logger("metrics")
+
+# Configure per-request Supabase accounting
+# The header names internal operations, so it is only sent by default in development
+SERVER_TIMING = os.getenv(
+    "SERVER_TIMING", "1" if os.getenv("FLASK_ENV") == "development" else "0"
+) == "1"
+SERVER_TIMING_MAX_OPERATIONS = int(os.getenv("SERVER_TIMING_MAX_OPERATIONS", "20"))
+
+# Write one structured log line per request whose total time is at least this many ms
+REQUEST_METRICS_LOG = os.getenv("REQUEST_METRICS_LOG", "0") == "1"
+REQUEST_METRICS_LOG_MIN_MS = float(os.getenv("REQUEST_METRICS_LOG_MIN_MS", "0"))
+
+
+class RequestMetrics:
+    """Supabase operations and HTTP round trips made while serving one request
+
+    An operation is one call_with_retry() (a logical query, with its
+    retries); a round trip is one HTTP request to Supabase, including the
+    ones made by direct .execute() calls that bypass the retry helper.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.operations = []
+        self.round_trips = 0
+        self.round_trip_time = 0.0
+
+    def add_operation(self, name, duration, attempts, error=None):
+        self.operations.append({
+            "name": name,
+            "duration_ms": round(duration * 1000, 3),
+            "attempts": attempts,
+            "error": type(error).__name__ if error is not None else None
+        })
+
+    def add_round_trip(self, duration):
+        self.round_trips += 1
+        self.round_trip_time += duration
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def summary(self):
+        """Totals for logging, including how often each operation label repeated"""
+        by_label = {}
+        for operation in self.operations:
+            label = operation_label(operation["name"])
+            by_label[label] = by_label.get(label, 0) + 1
+        return {
+            "total_ms": round(self.elapsed() * 1000, 3),
+            "db_ms": round(self.round_trip_time * 1000, 3),
+            "round_trips": self.round_trips,
+            "operations": len(self.operations),
+            "attempts": sum(operation["attempts"] for operation in self.operations),
+            "operations_by_label": by_label
+        }
+
+
+_current_metrics = ContextVar("request_metrics", default=None)
+
+
+def operation_label(name):
+    """Strip call arguments (ids, wallets) from an operation name: "get_user_by_id(...)" -> "get_user_by_id" """
+    return name.split("(", 1)[0].strip() or "supabase"
+
+
+def start_request_metrics():
+    """Start recording for the current request / context
+
+    Returns:
+        Token: Pass to clear_request_metrics() when the request ends
+    """
+    return _current_metrics.set(RequestMetrics())
+
+
+def clear_request_metrics(token):
+    _current_metrics.reset(token)
+
+
+def current_metrics():
+    """Return the active RequestMetrics, or None outside a request"""
+    return _current_metrics.get()
+
+
+def record_operation(name, duration, attempts, error=None):
+    """Record a finished Supabase operation against the current request, if any"""
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.add_operation(name, duration, attempts, error)
+
+
+def record_round_trip(duration):
+    """Record one HTTP round trip to Supabase against the current request, if any"""
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.add_round_trip(duration)
+
+
+def _quote(text):
+    return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def server_timing_header(metrics):
+    """Format metrics as a Server-Timing header value
+
+    "db" carries the round-trip count and time, "app" the whole request,
+    then one "op<n>" entry per operation (labels only; arguments stay in
+    the logs) up to SERVER_TIMING_MAX_OPERATIONS.
+    """
+    summary = metrics.summary()
+    db_desc = f"{summary['round_trips']} round trips, {summary['attempts']} attempts"
+    entries = [
+        f"db;dur={summary['db_ms']:.1f};desc={_quote(db_desc)}",
+        f"app;dur={summary['total_ms']:.1f}"
+    ]
+    for index, operation in enumerate(metrics.operations[:SERVER_TIMING_MAX_OPERATIONS]):
+        desc = operation_label(operation["name"])
+        if operation["attempts"] != 1:
+            desc += f' x{operation["attempts"]}'
+        if operation["error"]:
+            desc += f' {operation["error"]}'
+        entries.append(f'op{index};dur={operation["duration_ms"]:.1f};desc={_quote(desc)}')
+    return ", ".join(entries)
+
+
+def _start():
+    g.request_metrics = start_request_metrics()
+
+
+def _finish(response):
+    metrics = current_metrics()
+    if metrics is None:
+        return response
+    if SERVER_TIMING:
+        response.headers["Server-Timing"] = server_timing_header(metrics)
+    if REQUEST_METRICS_LOG:
+        summary = metrics.summary()
+        if summary["total_ms"] >= REQUEST_METRICS_LOG_MIN_MS:
+            logger.info(
+                "Request used %s Supabase round trips in %.1f ms",
+                summary["round_trips"], summary["db_ms"],
+                extra={"metrics": dict(summary, status=response.status_code, operations_detail=metrics.operations)}
+            )
+    return response
+
+
+def _clear(exc=None):
+    token = g.pop("request_metrics", None)
+    if token is not None:
+        clear_request_metrics(token)
+
+
+def init_request_metrics(app):
+    """Record Supabase usage for every request and report it on the response"""
+    app.before_request(_start)
+    app.after_request(_finish)
+    app.teardown_request(_clear)
@@ -0,0 +1,382 @@
+from contextvars import ContextVar
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+
+import request_metrics
+from structured_logging import get_logger
+
+logger = get_logger("retry")
+
+# Configure retries
+MAX_ATTEMPTS = int(os.getenv("SUPABASE_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.getenv("SUPABASE_RETRY_BASE_DELAY", "0.1"))  # seconds
+RETRY_MAX_DELAY = float(os.getenv("SUPABASE_RETRY_MAX_DELAY", "1.0"))  # seconds
+
+# Total time budget for all Supabase calls made while serving one request
+REQUEST_DEADLINE = float(os.getenv("SUPABASE_REQUEST_DEADLINE", "5.0"))  # seconds
+
+# Configure circuit breakers
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("SUPABASE_BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("SUPABASE_BREAKER_RESET_TIMEOUT", "30"))  # seconds
+
+# HTTP statuses that indicate a transient upstream problem
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+# SQLSTATE codes (or class prefixes) that are safe to retry
+RETRYABLE_SQLSTATE_PREFIXES = (
+    "08",     # connection exceptions
+    "40001",  # serialization failure
+    "40P01",  # deadlock detected
+    "53",     # insufficient resources
+    "57014",  # query canceled (statement timeout)
+    "57P01",  # admin shutdown
+    "PGRST000", "PGRST001", "PGRST002",  # PostgREST could not reach the database
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling Supabase when a table's circuit breaker is open"""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when the request's Supabase time budget is used up"""
+
+
+class Deadline:
+    """A point in time after which no further Supabase attempts are made
+
+    Args:
+        budget (float): Seconds from now until the deadline
+    """
+
+    def __init__(self, budget):
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self):
+        """Seconds left before the deadline (never negative)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+
+_current_deadline = ContextVar("supabase_deadline", default=None)
+
+# Seconds the attempt in progress may take, set by call_with_retry around each attempt
+_attempt_timeout = ContextVar("supabase_attempt_timeout", default=None)
+
+
+def start_deadline(budget=None):
+    """Start a deadline for the current request / context
+
+    Returns:
+        Token: Pass to clear_deadline() when the request ends
+    """
+    return _current_deadline.set(Deadline(REQUEST_DEADLINE if budget is None else budget))
+
+
+def clear_deadline(token):
+    """Restore the deadline that was active before start_deadline()"""
+    _current_deadline.reset(token)
+
+
+def current_deadline():
+    """Return the active Deadline, or None outside a request"""
+    return _current_deadline.get()
+
+
+def attempt_timeout():
+    """Return the seconds left for the current attempt, or None when it is unbounded
+
+    The Supabase HTTP transports cap their connect/read/write/pool timeouts
+    at this, so one slow attempt cannot run past the request's deadline.
+    """
+    return _attempt_timeout.get()
+
+
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        response = getattr(error, "response", None)
+        status = getattr(response, "status_code", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error):
+    """Decide whether a failed Supabase call is worth retrying
+
+    Network errors, timeouts, 5xx/429 responses and transient database
+    errors are retryable. Client errors such as constraint violations,
+    bad filters or permission failures are not: retrying them only
+    repeats the same answer.
+    """
+    if isinstance(error, (CircuitOpenError, DeadlineExceeded)):
+        return False
+
+    try:
+        import httpx
+        if isinstance(error, (httpx.TimeoutException, httpx.TransportError)):
+            return True
+    except ImportError:
+        pass
+
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+
+    # Gateways return HTML error pages that the PostgREST client fails to parse
+    if isinstance(error, json.JSONDecodeError):
+        return True
+
+    code = getattr(error, "code", None)
+    # postgrest-py reports non-JSON error responses with the HTTP status as the code
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS_CODES
+    if isinstance(code, str) and code:
+        return code.startswith(RETRYABLE_SQLSTATE_PREFIXES)
+
+    status = _status_code(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+
+    return False
+
+
+def backoff_delay(attempt, base=None, cap=None):
+    """Full-jitter exponential backoff for the given (0-based) attempt"""
+    base = RETRY_BASE_DELAY if base is None else base
+    cap = RETRY_MAX_DELAY if cap is None else cap
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """Per-dependency circuit breaker
+
+    Closed: calls flow normally. After failure_threshold consecutive
+    retryable failures the breaker opens and calls fail fast with
+    CircuitOpenError. After reset_timeout seconds one probe call is let
+    through (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=None, reset_timeout=None):
+        self.name = name
+        self.failure_threshold = BREAKER_FAILURE_THRESHOLD if failure_threshold is None else failure_threshold
+        self.reset_timeout = BREAKER_RESET_TIMEOUT if reset_timeout is None else reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0
+
+    def allow(self):
+        """Return True if a call may proceed right now"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self.rejected += 1
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            # Half-open: allow a single probe at a time
+            if self._probe_in_flight:
+                self.rejected += 1
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def snapshot(self):
+        """Return the breaker's state for monitoring"""
+        with self._lock:
+            state = self._state
+            retry_in = 0.0
+            if state == self.OPEN:
+                retry_in = max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "rejected": self.rejected,
+                "retry_in": round(retry_in, 3)
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """Return the circuit breaker for a table, creating it on first use"""
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+
+def breaker_states():
+    """Return a snapshot of every circuit breaker, keyed by table"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+
+def _check_attempt(attempt, deadline, breaker, operation_name):
+    """Raise instead of attempting a call when the deadline or breaker forbids it"""
+    if deadline is not None and deadline.expired():
+        raise DeadlineExceeded(f"Deadline exceeded before attempt {attempt + 1} for {operation_name}")
+    if not breaker.allow():
+        raise CircuitOpenError(f"Circuit open for '{breaker.name}', skipping {operation_name}")
+
+
+def _attempt(fn, deadline):
+    """Call fn() with the attempt's timeout capped at what is left of the deadline"""
+    token = _attempt_timeout.set(deadline.remaining() if deadline is not None else None)
+    try:
+        return fn()
+    finally:
+        _attempt_timeout.reset(token)
+
+
+async def _attempt_async(fn, deadline):
+    token = _attempt_timeout.set(deadline.remaining() if deadline is not None else None)
+    try:
+        return await fn()
+    finally:
+        _attempt_timeout.reset(token)
+
+
+def _delay_after_failure(error, attempt, max_attempts, deadline, breaker, operation_name):
+    """Record a failed attempt and return how long to wait before the next one
+
+    Returns None when the error should be re-raised instead of retried.
+    """
+    if not is_retryable(error):
+        # The dependency answered; the request itself was bad
+        breaker.record_success()
+        return None
+    breaker.record_failure()
+    logger.warning("Attempt %s failed for %s: %s", attempt + 1, operation_name, error)
+
+    if attempt == max_attempts - 1:
+        return None
+    delay = backoff_delay(attempt)
+    if deadline is not None and delay >= deadline.remaining():
+        # Sleeping would blow the request's budget; fail now instead
+        return None
+    return delay
+
+
+def call_with_retry(fn, operation_name="Supabase operation", breaker_name="supabase", max_attempts=None):
+    """Call fn() with deadline-aware, jittered retries behind a circuit breaker
+
+    Args:
+        fn (callable): The call to make, e.g. query.execute
+        operation_name (str): Label used in log messages
+        breaker_name (str): Circuit breaker to use (one per table)
+        max_attempts (int, optional): Overrides MAX_ATTEMPTS
+
+    The call's duration and number of attempts are recorded against the
+    current request (see request_metrics).
+
+    Returns:
+        The return value of fn()
+
+    Raises:
+        CircuitOpenError: If the breaker is open
+        DeadlineExceeded: If the request's time budget ran out before the first attempt
+        Exception: The last error raised by fn() once retries stop
+    """
+    max_attempts = MAX_ATTEMPTS if max_attempts is None else max_attempts
+    breaker = get_breaker(breaker_name)
+    deadline = current_deadline()
+
+    started = time.perf_counter()
+    attempts = 0
+    error = None
+    try:
+        for attempt in range(max_attempts):
+            _check_attempt(attempt, deadline, breaker, operation_name)
+            attempts += 1
+            try:
+                result = _attempt(fn, deadline)
+            except Exception as e:
+                delay = _delay_after_failure(e, attempt, max_attempts, deadline, breaker, operation_name)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                continue
+
+            breaker.record_success()
+            return result
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        request_metrics.record_operation(operation_name, time.perf_counter() - started, attempts, error)
+
+
+async def call_with_retry_async(fn, operation_name="Supabase operation", breaker_name="supabase", max_attempts=None):
+    """Async variant of call_with_retry: awaits fn() and backs off with asyncio.sleep
+
+    Args:
+        fn (callable): Coroutine function making the call, e.g. query.execute
+        operation_name (str): Label used in log messages
+        breaker_name (str): Circuit breaker to use (one per table)
+        max_attempts (int, optional): Overrides MAX_ATTEMPTS
+
+    Returns:
+        The result of awaiting fn()
+    """
+    max_attempts = MAX_ATTEMPTS if max_attempts is None else max_attempts
+    breaker = get_breaker(breaker_name)
+    deadline = current_deadline()
+
+    started = time.perf_counter()
+    attempts = 0
+    error = None
+    try:
+        for attempt in range(max_attempts):
+            _check_attempt(attempt, deadline, breaker, operation_name)
+            attempts += 1
+            try:
+                result = await _attempt_async(fn, deadline)
+            except Exception as e:
+                delay = _delay_after_failure(e, attempt, max_attempts, deadline, breaker, operation_name)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                continue
+
+            breaker.record_success()
+            return result
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        request_metrics.record_operation(operation_name, time.perf_counter() - started, attempts, error)
@@ -1,11 +1,14 @@
 from flask import Blueprint, jsonify, request, send_from_directory, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from werkzeug.security import generate_password_hash, check_password_hash
+from werkzeug.exceptions import RequestEntityTooLarge
 from werkzeug.utils import secure_filename
 from datetime import datetime
 import os
 import uuid
 
+from upload_storage import store_upload, UploadRejected
+from image_variants import variant_generator
 from models import db, User, Prediction, Vote, Category, Image, Transaction, Comment
 
 # Create blueprint for API routes
@@ -236,9 +239,15 @@ def upload_image():
         return jsonify({"error": "No image file selected"}), 400
         
     filename = secure_filename(file.filename)
-    unique_filename = f"{uuid.uuid4()}_{filename}"
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], unique_filename)
-    file.save(file_path)
+    try:
+        # Stored under its content hash; duplicates share one file
+        unique_filename, created = store_upload(file)
+        if created:
+            variant_generator.schedule_all(current_app.config['UPLOAD_FOLDER'], unique_filename)
+    except UploadRejected as e:
+        return jsonify({"error": str(e)}), 400
+    except RequestEntityTooLarge:
+        return jsonify({"error": "Image is too large"}), 413
     
     prediction_id = request.form.get('prediction_id')
     
@@ -0,0 +1,64 @@
+from flask import request, jsonify
+
+import models_supabase_async as models_async
+import http_cache
+from routes_supabase import require_auth, record_engagement, get_authenticated_user_id
+from structured_logging import get_logger
+
+logger = get_logger("routes_async")
+
+# Async implementations of routes in routes_supabase.py, keyed by endpoint name.
+# They run their independent Supabase queries concurrently with asyncio.gather,
+# so a request costs roughly its slowest query instead of the sum of all of them.
+
+@require_auth
+async def get_user_profile():
+    """Get the current user's profile"""
+    user_id = get_authenticated_user_id()
+    try:
+        user, settings, stats = await models_async.get_user_profile_bundle(user_id)
+    except Exception as e:
+        logger.error("Error in get_user_profile: %s", e)
+        return jsonify({"error": "Failed to fetch user profile", "details": str(e)}), 500
+
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    response_data = dict(user)
+    response_data["settings"] = settings[0] if settings else {}
+    response_data["stats"] = stats
+
+    return jsonify(response_data), 200
+
+async def get_event(event_id):
+    """Get a specific event by ID"""
+    try:
+        event = await models_async.run_with_client(lambda client: models_async.get_event_by_id(client, event_id))
+
+        if not event:
+            logger.debug("Event with ID %s not found", event_id)
+            return jsonify({"error": "Event not found"}), 404
+
+        record_engagement(event[0]['id'], "view")
+        etag = http_cache.version_etag(event)
+        return http_cache.cached_json(event[0], etag, http_cache.EVENT_CACHE_CONTROL)
+    except Exception as e:
+        logger.error("Error in get_event: %s", e)
+        return jsonify({"error": "Failed to fetch event", "details": str(e)}), 500
+
+ASYNC_VIEWS = {
+    "api.get_user_profile": get_user_profile,
+    "api.get_event": get_event,
+}
+
+def install_async_routes(app):
+    """Serve the routes in ASYNC_VIEWS with their async implementations
+
+    Must be called after the api blueprint is registered. The URL rules
+    stay the same; only the view functions behind the endpoints change.
+    Requires Flask's async extra (asgiref).
+    """
+    for endpoint, view in ASYNC_VIEWS.items():
+        if endpoint not in app.view_functions:
+            raise KeyError(f"Endpoint {endpoint} is not registered")
+        app.view_functions[endpoint] = view
@@ -0,0 +1,374 @@
+from datetime import datetime, timezone
+import argparse
+import json
+import os
+import uuid
+
+import numpy as np
+
+import models_supabase as models
+from models_supabase import execute_with_retry
+from leaderboard import leaderboard
+import retry_policy
+from notifications import notification_fanout
+from structured_logging import get_logger
+from supabase_client import supabase_admin
+
+logger = get_logger("settlement")
+
+# Configure event settlement
+SETTLEMENT_PAGE_SIZE = int(os.getenv("SETTLEMENT_PAGE_SIZE", "1000"))  # predictions read per query
+SETTLEMENT_BATCH_SIZE = int(os.getenv("SETTLEMENT_BATCH_SIZE", "1000"))  # predictions written per call
+SETTLEMENT_WIN_REPUTATION = int(os.getenv("SETTLEMENT_WIN_REPUTATION", "10"))
+SETTLEMENT_LOSS_REPUTATION = int(os.getenv("SETTLEMENT_LOSS_REPUTATION", "5"))
+SETTLEMENT_DEADLINE = float(os.getenv("SETTLEMENT_DEADLINE", "120"))  # seconds of Supabase time per settlement
+
+# Products above this no longer fit in int64 and are computed with Python integers
+INT64_LIMIT = 2 ** 63 - 1
+
+
+class EventResolutionError(ValueError):
+    """Raised when an event cannot be resolved to the requested option"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class SettlementConflict(Exception):
+    """Raised when an event is already resolved to a different option"""
+
+
+def winning_values(event, option_id):
+    """Return (resolved_option, values) for the option a prediction must name to win
+
+    resolved_option is the option's id, or its value when it has no id.
+    Predictions store either an option's id or its value, so both count.
+
+    Raises:
+        EventResolutionError: If the option is not one of the event's options
+    """
+    for option in event.get("options") or []:
+        if isinstance(option, dict):
+            values = {str(option[key]) for key in ("id", "value") if option.get(key) is not None}
+            if option_id in values:
+                return str(option["id"] if option.get("id") is not None else option["value"]), values
+        elif str(option) == option_id:
+            return option_id, {option_id}
+    raise EventResolutionError("Option is not valid for this event")
+
+
+def as_uuid(value):
+    """Return value as a UUID string, or None if it is not one"""
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        return None
+
+
+def recorded_option(event):
+    """The option an event was resolved to, or None if none was recorded
+
+    resolved_option holds the winning id or value as text. Events resolved
+    before it existed only have the UUID column.
+    """
+    option = event.get("resolved_option") or event.get("resolved_option_id")
+    return None if option is None else str(option)
+
+
+def check_amounts(amounts):
+    """Refuse to settle predictions with negative stakes
+
+    Raises:
+        EventResolutionError: If any amount is negative (409, since the
+            event is already resolved and the rows must be fixed first)
+    """
+    if amounts.size and int(amounts.min()) < 0:
+        raise EventResolutionError("Predictions with negative amounts cannot be settled", status=409)
+
+
+def pool_totals(option_ids, amounts, winners_values):
+    """Return (total_pool, winning_pool) for an event's predictions"""
+    check_amounts(amounts)
+    is_winner = np.isin(option_ids, list(winners_values))
+    return int(amounts.sum()), int(amounts[is_winner].sum())
+
+
+def compute_settlement(option_ids, amounts, confidences, winners_values, pools=None):
+    """Work out every prediction's outcome, payout and reputation change
+
+    The whole pot is shared among the winners in proportion to their
+    amount (pari-mutuel). Integer payouts are floored and the units left
+    over go to the winners with the largest remainders, so payouts add up
+    to exactly the pot. If nobody staked on the winning option, every
+    stake is refunded. Winners gain up to SETTLEMENT_WIN_REPUTATION and
+    losers lose up to SETTLEMENT_LOSS_REPUTATION, scaled by their
+    confidence_score.
+
+    Args:
+        option_ids (ndarray): Each prediction's option_id (object dtype)
+        amounts (ndarray): Each prediction's amount (int64)
+        confidences (ndarray): Each prediction's confidence_score (float64)
+        winners_values (set): Option ids/values that won
+        pools (tuple, optional): (total_pool, winning_pool) fixed when the
+            event was resolved; computed from amounts if omitted
+
+    Returns:
+        tuple: (is_winner bool array, payout array, reputation_delta int array, summary dict)
+
+    Raises:
+        EventResolutionError: If any amount is negative
+    """
+    check_amounts(amounts)
+    is_winner = np.isin(option_ids, list(winners_values))
+    total_pool, winning_pool = pools or pool_totals(option_ids, amounts, winners_values)
+
+    if winning_pool == 0:
+        payouts = amounts.copy()
+    else:
+        winning_amounts = amounts[is_winner]
+        if winning_amounts.size and int(winning_amounts.max()) * total_pool > INT64_LIMIT:
+            winning_amounts = winning_amounts.astype(object)
+        stakes = winning_amounts * total_pool
+        shares, remainders = stakes // winning_pool, stakes % winning_pool
+        leftover = total_pool - int(shares.sum())
+        if leftover > 0:
+            # Stable sort keeps ties in prediction id order, so re-runs agree
+            order = np.argsort(-remainders.astype(np.float64), kind="stable")
+            shares[order[:leftover]] += 1
+        payouts = np.zeros(len(amounts), dtype=shares.dtype)
+        payouts[is_winner] = shares
+
+    deltas = np.where(
+        is_winner,
+        np.rint(SETTLEMENT_WIN_REPUTATION * confidences),
+        -np.rint(SETTLEMENT_LOSS_REPUTATION * confidences)
+    ).astype(np.int64)
+
+    summary = {
+        "predictions": int(len(amounts)),
+        "winners": int(is_winner.sum()),
+        "total_pool": total_pool,
+        "winning_pool": winning_pool,
+        "refunded": winning_pool == 0
+    }
+    return is_winner, payouts, deltas, summary
+
+
+def load_predictions(event_id, page_size=SETTLEMENT_PAGE_SIZE):
+    """Read every prediction on an event into column arrays, in id order
+
+    Returns:
+        dict: ids, user_ids, option_ids (object arrays), amounts (int64),
+            confidences (float64) and settled (bool)
+    """
+    columns = {"ids": [], "user_ids": [], "option_ids": [], "amounts": [], "confidences": [], "settled": []}
+    after = None
+    while True:
+        query = (supabase_admin.table("predictions")
+                 .select("id,user_id,option_id,amount,confidence_score,settled_at")
+                 .eq("event_id", event_id)
+                 .order("id")
+                 .limit(page_size))
+        if after is not None:
+            query = query.gt("id", after)
+        rows = execute_with_retry(query, f"load_predictions_for_settlement({event_id})").data or []
+        for row in rows:
+            columns["ids"].append(row["id"])
+            columns["user_ids"].append(row["user_id"])
+            columns["option_ids"].append(str(row.get("option_id")))
+            columns["amounts"].append(row.get("amount") or 0)
+            confidence = row.get("confidence_score")
+            columns["confidences"].append(models.DEFAULT_CONFIDENCE_SCORE if confidence is None else confidence)
+            columns["settled"].append(row.get("settled_at") is not None)
+        if len(rows) < page_size:
+            break
+        after = rows[-1]["id"]
+
+    return {
+        "ids": np.array(columns["ids"], dtype=object),
+        "user_ids": np.array(columns["user_ids"], dtype=object),
+        "option_ids": np.array(columns["option_ids"], dtype=object),
+        "amounts": np.array(columns["amounts"], dtype=np.int64),
+        "confidences": np.array(columns["confidences"], dtype=np.float64),
+        "settled": np.array(columns["settled"], dtype=bool)
+    }
+
+
+def get_event_for_settlement(event_id):
+    query = supabase_admin.table("events").select(
+        "id,title,options,is_resolved,resolved_option,resolved_option_id,total_pool,winning_pool"
+    ).eq("id", event_id)
+    rows = execute_with_retry(query, f"get_event_for_settlement({event_id})").data
+    if not rows:
+        raise EventResolutionError("Event not found", status=404)
+    return rows[0]
+
+
+def check_same_resolution(event, values):
+    option = recorded_option(event)
+    if option not in values:
+        raise SettlementConflict(f"Event is already resolved to option {option}")
+
+
+def resolve_event(event_id, option_id):
+    """Mark an event as resolved to option_id
+
+    The chosen option is always stored (resolved_option, plus
+    resolved_option_id when it is a UUID), and a later call is only
+    accepted if it names the same option, so an interrupted settlement
+    can be re-run but never switched to another winner.
+
+    Returns:
+        tuple: (event row, set of winning option ids/values)
+
+    Raises:
+        EventResolutionError: If the event or option does not exist
+        SettlementConflict: If the event is already resolved to another option
+    """
+    event = get_event_for_settlement(event_id)
+    resolved_option, values = winning_values(event, option_id)
+    if recorded_option(event) is not None:
+        check_same_resolution(event, values)
+        return event, values
+
+    # Conditional on no option being recorded yet, so two resolvers can't both win
+    now = datetime.now(timezone.utc).isoformat()
+    query = (supabase_admin.table("events").update({
+        "is_resolved": True,
+        "resolved_option": resolved_option,
+        "resolved_option_id": as_uuid(resolved_option),
+        "resolved_at": now,
+        "updated_at": now
+    }).eq("id", event_id).is_("resolved_option", "null").is_("resolved_option_id", "null"))
+    updated = execute_with_retry(query, f"resolve_event({event_id})").data
+    models.invalidate_event_cache()
+    if not updated:
+        # Someone else resolved it first; accept only if they picked the same option
+        event = get_event_for_settlement(event_id)
+        if recorded_option(event) is None:
+            raise Exception(f"Could not resolve event {event_id}")
+        check_same_resolution(event, values)
+        return event, values
+    return updated[0], values
+
+
+def fix_pools(event, pools):
+    """Store an event's pool totals on its first settlement run and return the stored ones
+
+    A resumed run pays out from the same pools as the batches already
+    written, even if the event's predictions no longer add up to them.
+
+    Returns:
+        tuple: (total_pool, winning_pool)
+    """
+    if event.get("total_pool") is None:
+        query = (supabase_admin.table("events").update({"total_pool": pools[0], "winning_pool": pools[1]})
+                 .eq("id", event["id"]).is_("total_pool", "null"))
+        if execute_with_retry(query, f"fix_settlement_pools({event['id']})").data:
+            return pools
+        # Another run fixed them first
+        event = get_event_for_settlement(event["id"])
+    fixed = (int(event["total_pool"]), int(event["winning_pool"]))
+    if fixed != pools:
+        logger.warning("Event %s predictions now total %s, settling with the pools fixed at resolution %s",
+                       event["id"], pools, fixed)
+    return fixed
+
+
+def write_settlements(event_id, rows):
+    """Store one batch of prediction outcomes and apply their reputation deltas
+
+    apply_prediction_settlements only touches predictions that are not
+    settled yet, in one transaction, so a batch that is retried or re-run
+    never applies a reputation delta twice.
+
+    Returns:
+        list: {"id", "reputation_score"} for every user whose score changed
+    """
+    query = supabase_admin.rpc("apply_prediction_settlements", {"p_event_id": event_id, "p_rows": rows})
+    return execute_with_retry(query, f"apply_prediction_settlements({event_id})", table="predictions").data or []
+
+
+def settle_event(event_id, option_id, batch_size=SETTLEMENT_BATCH_SIZE):
+    """Resolve an event and settle all of its predictions
+
+    The pools are fixed on the first run. Outcomes are computed for every
+    prediction, but only predictions without a settled_at are written, so
+    the call is idempotent and resumes where an interrupted run stopped.
+
+    Args:
+        event_id (str): The event to resolve
+        option_id (str): The winning option's id or value
+        batch_size (int): Predictions written per database call
+
+    Returns:
+        dict: Counts and pool totals for the settlement
+
+    Raises:
+        EventResolutionError: If the event or option does not exist
+        SettlementConflict: If the event is already resolved to another option
+    """
+    option_id = str(option_id)
+    try:
+        event_id = str(uuid.UUID(str(event_id)))
+    except ValueError:
+        raise EventResolutionError("Event ID must be a UUID")
+    event, values = resolve_event(event_id, option_id)
+
+    predictions = load_predictions(event_id)
+    pools = fix_pools(event, pool_totals(predictions["option_ids"], predictions["amounts"], values))
+    is_winner, payouts, deltas, summary = compute_settlement(
+        predictions["option_ids"], predictions["amounts"], predictions["confidences"], values, pools
+    )
+
+    pending = np.flatnonzero(~predictions["settled"])
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        rows = [{
+            "id": predictions["ids"][i],
+            "is_winner": bool(is_winner[i]),
+            "payout": int(payouts[i]),
+            "reputation_delta": int(deltas[i])
+        } for i in batch]
+        for profile in write_settlements(event_id, rows):
+            leaderboard.record_score(profile.get("id"), profile.get("reputation_score"))
+        for user_id in set(predictions["user_ids"][batch]):
+            models.invalidate_user_stats(user_id)
+
+    now = datetime.now(timezone.utc).isoformat()
+    execute_with_retry(
+        supabase_admin.table("events").update({"settled_at": now, "updated_at": now}).eq("id", event_id),
+        f"mark_event_settled({event_id})"
+    )
+    models.invalidate_event_cache()
+
+    summary.update({
+        "event_id": event_id,
+        "title": event.get("title"),
+        "resolved_option": recorded_option(event),
+        "settled": int(len(pending)),
+        "already_settled": int(predictions["settled"].sum()),
+        "paid_out": int(payouts.sum())
+    })
+    logger.info("Settled event %s: %s predictions (%s new), %s winners",
+                event_id, summary["predictions"], summary["settled"], summary["winners"])
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resolve an event and settle its predictions (safe to re-run)")
+    parser.add_argument("event_id")
+    parser.add_argument("option_id", help="The winning option's id or value")
+    args = parser.parse_args(argv)
+    token = retry_policy.start_deadline(SETTLEMENT_DEADLINE)
+    try:
+        summary = settle_event(args.event_id, args.option_id)
+        summary["notifications_sent"] = notification_fanout.notify_resolved(summary["event_id"], summary["title"], wait=True)
+        print(json.dumps(summary, indent=2))
+    finally:
+        retry_policy.clear_deadline(token)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+from flask import request, send_file, abort
+import json
+import mimetypes
+import os
+
+from structured_logging import get_logger
+
+logger = get_logger("static")
+
+# Configure the production static build (see build_static.py)
+STATIC_BUILD_DIR = os.getenv("STATIC_BUILD_DIR", "static_build")
+STATIC_BUILD = os.getenv("STATIC_BUILD", "auto")  # "auto" (use it if built from the current sources), "1" or "0"
+STATIC_IMMUTABLE_CACHE_CONTROL = os.getenv("STATIC_IMMUTABLE_CACHE_CONTROL", "public, max-age=31536000, immutable")
+STATIC_HTML_CACHE_CONTROL = os.getenv("STATIC_HTML_CACHE_CONTROL", "public, max-age=60, must-revalidate")
+STATIC_DEFAULT_CACHE_CONTROL = os.getenv("STATIC_DEFAULT_CACHE_CONTROL", "public, max-age=3600")
+
+MANIFEST_NAME = "manifest.json"
+
+# Precompressed siblings, in order of preference
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+
+
+class StaticBuild:
+    """Serves a build produced by build_static.py
+
+    Fingerprinted assets (their name contains a content hash) get an
+    immutable, year-long Cache-Control, so browsers never ask for them
+    again; HTML shells keep their names and are cached briefly and then
+    revalidated. A precompressed .br or .gz sibling is sent when the
+    client accepts that encoding.
+
+    Args:
+        directory (str): The build directory, containing manifest.json
+    """
+
+    def __init__(self, directory):
+        self.directory = os.path.abspath(directory)
+        with open(os.path.join(self.directory, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        self.assets = manifest.get("assets", {})
+        self.fingerprinted = set(self.assets.values()) | set(manifest.get("previous", []))
+
+    def cache_control(self, path):
+        if path in self.fingerprinted:
+            return STATIC_IMMUTABLE_CACHE_CONTROL
+        if path.endswith(".html"):
+            return STATIC_HTML_CACHE_CONTROL
+        return STATIC_DEFAULT_CACHE_CONTROL
+
+    def serve(self, path):
+        """Send a built file, precompressed if possible; 404s for anything outside the build"""
+        path = path.strip("/")
+        parts = path.split("/")
+        if not path or any(part.startswith(".") for part in parts) or path == MANIFEST_NAME:
+            abort(404)
+        full_path = os.path.join(self.directory, *parts)
+        if not os.path.isfile(full_path):
+            abort(404)
+
+        mimetype = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+        send_path, encoding = full_path, None
+        for candidate, suffix in PRECOMPRESSED:
+            if request.accept_encodings[candidate] and os.path.isfile(full_path + suffix):
+                send_path, encoding = full_path + suffix, candidate
+                break
+
+        response = send_file(send_path, mimetype=mimetype, conditional=True)
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        if os.path.isfile(full_path + ".gz") or os.path.isfile(full_path + ".br"):
+            response.vary.add("Accept-Encoding")
+        response.headers["Cache-Control"] = self.cache_control(path)
+        return response
+
+
+def load_static_build(root_path, source_dir=None):
+    """Return the StaticBuild to serve from, or None to serve the source directory
+
+    With STATIC_BUILD=auto the build is used whenever it exists and was
+    made from the files now in source_dir; a stale build is ignored with
+    a warning. STATIC_BUILD=1 refuses to start without a current build.
+    """
+    if STATIC_BUILD == "0":
+        return None
+    directory = os.path.join(root_path, STATIC_BUILD_DIR)
+    if not os.path.isfile(os.path.join(directory, MANIFEST_NAME)):
+        if STATIC_BUILD == "1":
+            raise RuntimeError(f"STATIC_BUILD=1 but {directory} has no {MANIFEST_NAME}; run build_static.py")
+        return None
+    if source_dir is not None and os.path.isdir(source_dir):
+        # Imported here: build_static imports this module
+        from build_static import source_digest
+        with open(os.path.join(directory, MANIFEST_NAME)) as f:
+            built_from = json.load(f).get("source_digest")
+        if built_from != source_digest(source_dir):
+            if STATIC_BUILD == "1":
+                raise RuntimeError(f"STATIC_BUILD=1 but {directory} is older than {source_dir}; run build_static.py")
+            logger.warning("Ignoring %s: it was built from different sources than %s; run build_static.py", directory, source_dir)
+            return None
+    logger.info("Serving static files from %s", directory)
+    return StaticBuild(directory)
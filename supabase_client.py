@@ -1,19 +1,370 @@
+import asyncio
+import concurrent.futures
+import contextvars
 import os
+import threading
+import time
+import httpx
+from postgrest import AsyncPostgrestClient
 from supabase import create_client
 from dotenv import load_dotenv
 
+import request_metrics
+import retry_policy
+
 # Load environment variables
 load_dotenv()
 
 # Supabase configuration
 supabase_url = os.getenv("REACT_APP_SUPABASE_URL")
 supabase_key = os.getenv("REACT_APP_SUPABASE_ANON_KEY")
+# Server-only key for privileged database functions; never send it to the browser
+supabase_service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+# HTTP connection pool configuration (per client)
+HTTP_MAX_CONNECTIONS = int(os.getenv("SUPABASE_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("SUPABASE_HTTP_MAX_KEEPALIVE_CONNECTIONS", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_HTTP_KEEPALIVE_EXPIRY", "60"))  # seconds
+HTTP_CONNECT_TIMEOUT = float(os.getenv("SUPABASE_HTTP_CONNECT_TIMEOUT", "3"))  # seconds
+HTTP_READ_TIMEOUT = float(os.getenv("SUPABASE_HTTP_READ_TIMEOUT", "10"))  # seconds
+
+# Give each thread its own client instead of sharing one per process
+CLIENT_PER_THREAD = os.getenv("SUPABASE_CLIENT_PER_THREAD", "0") == "1"
+
+
+def cap_timeouts(request):
+    """Cap a request's timeouts at the time left for the current retry attempt"""
+    remaining = retry_policy.attempt_timeout()
+    if remaining is None:
+        return
+    timeouts = request.extensions.get("timeout", {})
+    request.extensions["timeout"] = {
+        name: remaining if value is None else min(value, remaining) for name, value in timeouts.items()
+    }
+
+
+class CountingTransport(httpx.HTTPTransport):
+    """HTTP transport that reports request start/finish to its manager
+
+    Each round trip is also recorded against the current request, so
+    direct .execute() calls are counted along with execute_with_retry().
+    Inside call_with_retry its timeouts are capped at what is left of
+    the request's deadline.
+    """
+
+    def __init__(self, manager, **kwargs):
+        super().__init__(**kwargs)
+        self._manager = manager
+
+    def handle_request(self, request):
+        cap_timeouts(request)
+        self._manager._request_started()
+        started = time.perf_counter()
+        try:
+            return super().handle_request(request)
+        except Exception:
+            self._manager._request_failed()
+            raise
+        finally:
+            request_metrics.record_round_trip(time.perf_counter() - started)
+            self._manager._request_finished()
+
+
+class AsyncCountingTransport(httpx.AsyncHTTPTransport):
+    """Async counterpart of CountingTransport"""
+
+    def __init__(self, manager, **kwargs):
+        super().__init__(**kwargs)
+        self._manager = manager
+
+    async def handle_async_request(self, request):
+        cap_timeouts(request)
+        self._manager._request_started()
+        started = time.perf_counter()
+        try:
+            return await super().handle_async_request(request)
+        except Exception:
+            self._manager._request_failed()
+            raise
+        finally:
+            request_metrics.record_round_trip(time.perf_counter() - started)
+            self._manager._request_finished()
+
+
+class SupabaseClientManager:
+    """Creates Supabase clients lazily, one per process (or per thread)
+
+    Clients are never shared across a fork: the first call in a new
+    process builds a fresh client, so pre-fork servers (gunicorn,
+    uwsgi) don't reuse the parent's sockets. Each client's PostgREST
+    session is replaced with an httpx.Client that has an explicitly
+    sized keep-alive pool and connect/read timeouts.
+    """
+
+    def __init__(self, url, key, per_thread=False, key_name="REACT_APP_SUPABASE_ANON_KEY"):
+        self.url = url
+        self.key = key
+        self.key_name = key_name
+        self.per_thread = per_thread
+        self._lock = threading.Lock()
+        self._create_lock = threading.Lock()
+        self._pid = os.getpid()
+        self._client = None
+        self._local = threading.local()
+        self._sessions = []
+        self._clients_created = 0
+        self._requests_sent = 0
+        self._requests_failed = 0
+        self._in_flight = 0
+
+    def get_client(self):
+        """Return the Supabase client for the current process / thread"""
+        if self._pid != os.getpid():
+            self._forget_clients()
+
+        if self.per_thread:
+            client = getattr(self._local, "client", None)
+            if client is None:
+                client = self._create_client()
+                self._local.client = client
+            return client
+
+        if self._client is None:
+            with self._create_lock:
+                if self._client is None:
+                    self._client = self._create_client()
+        return self._client
+
+    def _forget_clients(self):
+        """Drop clients inherited from the parent process without closing their sockets"""
+        self._lock = threading.Lock()
+        self._create_lock = threading.Lock()
+        self._pid = os.getpid()
+        self._client = None
+        self._local = threading.local()
+        self._sessions = []
+        self._clients_created = 0
+        self._requests_sent = 0
+        self._requests_failed = 0
+        self._in_flight = 0
+
+    def _create_client(self):
+        if not self.key:
+            raise RuntimeError(f"{self.key_name} is not set")
+        client = create_client(self.url, self.key)
+        self._install_pool(client)
+        with self._lock:
+            self._clients_created += 1
+        return client
+
+    def _install_pool(self, client):
+        """Swap the client's default PostgREST session for a tuned, pooled one"""
+        postgrest = client.postgrest
+        default_session = postgrest.session
+        session = httpx.Client(
+            base_url=default_session.base_url,
+            headers=default_session.headers,
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            transport=CountingTransport(
+                self,
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+                )
+            )
+        )
+        default_session.close()
+        postgrest.session = session
+        with self._lock:
+            self._sessions.append(session)
+
+    def _request_started(self):
+        with self._lock:
+            self._requests_sent += 1
+            self._in_flight += 1
+
+    def _request_failed(self):
+        with self._lock:
+            self._requests_failed += 1
+
+    def _request_finished(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def stats(self):
+        """Return pool utilisation for the clients of the current process"""
+        with self._lock:
+            sessions = list(self._sessions)
+            stats = {
+                "pid": self._pid,
+                "per_thread": self.per_thread,
+                "clients": self._clients_created,
+                "requests_sent": self._requests_sent,
+                "requests_failed": self._requests_failed,
+                "in_flight": self._in_flight,
+                "max_connections_per_client": HTTP_MAX_CONNECTIONS,
+                "max_keepalive_connections_per_client": HTTP_MAX_KEEPALIVE_CONNECTIONS
+            }
+
+        open_connections = 0
+        idle_connections = 0
+        for session in sessions:
+            # httpcore does not expose pool stats publicly; read them best-effort
+            try:
+                connections = session._transport._pool.connections
+            except AttributeError:
+                continue
+            open_connections += len(connections)
+            idle_connections += sum(1 for conn in connections if conn.is_idle())
+        stats["open_connections"] = open_connections
+        stats["idle_connections"] = idle_connections
+        return stats
 
-# Create Supabase client
-supabase = create_client(supabase_url, supabase_key)
+
+class AsyncClientManager(SupabaseClientManager):
+    """Runs async PostgREST queries on one pooled client per process
+
+    httpx.AsyncClient is bound to the event loop it is used on, and Flask
+    runs each async view on a loop of its own, so the client lives on a
+    background event loop owned by this manager. Views hand their
+    coroutines to run() and await the result; the coroutine keeps the
+    view's context, so round trips and deadlines are still accounted to
+    the request. Like the sync clients, the loop and client are created
+    lazily and never shared across a fork.
+    """
+
+    def __init__(self, url, key, key_name="REACT_APP_SUPABASE_ANON_KEY"):
+        super().__init__(url, key, key_name=key_name)
+        self._loop = None
+
+    def _forget_clients(self):
+        super()._forget_clients()
+        self._loop = None
+
+    def _get_loop(self):
+        if self._pid != os.getpid():
+            self._forget_clients()
+        if self._loop is None:
+            with self._create_lock:
+                if self._loop is None:
+                    if not self.key:
+                        raise RuntimeError(f"{self.key_name} is not set")
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name="supabase-async", daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    def _create_client(self):
+        # Called on the manager's loop, so the pool is bound to it
+        client = AsyncPostgrestClient(
+            f"{self.url}/rest/v1",
+            headers={"apikey": self.key, "Authorization": f"Bearer {self.key}"}
+        )
+        default_session = client.session
+        client.session = httpx.AsyncClient(
+            base_url=default_session.base_url,
+            headers=default_session.headers,
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            transport=AsyncCountingTransport(
+                self,
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+                )
+            )
+        )
+        with self._lock:
+            self._sessions.append(client.session)
+            self._clients_created += 1
+        return client
+
+    def submit(self, fn):
+        """Schedule fn(client) on the manager's loop
+
+        Args:
+            fn (callable): Takes the AsyncPostgrestClient and returns a coroutine
+
+        Returns:
+            concurrent.futures.Future: The coroutine's result
+        """
+        loop = self._get_loop()
+        future = concurrent.futures.Future()
+
+        def start():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                if self._client is None:
+                    self._client = self._create_client()
+                task = loop.create_task(fn(self._client))
+            except Exception as e:
+                future.set_exception(e)
+                return
+
+            def finish(task):
+                if task.cancelled():
+                    future.cancel()
+                elif task.exception() is not None:
+                    future.set_exception(task.exception())
+                else:
+                    future.set_result(task.result())
+
+            task.add_done_callback(finish)
+
+        loop.call_soon_threadsafe(start, context=contextvars.copy_context())
+        return future
+
+    async def run(self, fn):
+        """Await fn(client) from any event loop; see submit()"""
+        return await asyncio.wrap_future(self.submit(fn))
+
+
+class SupabaseClientProxy:
+    """Module-level stand-in that forwards to the current process's client
+
+    Lets modules keep a global `supabase` name without creating a client
+    at import time (before a pre-fork server forks its workers).
+    """
+
+    def __init__(self, manager):
+        self._manager = manager
+
+    def __getattr__(self, name):
+        return getattr(self._manager.get_client(), name)
+
+
+client_manager = SupabaseClientManager(supabase_url, supabase_key, per_thread=CLIENT_PER_THREAD)
+
+# Lazily-resolved Supabase client
+supabase = SupabaseClientProxy(client_manager)
+
+# Service-role client for the database functions that the anon key may not execute
+service_client_manager = SupabaseClientManager(
+    supabase_url, supabase_service_key, per_thread=CLIENT_PER_THREAD, key_name="SUPABASE_SERVICE_ROLE_KEY"
+)
+supabase_admin = SupabaseClientProxy(service_client_manager)
+
+# Pooled async client for the async views (ASYNC_ROUTES=1)
+async_client_manager = AsyncClientManager(supabase_url, supabase_key)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=client_manager._forget_clients)
+    os.register_at_fork(after_in_child=service_client_manager._forget_clients)
+    os.register_at_fork(after_in_child=async_client_manager._forget_clients)
 
 def get_supabase_client():
     """
-    Returns the Supabase client instance
+    Returns the Supabase client instance for the current process (or thread)
+    """
+    return client_manager.get_client()
+
+def get_pool_stats():
+    """
+    Returns HTTP connection pool statistics for the current process
     """
-    return supabase
+    stats = client_manager.stats()
+    stats["service_role"] = service_client_manager.stats()
+    stats["async"] = async_client_manager.stats()
+    return stats
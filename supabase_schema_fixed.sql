@@ -56,6 +56,18 @@ FOR ALL
 TO authenticated
 USING (wallet_address = current_setting('request.jwt.claim.sub', true)::text);
 
+-- Revoked bearer tokens (SHA-256 hashes), rejected by every process until they expire
+CREATE TABLE IF NOT EXISTS public.revoked_tokens (
+    token_hash TEXT PRIMARY KEY,
+    expires_at TIMESTAMP WITH TIME ZONE,
+    revoked_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_revoked_tokens_revoked_at ON public.revoked_tokens(revoked_at);
+
+-- No policies: only the service role reads and writes revocations
+ALTER TABLE public.revoked_tokens ENABLE ROW LEVEL SECURITY;
+
 -- Create events table
 CREATE TABLE IF NOT EXISTS public.events (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -80,6 +92,10 @@ CREATE INDEX IF NOT EXISTS events_category_idx ON public.events(category);
 CREATE INDEX IF NOT EXISTS events_end_time_idx ON public.events(end_time);
 CREATE INDEX IF NOT EXISTS events_created_at_idx ON public.events(created_at);
 
+-- Composite indexes for keyset pagination of the events listing on (created_at, id)
+CREATE INDEX IF NOT EXISTS events_created_at_id_idx ON public.events(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS events_category_created_at_id_idx ON public.events(category, created_at DESC, id DESC);
+
 -- Create predictions table
 CREATE TABLE IF NOT EXISTS public.predictions (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
@@ -87,7 +103,7 @@ CREATE TABLE IF NOT EXISTS public.predictions (
     user_id UUID NOT NULL REFERENCES public.user_profiles(id),
     option_id TEXT NOT NULL,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-    amount INTEGER DEFAULT 0,
+    amount INTEGER DEFAULT 0 CHECK (amount >= 0),
     confidence_score FLOAT DEFAULT 0.5,
     UNIQUE(event_id, user_id) -- Each user can only predict once per event
 );
@@ -337,4 +353,328 @@ BEGIN
   ORDER BY 
     p.created_at DESC;
 END;
-$$ LANGUAGE plpgsql;
\ No newline at end of file
+$$ LANGUAGE plpgsql;
+-- Per-event, per-option prediction tallies
+-- Maintained incrementally by a trigger on predictions so that outcome
+-- percentages are read from one row per option instead of counting every
+-- prediction. avg_confidence is derived from the running sum.
+CREATE TABLE IF NOT EXISTS public.event_option_tallies (
+    event_id UUID NOT NULL REFERENCES public.events(id) ON DELETE CASCADE,
+    option_id TEXT NOT NULL,
+    prediction_count INTEGER NOT NULL DEFAULT 0,
+    total_amount BIGINT NOT NULL DEFAULT 0,
+    confidence_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    avg_confidence DOUBLE PRECISION GENERATED ALWAYS AS (
+        CASE WHEN prediction_count > 0 THEN confidence_sum / prediction_count END
+    ) STORED,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    PRIMARY KEY (event_id, option_id)
+);
+
+ALTER TABLE public.event_option_tallies ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Tallies are viewable by everyone" ON public.event_option_tallies;
+CREATE POLICY "Tallies are viewable by everyone"
+ON public.event_option_tallies FOR SELECT
+TO authenticated, anon
+USING (true);
+
+-- Add a delta to one (event, option) tally, creating the row on first use
+CREATE OR REPLACE FUNCTION bump_event_option_tally(
+  p_event_id UUID,
+  p_option_id TEXT,
+  p_count INTEGER,
+  p_amount BIGINT,
+  p_confidence DOUBLE PRECISION
+)
+RETURNS VOID AS $$
+BEGIN
+  INSERT INTO public.event_option_tallies AS t (event_id, option_id, prediction_count, total_amount, confidence_sum)
+  VALUES (p_event_id, p_option_id, p_count, p_amount, p_confidence)
+  ON CONFLICT (event_id, option_id) DO UPDATE SET
+    prediction_count = t.prediction_count + EXCLUDED.prediction_count,
+    total_amount = t.total_amount + EXCLUDED.total_amount,
+    confidence_sum = t.confidence_sum + EXCLUDED.confidence_sum,
+    updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION maintain_event_option_tallies()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM bump_event_option_tally(OLD.event_id, OLD.option_id, -1,
+      -COALESCE(OLD.amount, 0), -COALESCE(OLD.confidence_score, 0));
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM bump_event_option_tally(NEW.event_id, NEW.option_id, 1,
+      COALESCE(NEW.amount, 0), COALESCE(NEW.confidence_score, 0));
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS maintain_event_option_tallies ON public.predictions;
+CREATE TRIGGER maintain_event_option_tallies
+AFTER INSERT OR UPDATE OF event_id, option_id, amount, confidence_score OR DELETE ON public.predictions
+FOR EACH ROW EXECUTE PROCEDURE maintain_event_option_tallies();
+
+-- Recompute tallies from the predictions table, for one event or (NULL) all events
+CREATE OR REPLACE FUNCTION rebuild_event_option_tallies(p_event_id UUID DEFAULT NULL)
+RETURNS INTEGER AS $$
+DECLARE
+  rebuilt INTEGER;
+BEGIN
+  -- Hold off concurrent prediction writes so their trigger deltas can't interleave
+  LOCK TABLE public.predictions IN SHARE MODE;
+
+  DELETE FROM public.event_option_tallies
+  WHERE p_event_id IS NULL OR event_id = p_event_id;
+
+  INSERT INTO public.event_option_tallies (event_id, option_id, prediction_count, total_amount, confidence_sum)
+  SELECT
+    event_id,
+    option_id,
+    COUNT(*),
+    COALESCE(SUM(amount), 0),
+    COALESCE(SUM(confidence_score), 0)
+  FROM public.predictions
+  WHERE p_event_id IS NULL OR event_id = p_event_id
+  GROUP BY event_id, option_id;
+
+  GET DIAGNOSTICS rebuilt = ROW_COUNT;
+  RETURN rebuilt;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Tallies are only written by the trigger (which runs as the owner) and by the
+-- server's service-role client; rebuild also locks predictions, so keep both private
+REVOKE EXECUTE ON FUNCTION bump_event_option_tally(UUID, TEXT, INTEGER, BIGINT, DOUBLE PRECISION) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION rebuild_event_option_tallies(UUID) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION rebuild_event_option_tallies(UUID) TO service_role;
+
+-- Backfill tallies for predictions that existed before the trigger
+SELECT rebuild_event_option_tallies();
+
+-- Serves per-user prediction lookups and counts (the unique index leads with event_id)
+CREATE INDEX IF NOT EXISTS predictions_user_id_created_at_idx ON public.predictions(user_id, created_at DESC);
+
+-- Settlement results, written by settlement.py when an event is resolved
+ALTER TABLE public.events ADD COLUMN IF NOT EXISTS resolved_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE public.events ADD COLUMN IF NOT EXISTS settled_at TIMESTAMP WITH TIME ZONE;
+-- The winning option's id (or value, for options without one) as chosen by the resolver.
+-- resolved_option_id is only filled in when that id is a UUID.
+ALTER TABLE public.events ADD COLUMN IF NOT EXISTS resolved_option TEXT;
+-- Pool totals fixed on the first settlement run, so a resumed run pays out the same
+ALTER TABLE public.events ADD COLUMN IF NOT EXISTS total_pool BIGINT;
+ALTER TABLE public.events ADD COLUMN IF NOT EXISTS winning_pool BIGINT;
+ALTER TABLE public.predictions ADD COLUMN IF NOT EXISTS is_winner BOOLEAN;
+ALTER TABLE public.predictions ADD COLUMN IF NOT EXISTS payout BIGINT;
+ALTER TABLE public.predictions ADD COLUMN IF NOT EXISTS reputation_delta INTEGER;
+ALTER TABLE public.predictions ADD COLUMN IF NOT EXISTS settled_at TIMESTAMP WITH TIME ZONE;
+-- Stakes are paid out at settlement, so a negative one would take from the winners
+ALTER TABLE public.predictions DROP CONSTRAINT IF EXISTS predictions_amount_check;
+ALTER TABLE public.predictions ADD CONSTRAINT predictions_amount_check CHECK (amount >= 0);
+
+-- Refuse predictions on resolved events. The event row is locked FOR SHARE, so a
+-- resolution waits for in-flight predictions to commit (and settlement then reads
+-- them), and a prediction that waits for a resolution sees it and is rejected.
+CREATE OR REPLACE FUNCTION reject_predictions_on_resolved_events()
+RETURNS TRIGGER AS $$
+DECLARE
+  resolved BOOLEAN;
+BEGIN
+  SELECT is_resolved INTO resolved FROM public.events WHERE id = NEW.event_id FOR SHARE;
+  IF COALESCE(resolved, FALSE) THEN
+    RAISE EXCEPTION 'Event % is already resolved', NEW.event_id USING ERRCODE = 'check_violation';
+  END IF;
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS reject_predictions_on_resolved_events ON public.predictions;
+CREATE TRIGGER reject_predictions_on_resolved_events
+BEFORE INSERT OR UPDATE OF event_id ON public.predictions
+FOR EACH ROW EXECUTE PROCEDURE reject_predictions_on_resolved_events();
+
+-- Serves settlement's keyset scan of one event's predictions
+CREATE INDEX IF NOT EXISTS predictions_event_id_id_idx ON public.predictions(event_id, id);
+
+-- Store a batch of settlement outcomes and apply the reputation deltas in one transaction.
+-- Only predictions that are not settled yet are updated, and only their deltas are added,
+-- so a retried or re-run batch changes nothing. Returns the new score of every user changed.
+CREATE OR REPLACE FUNCTION apply_prediction_settlements(p_event_id UUID, p_rows JSONB)
+RETURNS TABLE (id UUID, reputation_score INTEGER) AS $$
+#variable_conflict use_column
+BEGIN
+  RETURN QUERY
+  WITH settled AS (
+    UPDATE public.predictions p SET
+      is_winner = r.is_winner,
+      payout = r.payout,
+      reputation_delta = r.reputation_delta,
+      settled_at = NOW()
+    FROM jsonb_to_recordset(p_rows) AS r(id UUID, is_winner BOOLEAN, payout BIGINT, reputation_delta INTEGER)
+    WHERE p.id = r.id AND p.event_id = p_event_id AND p.settled_at IS NULL
+    RETURNING p.user_id, p.reputation_delta
+  ), deltas AS (
+    SELECT s.user_id, SUM(s.reputation_delta)::INTEGER AS delta
+    FROM settled s
+    GROUP BY s.user_id
+  )
+  UPDATE public.user_profiles u SET
+    reputation_score = COALESCE(u.reputation_score, 0) + d.delta,
+    updated_at = NOW()
+  FROM deltas d
+  WHERE u.id = d.user_id AND d.delta <> 0
+  RETURNING u.id, u.reputation_score;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Payouts and reputation are written by the server only (service role, see settlement.py)
+REVOKE EXECUTE ON FUNCTION apply_prediction_settlements(UUID, JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION apply_prediction_settlements(UUID, JSONB) TO service_role;
+
+-- Aggregate a user's prediction statistics in one query for the profile page
+CREATE OR REPLACE FUNCTION get_user_prediction_stats(p_user_id UUID)
+RETURNS TABLE (
+  total_predictions BIGINT,
+  active_predictions BIGINT,
+  resolved_predictions BIGINT,
+  wins BIGINT,
+  total_staked BIGINT
+) AS $$
+BEGIN
+  RETURN QUERY
+  SELECT
+    COUNT(*),
+    COUNT(*) FILTER (WHERE NOT COALESCE(e.is_resolved, FALSE)),
+    COUNT(*) FILTER (WHERE e.is_resolved),
+    COUNT(*) FILTER (WHERE e.is_resolved AND COALESCE(p.is_winner, p.option_id = COALESCE(e.resolved_option, e.resolved_option_id::text))),
+    COALESCE(SUM(p.amount), 0)::BIGINT
+  FROM public.predictions p
+  JOIN public.events e ON e.id = p.event_id
+  WHERE p.user_id = p_user_id;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Serves per-event engagement analytics
+CREATE INDEX IF NOT EXISTS event_engagement_event_id_created_at_idx ON public.event_engagement(event_id, created_at);
+
+-- Don't bump updated_at (and with it every event ETag) when only view_count changes
+DROP TRIGGER IF EXISTS update_events_timestamp ON public.events;
+CREATE TRIGGER update_events_timestamp
+BEFORE UPDATE ON public.events
+FOR EACH ROW
+WHEN ((to_jsonb(OLD) - 'view_count' - 'updated_at') IS DISTINCT FROM (to_jsonb(NEW) - 'view_count' - 'updated_at'))
+EXECUTE PROCEDURE update_timestamp();
+
+-- Write a batch of buffered engagement records (see engagement.py) and add its views
+-- to events.view_count, one UPDATE per event, in a single transaction.
+-- Records for deleted events are skipped, and unknown user ids are stored as NULL.
+-- Returns the number of rows inserted as a one-row table; postgrest-py can't parse a bare integer.
+CREATE OR REPLACE FUNCTION record_event_engagement(p_rows JSONB)
+RETURNS TABLE (inserted INTEGER) AS $$
+BEGIN
+  INSERT INTO public.event_engagement (event_id, user_id, ip_address, user_agent, engagement_type, created_at)
+  SELECT
+    r.event_id,
+    CASE WHEN EXISTS (SELECT 1 FROM public.user_profiles u WHERE u.id = r.user_id) THEN r.user_id END,
+    r.ip_address,
+    r.user_agent,
+    r.engagement_type,
+    COALESCE(r.created_at, NOW())
+  FROM jsonb_to_recordset(p_rows) AS r(
+    event_id UUID, user_id UUID, ip_address TEXT, user_agent TEXT, engagement_type TEXT, created_at TIMESTAMP WITH TIME ZONE
+  )
+  WHERE EXISTS (SELECT 1 FROM public.events e WHERE e.id = r.event_id);
+  GET DIAGNOSTICS inserted = ROW_COUNT;
+  RETURN NEXT;
+
+  UPDATE public.events e
+  SET view_count = COALESCE(e.view_count, 0) + v.views
+  FROM (
+    SELECT (r->>'event_id')::UUID AS event_id, COUNT(*) AS views
+    FROM jsonb_array_elements(p_rows) AS r
+    WHERE r->>'engagement_type' = 'view'
+    GROUP BY 1
+  ) v
+  WHERE e.id = v.event_id;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Engagement is only written by the server's flusher (service role, see engagement.py)
+REVOKE EXECUTE ON FUNCTION record_event_engagement(JSONB) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION record_event_engagement(JSONB) TO service_role;
+
+-- Per-user settings (models_supabase.get_user_settings / update_settings)
+CREATE TABLE IF NOT EXISTS public.settings (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    user_id UUID NOT NULL UNIQUE REFERENCES public.user_profiles(id) ON DELETE CASCADE,
+    notifications_enabled BOOLEAN DEFAULT TRUE,
+    email_notifications BOOLEAN DEFAULT FALSE,
+    dark_mode BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- The "event ending" alert: claimed by one process while it is being sent (the claim
+-- expires if that process dies), and marked as sent once the fan-out succeeded
+ALTER TABLE public.events ADD COLUMN IF NOT EXISTS ending_claimed_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE public.events ADD COLUMN IF NOT EXISTS ending_notified_at TIMESTAMP WITH TIME ZONE;
+
+-- Serves the unread-count and newest-first notification queries
+CREATE INDEX IF NOT EXISTS notifications_user_unread_idx ON public.notifications(user_id) WHERE NOT is_read;
+CREATE INDEX IF NOT EXISTS notifications_user_created_at_idx ON public.notifications(user_id, created_at DESC);
+
+-- At most one notification of each event-wide type per user and event, so fan-outs can be re-run
+CREATE UNIQUE INDEX IF NOT EXISTS notifications_user_type_ref_idx ON public.notifications(user_id, type, ref_id)
+WHERE type IN ('event_ending', 'result_announced');
+
+-- Notify one batch of an event's predictors (see notifications.py): the next p_limit predictors
+-- after p_after in user_id order, minus those who turned notifications off, in one INSERT.
+-- Settled winners get p_winner_content (with {payout} filled in) when it is given.
+-- last_user_id is NULL once there are no predictors left.
+CREATE OR REPLACE FUNCTION fan_out_event_notification(
+  p_event_id UUID,
+  p_type TEXT,
+  p_title TEXT,
+  p_content TEXT,
+  p_winner_content TEXT DEFAULT NULL,
+  p_after UUID DEFAULT NULL,
+  p_limit INTEGER DEFAULT 10000
+)
+RETURNS TABLE (inserted INTEGER, last_user_id UUID) AS $$
+BEGIN
+  RETURN QUERY
+  WITH batch AS (
+    SELECT p.user_id, p.is_winner, p.payout
+    FROM public.predictions p
+    WHERE p.event_id = p_event_id AND (p_after IS NULL OR p.user_id > p_after)
+    ORDER BY p.user_id
+    LIMIT p_limit
+  ), sent AS (
+    INSERT INTO public.notifications (user_id, title, content, type, ref_id)
+    SELECT
+      b.user_id,
+      p_title,
+      CASE WHEN b.is_winner AND p_winner_content IS NOT NULL
+        THEN replace(p_winner_content, '{payout}', COALESCE(b.payout, 0)::TEXT)
+        ELSE p_content END,
+      p_type,
+      p_event_id
+    FROM batch b
+    LEFT JOIN public.settings s ON s.user_id = b.user_id
+    WHERE COALESCE(s.notifications_enabled, TRUE)
+    ON CONFLICT (user_id, type, ref_id) WHERE type IN ('event_ending', 'result_announced') DO NOTHING
+    RETURNING 1
+  )
+  SELECT
+    (SELECT COUNT(*) FROM sent)::INTEGER,
+    CASE WHEN (SELECT COUNT(*) FROM batch) = p_limit THEN (SELECT MAX(b.user_id) FROM batch b) END;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Notification text is chosen by the server only (service role, see notifications.py)
+REVOKE EXECUTE ON FUNCTION fan_out_event_notification(UUID, TEXT, TEXT, TEXT, TEXT, UUID, INTEGER) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION fan_out_event_notification(UUID, TEXT, TEXT, TEXT, TEXT, UUID, INTEGER) TO service_role;
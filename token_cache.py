@@ -0,0 +1,192 @@
+from datetime import datetime, timedelta, timezone
+import hashlib
+import os
+import threading
+import time
+
+from cache import TTLCache
+from retry_policy import call_with_retry
+from structured_logging import get_logger
+import supabase_client
+from supabase_client import supabase_admin
+
+logger = get_logger("token_cache")
+
+# Configure the verified-token cache
+TOKEN_CACHE_MAX_SIZE = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "10000"))
+# Longest a token is trusted without re-verifying it, even if its exp is later
+TOKEN_CACHE_MAX_TTL = float(os.getenv("TOKEN_CACHE_MAX_TTL", "900"))  # seconds
+# How often each process reads revocations made by other processes
+TOKEN_REVOCATION_SYNC_INTERVAL = float(os.getenv("TOKEN_REVOCATION_SYNC_INTERVAL", "5"))  # seconds
+
+
+def token_key(token):
+    """Hash a token so raw bearer tokens are never kept in memory as cache keys"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def seconds_until(exp):
+    """Seconds from now until a JWT exp claim (Unix time), or None if there is no exp"""
+    if exp is None:
+        return None
+    try:
+        return float(exp) - time.time()
+    except (TypeError, ValueError):
+        return None
+
+
+class VerifiedTokenCache:
+    """Bounded map of token hash -> user_id for tokens that already passed verification
+
+    Entries expire at the token's exp (capped at max_ttl). Revoked tokens
+    are written to the revoked_tokens table, so every process and node
+    rejects them, and are kept in a local list that is never evicted
+    before the token's exp, so a token whose signature is still valid
+    cannot be re-verified and cached again. A background thread in each
+    process reads the revocations made elsewhere every sync_interval
+    seconds and drops those tokens from its cache. Without
+    SUPABASE_SERVICE_ROLE_KEY, revocations stay local to the process.
+
+    Args:
+        max_size (int): Maximum number of verified tokens kept
+        max_ttl (float): Upper bound in seconds on how long an entry is trusted
+        sync_interval (float): Seconds between reads of revoked_tokens
+    """
+
+    table = "revoked_tokens"
+
+    def __init__(self, max_size=TOKEN_CACHE_MAX_SIZE, max_ttl=TOKEN_CACHE_MAX_TTL,
+                 sync_interval=TOKEN_REVOCATION_SYNC_INTERVAL):
+        self.max_ttl = max_ttl
+        self.sync_interval = sync_interval
+        self._verified = TTLCache(max_size=max_size, ttl=max_ttl)
+        self._lock = threading.Lock()
+        self._revoked = {}  # token hash -> exp (Unix time), or None for a token without one
+        self._synced_since = None  # revoked_at the next read starts from
+        self._syncer = None
+        self._syncer_pid = None
+        self.sync_failures = 0
+
+    def get(self, token):
+        """Return the cached user_id for token, or None if unknown, expired or revoked"""
+        self._ensure_syncer()
+        return self._verified.get(token_key(token))
+
+    def is_revoked(self, token):
+        key = token_key(token)
+        with self._lock:
+            if key not in self._revoked:
+                return False
+            exp = self._revoked[key]
+            if exp is not None and exp <= time.time():
+                del self._revoked[key]
+                return False
+            return True
+
+    def add(self, token, user_id, exp=None):
+        """Remember that token belongs to user_id until its exp claim"""
+        ttl = seconds_until(exp)
+        if ttl is None:
+            ttl = self.max_ttl
+        ttl = min(ttl, self.max_ttl)
+        if ttl <= 0:
+            return
+        self._verified.set(token_key(token), user_id, ttl)
+
+    def _remember_revoked(self, key, exp):
+        self._verified.invalidate(key)
+        with self._lock:
+            self._revoked[key] = exp
+
+    def revoke(self, token, exp=None):
+        """Reject token in every process until its exp claim
+
+        Raises:
+            Exception: If the revocation could not be stored; this process
+                rejects the token anyway
+        """
+        key = token_key(token)
+        ttl = seconds_until(exp)
+        if ttl is not None and ttl <= 0:
+            return
+        exp = None if ttl is None else float(exp)
+        self._remember_revoked(key, exp)
+        if not supabase_client.supabase_service_key:
+            logger.warning("SUPABASE_SERVICE_ROLE_KEY is not set; token revoked in this process only")
+            return
+        expires_at = None if exp is None else datetime.fromtimestamp(exp, timezone.utc).isoformat()
+        call_with_retry(
+            supabase_admin.table(self.table).upsert({"token_hash": key, "expires_at": expires_at}).execute,
+            "revoke_token",
+            breaker_name=self.table
+        )
+
+    def sync(self):
+        """Read revocations made by other processes since the last read
+
+        A failed read is logged and the last known revocations are kept.
+
+        Returns:
+            bool: True if revoked_tokens was read
+        """
+        started = datetime.now(timezone.utc)
+        with self._lock:
+            since = self._synced_since
+        try:
+            query = supabase_admin.table(self.table).select("token_hash,expires_at")
+            # Unexpired rows only; postgrest-py 0.10 has no or_()
+            query.params = query.params.add("or", f'(expires_at.is.null,expires_at.gt."{started.isoformat()}")')
+            if since is not None:
+                query = query.gte("revoked_at", since)
+            rows = call_with_retry(query.execute, "sync_revoked_tokens", breaker_name=self.table).data or []
+        except Exception as e:
+            self.sync_failures += 1
+            logger.warning("Could not read revoked tokens: %s", e)
+            return False
+        for row in rows:
+            expires_at = row.get("expires_at")
+            exp = datetime.fromisoformat(expires_at).timestamp() if expires_at else None
+            self._remember_revoked(row["token_hash"], exp)
+        with self._lock:
+            expired = [key for key, exp in self._revoked.items() if exp is not None and exp <= time.time()]
+            for key in expired:
+                del self._revoked[key]
+            # Overlap reads so a revocation that committed late is not skipped
+            self._synced_since = (started - timedelta(seconds=max(60.0, self.sync_interval * 2))).isoformat()
+        return True
+
+    def _ensure_syncer(self):
+        # Threads don't survive a fork, so each worker process starts its own
+        if self._syncer_pid == os.getpid():
+            return
+        with self._lock:
+            if self._syncer_pid == os.getpid():
+                return
+            self._syncer_pid = os.getpid()
+            if not supabase_client.supabase_service_key:
+                logger.warning("SUPABASE_SERVICE_ROLE_KEY is not set; revocations from other processes are not read")
+                return
+            self._syncer = threading.Thread(target=self._sync_forever, name="token-revocation-sync", daemon=True)
+            self._syncer.start()
+
+    def _sync_forever(self):
+        while True:
+            self.sync()
+            time.sleep(self.sync_interval)
+
+    def clear(self):
+        self._verified.clear()
+        with self._lock:
+            self._revoked.clear()
+            self._synced_since = None
+
+    def stats(self):
+        """Return hit/miss counters for verified tokens and the size of the revocation list"""
+        stats = self._verified.stats()
+        with self._lock:
+            stats["revoked"] = len(self._revoked)
+        stats["revocation_sync_failures"] = self.sync_failures
+        return stats
+
+
+token_cache = VerifiedTokenCache()
@@ -0,0 +1,187 @@
+from flask import Request, current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+import hashlib
+import os
+import shutil
+import tempfile
+
+from structured_logging import get_logger
+
+logger = get_logger("uploads")
+
+# Configure uploads
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(5 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(64 * 1024)))
+UPLOAD_CACHE_MAX_AGE = int(os.getenv("UPLOAD_CACHE_MAX_AGE", str(365 * 24 * 3600)))  # seconds
+# Where uploads are spooled while they are checked; never inside the served upload directory
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR")  # default: .upload-spool next to the upload directory
+
+# Room for multipart headers and other form fields on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Accepted image types, recognised by their leading bytes rather than the client's filename
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", ".png"),
+    (b"\xff\xd8\xff", ".jpg"),
+    (b"GIF87a", ".gif"),
+    (b"GIF89a", ".gif"),
+)
+SNIFF_BYTES = 16
+
+
+class UploadRejected(ValueError):
+    """Raised when an upload is empty or not an accepted image type"""
+
+
+def spool_directory(upload_dir):
+    """Return the directory uploads are spooled to before they are accepted
+
+    Defaults to a sibling of upload_dir, so it is normally on the same
+    filesystem and an accepted file can be hard-linked into place.
+    """
+    if UPLOAD_SPOOL_DIR:
+        return UPLOAD_SPOOL_DIR
+    upload_dir = os.path.abspath(upload_dir)
+    return os.path.join(os.path.dirname(upload_dir), ".upload-spool")
+
+
+def sniff_extension(head):
+    """Return the file extension for the image type in head, or None"""
+    for signature, extension in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ".webp"
+    return None
+
+
+class HashingUploadFile:
+    """Temporary file that hashes and size-checks data as it is written
+
+    Werkzeug writes each uploaded file part into one of these while it
+    parses the request body, so the upload reaches disk in chunks, is
+    hashed on the way and is rejected as soon as it passes max_bytes.
+    The file lives in the spool directory, outside the served upload
+    directory, until store_upload accepts it; it is deleted when closed.
+
+    Args:
+        directory (str): Directory the temporary file is created in (see spool_directory)
+        max_bytes (int): Largest accepted file
+    """
+
+    def __init__(self, directory, max_bytes=UPLOAD_MAX_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix=".incoming-", delete=True)
+        self.name = self._file.name
+        self.max_bytes = max_bytes
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.head = b""
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise RequestEntityTooLarge(f"File exceeds the {self.max_bytes} byte limit")
+        if len(self.head) < SNIFF_BYTES:
+            self.head += bytes(data[:SNIFF_BYTES - len(self.head)])
+        self.sha256.update(data)
+        return self._file.write(data)
+
+    def __getattr__(self, name):
+        # read, seek, flush, close, ... go to the underlying file
+        return getattr(self._file, name)
+
+    def __iter__(self):
+        return iter(self._file)
+
+
+class UploadRequest(Request):
+    """Request class that streams uploaded files into HashingUploadFile sinks"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingUploadFile(spool_directory(current_app.config["UPLOAD_FOLDER"]))
+
+
+def _hashed_copy(stream, directory):
+    """Copy an already-buffered upload into a HashingUploadFile, chunk by chunk"""
+    sink = HashingUploadFile(directory)
+    try:
+        while True:
+            chunk = stream.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                return sink
+            sink.write(chunk)
+    except Exception:
+        sink.close()
+        raise
+
+
+def store_upload(file_storage, directory=None):
+    """Store an uploaded image under its content hash
+
+    Identical uploads map to the same file, so storing one twice costs no
+    extra disk space and no second write: the spooled file is linked
+    into place only once it has been checked and its hash is not stored
+    yet, so nothing unchecked ever appears in the upload directory.
+
+    Args:
+        file_storage (FileStorage): The uploaded file from request.files
+        directory (str, optional): Upload directory; defaults to UPLOAD_FOLDER
+
+    Returns:
+        tuple: (filename, created), created being False for a duplicate
+
+    Raises:
+        UploadRejected: If the file is empty or not an accepted image type
+        RequestEntityTooLarge: If the file exceeds UPLOAD_MAX_BYTES
+    """
+    directory = directory or current_app.config["UPLOAD_FOLDER"]
+    upload = file_storage.stream
+    if not isinstance(upload, HashingUploadFile):
+        upload = _hashed_copy(upload, spool_directory(directory))
+
+    try:
+        if upload.size == 0:
+            raise UploadRejected("Uploaded file is empty")
+        extension = sniff_extension(upload.head)
+        if extension is None:
+            raise UploadRejected("Only PNG, JPEG, GIF and WebP images can be uploaded")
+
+        upload.flush()
+        filename = upload.sha256.hexdigest() + extension
+        path = os.path.join(directory, filename)
+        os.chmod(upload.name, 0o644)
+        try:
+            # Atomic: fails if another request stored the same content first
+            os.link(upload.name, path)
+            created = True
+        except FileExistsError:
+            created = False
+        except OSError:
+            # No hard links (or the spool is on another filesystem); copy the
+            # checked file next to its final name, then rename it into place
+            created = not os.path.exists(path)
+            if created:
+                fd, staging = tempfile.mkstemp(dir=directory, prefix=".incoming-")
+                try:
+                    with os.fdopen(fd, "wb") as target:
+                        upload.seek(0)
+                        shutil.copyfileobj(upload, target, UPLOAD_CHUNK_SIZE)
+                    os.chmod(staging, 0o644)
+                    os.replace(staging, path)
+                except Exception:
+                    if os.path.exists(staging):
+                        os.unlink(staging)
+                    raise
+
+        logger.debug("Stored upload %s (%s bytes, %s)", filename, upload.size, "new" if created else "duplicate")
+        return filename, created
+    finally:
+        upload.close()
+
+
+def init_upload_storage(app):
+    """Stream uploads to disk and reject request bodies that cannot fit UPLOAD_MAX_BYTES"""
+    app.request_class = UploadRequest
+    if app.config.get("MAX_CONTENT_LENGTH") is None:
+        app.config["MAX_CONTENT_LENGTH"] = UPLOAD_MAX_BYTES + MULTIPART_OVERHEAD